@@ -0,0 +1,109 @@
+"""
+Benchmark: ensemble members on logical CPU devices (`cpu_devices()`).
+
+Runs the same set of member forward passes with `parallel_execute()` on 1, 2, 4, ...
+logical CPU devices and prints the wall time, the speed-up over a single device and
+the mean device utilisation. The forward pass is a transformer encoder of the default
+TabPFN size (192 dims, 12 layers) over a context of `--context` rows plus `--test`
+query rows per feature group, so no model checkpoint is needed.
+
+    python benchmarks/cpu_devices.py --members 32 --context 2048 --test 50
+
+On a host with fewer cores than `CPU_THREADS_PER_DEVICE` * 2 only the single device
+is measured, there is nothing to split.
+"""
+import argparse
+import copy
+import importlib.util
+import os
+import sys
+import time
+
+import torch
+
+SRC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src')
+sys.path.append(SRC_DIR)
+try:
+    from tabpfn_lib import parallel_execute as pe
+except ImportError:
+    # The package __init__ needs the full TabPFN install, parallel_execute only torch
+    spec = importlib.util.spec_from_file_location(
+        'tabpfn_lib.parallel_execute', os.path.join(SRC_DIR, 'tabpfn_lib', 'parallel_execute.py'))
+    pe = importlib.util.module_from_spec(spec)
+    sys.modules[spec.name] = pe
+    spec.loader.exec_module(pe)
+
+
+def make_member(n_layers, emsize):
+    layer = torch.nn.TransformerEncoderLayer(emsize, nhead=6, dim_feedforward=2 * emsize,
+                                             batch_first=True)
+    return torch.nn.TransformerEncoder(layer, n_layers, enable_nested_tensor=False).eval()
+
+
+def forward_function(models, X, n_test):
+    def forward(*, device, is_parallel):
+        with torch.inference_mode():
+            return models[device](X)[:, -n_test:]
+    return forward
+
+
+def run(devices, model, inputs, n_test, n_threads):
+    # Each device gets its own module sharing the weights, as `_PerDeviceModelCache`
+    # does, and every run starts from the same thread count.
+    models = {device: copy.deepcopy(model, {id(p): p for p in model.parameters()})
+              for device in devices}
+    torch.set_num_threads(n_threads)
+    stats = pe.ParallelExecutionStats()
+    start = time.perf_counter()
+    outputs = list(pe.parallel_execute(
+        devices, (forward_function(models, X, n_test) for X in inputs), stats=stats))
+    return time.perf_counter() - start, stats, outputs
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--members', type=int, default=32)
+    parser.add_argument('--context', type=int, default=2048)
+    parser.add_argument('--test', type=int, default=50)
+    parser.add_argument('--feature-groups', type=int, default=11)  # 21 sensors, 2 per group
+    parser.add_argument('--layers', type=int, default=12)
+    parser.add_argument('--repeats', type=int, default=3)
+    parser.add_argument('--threads', type=int, default=os.cpu_count(),
+                        help='Intra-op threads split between the devices')
+    args = parser.parse_args()
+
+    n_threads = args.threads
+    print(f"[INFO] {os.cpu_count()} cores, {n_threads} intra-op threads, "
+          f"{args.members} members x {args.context + args.test} rows x {args.feature_groups} groups")
+
+    torch.manual_seed(0)
+    model = make_member(args.layers, 192)
+    inputs = [torch.randn(args.feature_groups, args.context + args.test, 192)
+              for _ in range(args.members)]
+
+    n_devices = [1]
+    while n_devices[-1] * 2 * pe.CPU_THREADS_PER_DEVICE <= n_threads:
+        n_devices.append(n_devices[-1] * 2)
+    if n_threads // pe.CPU_THREADS_PER_DEVICE not in n_devices and n_threads >= 2 * pe.CPU_THREADS_PER_DEVICE:
+        n_devices.append(n_threads // pe.CPU_THREADS_PER_DEVICE)
+
+    run(pe.cpu_devices(1), model, inputs[:1], args.test, n_threads)  # Warm-up
+    baseline = reference = None
+    print(f"\n{'devices':>8} {'threads/dev':>12} {'seconds':>9} {'speed-up':>9} {'utilisation':>12}")
+    for n in n_devices:
+        devices = pe.cpu_devices(n, n_threads=n_threads)
+        seconds, stats, outputs = min(
+            (run(devices, model, inputs, args.test, n_threads) for _ in range(args.repeats)),
+            key=lambda r: r[0])
+        baseline = baseline or seconds
+        # Concurrent members must give the results of the single device
+        reference = reference or outputs
+        assert all(torch.allclose(a, b, rtol=1e-4, atol=1e-5) for a, b in zip(outputs, reference)), \
+            f"{len(devices)} devices disagree with a single device"
+        utilisation = sum(stats.utilisation.values()) / max(len(stats.utilisation), 1)
+        print(f"{len(devices):>8} {n_threads // len(devices):>12} {seconds:>9.2f} "
+              f"{baseline / seconds:>8.2f}x {utilisation:>11.0%}")
+
+
+if __name__ == "__main__":
+    main()
@@ -11,6 +11,10 @@ import os
 import sys
 from datetime import datetime
 
+# 使用 src/localization 中共享的 (多进程) 数据加载器
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+from localization.ingest import list_sensor_files, read_sensor_files
+
 # =============================================================================
 # 配置
 # =============================================================================
@@ -39,21 +43,20 @@ class DualOutput:
 
 def load_all_data():
     """加载所有数据文件并合并"""
-    excel_files = sorted([f for f in os.listdir(DATA_DIR) if f.endswith('.xlsx')])
-    all_data = []
-    file_info = []
-    
-    for filename in excel_files:
-        filepath = os.path.join(DATA_DIR, filename)
-        df = pd.read_excel(filepath)
-        all_data.append(df)
-        file_info.append({
-            'filename': filename,
+    frames = read_sensor_files(list_sensor_files(DATA_DIR))
+    if not frames:
+        print(f"[ERROR] {DATA_DIR} 中没有可读取的 .xlsx 数据文件")
+        sys.exit(1)
+    file_info = [
+        {
+            'filename': os.path.basename(filepath),
             'records': len(df),
             'columns': len(df.columns)
-        })
+        }
+        for filepath, df in frames
+    ]
     
-    combined = pd.concat(all_data, ignore_index=True)
+    combined = pd.concat([df for _, df in frames], ignore_index=True)
     combined['timestamp'] = pd.to_datetime(combined['timestamp'])
     
     return combined, file_info
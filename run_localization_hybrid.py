@@ -3,6 +3,8 @@ Retrieval-Augmented In-Context Learning for Continuous Indoor Localization.
 Main execution script for the Hybrid (Temporal + NCA) Strategy.
 """
 
+import asyncio
+import contextlib
 import pandas as pd
 import numpy as np
 import os
@@ -15,27 +17,41 @@ import warnings
 # Sklearn imports
 from sklearn.preprocessing import LabelEncoder, MinMaxScaler
 from sklearn.metrics import accuracy_score, f1_score, classification_report, precision_score, recall_score, balanced_accuracy_score, matthews_corrcoef
-from sklearn.neighbors import NearestNeighbors, NeighborhoodComponentsAnalysis
+from sklearn.neighbors import NeighborhoodComponentsAnalysis
 
 # Force TabPFN v2 (Ungated)
 os.environ["TABPFN_MODEL_VERSION"] = "v2"
 warnings.filterwarnings('ignore')
 
+# The online modes keep stdout for their results, so diagnostics go to stderr there
+LOG = sys.stderr if {'--serve', '--stream'} & set(sys.argv[1:]) else sys.stdout
+
 # Add src to python path to access local library
 sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'src'))
 
+from localization.ingest import SensorFileCache, list_sensor_files, read_sensor_files
+from localization.bank import TrainBank
+from localization.context_cache import ContextCache
+from localization.hybrid import HybridPredictor
+from localization.retrieval import make_retrieval_index, measure_recall
+from localization.server import LocalizationService, MicroBatcher, serve
+from localization.stream import SlidingWindowStream
+from localization.windows import gather_rows, sliding_window_matrix
+
 try:
     import torch
     # Prioritize local library in src/tabpfn_lib
     from tabpfn_lib import TabPFNClassifier
-    print("[INFO] Local TabPFN Library Loaded from src/tabpfn_lib")
+    from tabpfn_lib.parallel_execute import cpu_devices
+    print("[INFO] Local TabPFN Library Loaded from src/tabpfn_lib", file=LOG)
 except ImportError:
+    cpu_devices = None  # Logical CPU devices need the local library
     try:
         # Fallback to official package
         from tabpfn import TabPFNClassifier
-        print("[INFO] Installed TabPFN Library Loaded")
+        print("[INFO] Installed TabPFN Library Loaded", file=LOG)
     except ImportError:
-        print("[ERROR] TabPFN not found. Please check src/tabpfn_lib or run: pip install -r requirements.txt")
+        print("[ERROR] TabPFN not found. Please check src/tabpfn_lib or run: pip install -r requirements.txt", file=LOG)
         sys.exit(1)
 
 # ==========================================
@@ -46,95 +62,203 @@ WINDOW_SIZE = 10
 RANDOM_SEED = 42
 TARGET_COL = 'Location'
 OUTPUT_FILE = 'results.txt'
+CACHE_DIR = '.cache/sensor_data'  # Columnar cache of parsed workbooks (None = disabled)
+READ_WORKERS = None        # Processes for parsing workbooks (None = auto, 1 = serial)
+BANK_DIR = '.cache/train_bank'  # Persisted train bank for `--update-bank`
 
 # Hybrid Strategy Hyperparameters
 RETRIEVAL_K = 2048         # Total Context Size (Training Budget)
 TEMPORAL_RATIO = 0.5       # 50% Anchor (Stability) + 50% Spark (Innovation)
 NCA_COMPONENTS = 16        # Dimension of learned metric space
 BATCH_SIZE = 50            # Batch size for inference loop
+RETRIEVAL_BACKEND = 'exact'  # Semantic index: 'exact', 'ivf' or 'hnsw' (needs hnswlib)
+RETRIEVAL_PARAMS = {}        # Recall/latency knobs, e.g. {'n_probe': 16} or {'ef_search': 2048}
+RETRIEVAL_MODE = 'centroid'  # 'centroid' (batch mean), 'per_query' (merged lists) or 'cluster'
+N_QUERY_CLUSTERS = 2         # Contexts per batch for RETRIEVAL_MODE='cluster'
+CONTEXT_CACHE_SIZE = 4       # Fitted classifiers kept for reuse across batches (LRU)
+CONTEXT_PATCH_JACCARD = 0.0  # Reuse fitted preprocessors up to this context distance (0 = exact only)
+FUSION_MIN_OVERLAP = 1.0     # Fuse batches whose contexts overlap this much (Jaccard; 1.0 = identical only)
+MAX_FUSED_CONTEXT = RETRIEVAL_K  # Row limit of a fused context, e.g. 3072 with FUSION_MIN_OVERLAP=0.8
+MAX_FUSED_QUERIES = 1000     # Query limit of a fused predict
+CPU_DEVICES = None           # Without a GPU: core groups running members side by side (None = auto, 1 = off)
+
+# Server Mode (`--serve`)
+SERVE_ADDRESS = '127.0.0.1:8765'  # 'host:port' for HTTP, 'unix:/path/to.sock' for JSON lines
+SERVE_MAX_BATCH = BATCH_SIZE      # Windows coalesced into one retrieval + predict
+SERVE_MAX_DELAY_MS = 20           # Max wait of the first request of a batch for others
 
 # ==========================================
 # 1. Data Pipeline
 # ==========================================
-def load_and_preprocess():
-    print(f"\n[INFO] Loading data from {DATA_DIR}...")
-    if not os.path.exists(DATA_DIR):
-        print(f"[ERROR] Data folder '{DATA_DIR}' missing. Please create it and add .xlsx files.")
-        return None, None, None
-        
-    # Load all Excel files
-    files = sorted([f for f in os.listdir(DATA_DIR) if f.endswith('.xlsx')])
-    dfs = []
-    if not files:
-        print("[ERROR] No .xlsx files found in data folder.")
-        return None, None, None
+# Label Cleaning (Consistency is Key)
+def clean_labels(val):
+    s = str(val).lower().strip()
+    if 'transition' in s: return 'Transition'
+    if 'bath' in s: return 'Bathroom'
+    if 'bed' in s: return 'Bedroom'
+    if 'kitchen' in s: return 'Kitchen'
+    if 'sofa' in s or 'dining' in s: return 'Living/Dining'
+    if 'office' in s: return 'Office'
+    if 'door' in s: return 'Door'
+    return 'Other'
 
-    for f in tqdm(files, desc="Reading Files"):
-        try:
-            dfs.append(pd.read_excel(os.path.join(DATA_DIR, f), engine='openpyxl'))
-        except: pass
+def read_clean_table(files, feature_cols=None):
+    """Read `files` into unscaled feature rows and cleaned string labels.
+
+    If `feature_cols` is given, the rows are aligned to those columns (e.g. the
+    columns of an existing train bank); otherwise all `value` columns are used.
+    Unreadable files are skipped, so the paths that were actually read are
+    returned as well.
+    """
+    cache = None
+    if CACHE_DIR:
+        cache = SensorFileCache(CACHE_DIR, TARGET_COL)
+
+    frames = read_sensor_files(files, target_col=TARGET_COL, cache=cache,
+                               n_workers=READ_WORKERS, desc="Reading Files")
+    read_files = [path for path, _ in frames]
+    dfs = [df for _, df in frames]
     
-    if not dfs: return None, None, None
+    if not dfs: return None, None, None, []
     df_merged = pd.concat(dfs, ignore_index=True)
     
     # Identify Columns
     target_candidates = [c for c in df_merged.columns if str(c).lower() == TARGET_COL.lower()]
     if not target_candidates: 
         print(f"[ERROR] Target column '{TARGET_COL}' not found.")
-        return None, None, None
+        return None, None, None, []
     target_col = target_candidates[0]
-    feature_cols = [c for c in df_merged.columns if c != target_col and 'value' in str(c)]
+    if feature_cols is None:
+        feature_cols = [c for c in df_merged.columns if c != target_col and 'value' in str(c)]
     
-    df_clean = df_merged[feature_cols + [target_col]].dropna()
+    df_clean = df_merged.reindex(columns=feature_cols + [target_col]).dropna()
+    labels = df_clean[target_col].apply(clean_labels).astype(str).values
     
-    # Label Cleaning (Consistency is Key)
-    def clean_labels(val):
-        s = str(val).lower().strip()
-        if 'transition' in s: return 'Transition'
-        if 'bath' in s: return 'Bathroom'
-        if 'bed' in s: return 'Bedroom'
-        if 'kitchen' in s: return 'Kitchen'
-        if 'sofa' in s or 'dining' in s: return 'Living/Dining'
-        if 'office' in s: return 'Office'
-        if 'door' in s: return 'Door'
-        return 'Other'
-
-    df_clean[target_col] = df_clean[target_col].apply(clean_labels)
+    return df_clean[feature_cols].values, labels, feature_cols, read_files
+
+def load_and_preprocess():
+    print(f"\n[INFO] Loading data from {DATA_DIR}...")
+    if not os.path.exists(DATA_DIR):
+        print(f"[ERROR] Data folder '{DATA_DIR}' missing. Please create it and add .xlsx files.")
+        return None, None, None, None
+        
+    # Load all Excel files (served from the columnar cache when up to date)
+    files = list_sensor_files(DATA_DIR)
+    if not files:
+        print("[ERROR] No .xlsx files found in data folder.")
+        return None, None, None, None
+
+    if CACHE_DIR:
+        SensorFileCache(CACHE_DIR, TARGET_COL).prune(files)
+
+    X_values, labels, _, _ = read_clean_table(files)
+    if X_values is None: return None, None, None, None
     
     # Encode & Scale
     le = LabelEncoder()
-    y_raw = le.fit_transform(df_clean[target_col].astype(str))
+    y_raw = le.fit_transform(labels)
     
     scaler = MinMaxScaler()
-    X_raw = scaler.fit_transform(df_clean[feature_cols].values)
+    X_raw = scaler.fit_transform(X_values)
     
-    return X_raw, y_raw, le
+    return X_raw, y_raw, le, scaler
+
+def update_train_bank():
+    """Append hour-files that are not yet in the persisted train bank (BANK_DIR).
+
+    Only the windows completed by the new rows are built; if the scaler range grew,
+    the earlier rows/windows that became stale are reported instead of rebuilt.
+    """
+    files = list_sensor_files(DATA_DIR) if os.path.exists(DATA_DIR) else []
+    if os.path.exists(os.path.join(BANK_DIR, 'meta.json')):
+        bank = TrainBank.load(BANK_DIR)
+    else:
+        bank = None
+
+    new_files = [f for f in files if bank is None or f not in bank.ingested_files]
+    if not new_files:
+        print("[INFO] Train bank is up to date.")
+        return bank, None
+
+    print(f"\n[INFO] Appending {len(new_files)} new file(s) to train bank '{BANK_DIR}'...")
+    X_values, labels, feature_cols, read_files = read_clean_table(
+        new_files, feature_cols=None if bank is None else bank.feature_cols)
+    if X_values is None: return bank, None
+    if bank is None:
+        bank = TrainBank(BANK_DIR, feature_cols, WINDOW_SIZE)
+
+    update = bank.append(X_values, labels)
+    # Files that could not be read are retried on the next update
+    bank.ingested_files.extend(read_files)
+    bank.save()
+
+    print(f"       New Windows:  {len(update.X_windows)} (from window {update.first_window})")
+    if len(update.changed_features):
+        changed = [bank.feature_cols[i] for i in update.changed_features]
+        print(f"       Scaler range changed for: {changed}")
+        print(f"       -> {len(update.rescale_rows)} earlier rows / "
+              f"{len(update.rescale_windows)} windows need rescaling")
+    if update.label_remap is not None:
+        print(f"       New classes, label codes remapped: {update.label_remap.tolist()}")
+    return bank, update
 
 def create_sliding_windows(X, y):
-    Xs, ys = [], []
-    for i in range(len(X) - WINDOW_SIZE):
-        Xs.append(X[i : i+WINDOW_SIZE])
-        ys.append(y[i+WINDOW_SIZE]) # Predict the NEXT step
-    return np.array(Xs), np.array(ys)
+    # Zero-copy (N, T*F) view: row i is X[i : i+WINDOW_SIZE] flattened
+    X_flat = sliding_window_matrix(X, WINDOW_SIZE)
+    y_seq = np.asarray(y)[WINDOW_SIZE:] # Predict the NEXT step
+    return X_flat, y_seq
 
 # ==========================================
 # 2. Hybrid Temporal-Contrastive Logic
 # ==========================================
+def build_predictor(X_train, y_train):
+    """Fit the NCA metric and the semantic index, and wrap them with TabPFN."""
+    print(f"\n[INFO] [Setup] Learning Manifold Metric (NCA/Metric Learning)...")
+    st = time.time()
+    
+    # Subsample for NCA training if dataset is huge (optional, here 6k is fine)
+    nca = NeighborhoodComponentsAnalysis(n_components=NCA_COMPONENTS, random_state=RANDOM_SEED)
+    nca.fit(X_train, y_train)
+    
+    # Project Training Data to Learned Space
+    X_train_nca = nca.transform(X_train)
+    
+    # Build Semantic Index
+    knn_semantic = make_retrieval_index(RETRIEVAL_BACKEND, int(RETRIEVAL_K * (1-TEMPORAL_RATIO)), **RETRIEVAL_PARAMS)
+    knn_semantic.fit(X_train_nca)
+    print(f"       -> NCA Training Done ({time.time()-st:.1f}s)")
+
+    device = 'cuda' if torch.cuda.is_available() else 'cpu'
+    if device == 'cpu' and cpu_devices is not None:
+        if CPU_DEVICES is not None and CPU_DEVICES > min(torch.get_num_threads(), os.cpu_count() or 1):
+            print(f"[WARN] CPU_DEVICES={CPU_DEVICES} exceeds the {torch.get_num_threads()} threads / "
+                  f"{os.cpu_count()} cores available; the devices would share cores.", file=sys.stderr)
+        device = cpu_devices(CPU_DEVICES)
+        print(f"       -> CPU devices: {len(device)} x {torch.get_num_threads() // len(device)} threads")
+    classifier = TabPFNClassifier(device=device, n_estimators=32)
+    context_cache = ContextCache(classifier, max_entries=CONTEXT_CACHE_SIZE,
+                                 max_jaccard_distance=CONTEXT_PATCH_JACCARD)
+    
+    # Anchor + Spark contexts, fused across batches (see localization.hybrid)
+    return HybridPredictor(nca, knn_semantic, X_train, y_train, context_cache,
+                           retrieval_k=RETRIEVAL_K, temporal_ratio=TEMPORAL_RATIO,
+                           retrieval_mode=RETRIEVAL_MODE, n_query_clusters=N_QUERY_CLUSTERS,
+                           random_state=RANDOM_SEED, fusion_min_overlap=FUSION_MIN_OVERLAP,
+                           max_fused_context=MAX_FUSED_CONTEXT, max_fused_queries=MAX_FUSED_QUERIES)
+
 def main():
     print(f"[INFO] Running Final Hybrid Script (ICSR 2026 -> IEEE IoT-J)")
     print(f"       Strategy: 50% Temporal Anchor + 50% NCA Contrastive Retrieval")
     
     # A. Prepare Data
-    X_raw, y_raw, le = load_and_preprocess()
+    X_raw, y_raw, le, _ = load_and_preprocess()
     if X_raw is None: return
     
     print("[INFO] Creating Windows...")
-    X_3d, y_seq = create_sliding_windows(X_raw, y_raw)
-    
-    # Flatten for TabPFN (N, T*F)
-    X_flat = X_3d.reshape(len(X_3d), -1)
+    # Flattened for TabPFN (N, T*F), without copying the history T times
+    X_flat, y_seq = create_sliding_windows(X_raw, y_raw)
     
-    # Split 80/20
+    # Split 80/20 (views; rows are only gathered when they reach TabPFN)
     split_idx = int(len(X_flat) * 0.8)
     X_train, X_test = X_flat[:split_idx], X_flat[split_idx:]
     y_train, y_test = y_seq[:split_idx], y_seq[split_idx:]
@@ -142,79 +266,50 @@ def main():
     print(f"       Train Bank: {len(X_train)}")
     print(f"       Test Query: {len(X_test)}")
     
-    # B. Phase 1: Train Metric Learner (NCA)
-    print(f"\n[INFO] [Setup] Learning Manifold Metric (NCA/Metric Learning)...")
-    st = time.time()
-    
-    # Subsample for NCA training if dataset is huge (optional, here 6k is fine)
-    nca = NeighborhoodComponentsAnalysis(n_components=NCA_COMPONENTS, random_state=RANDOM_SEED)
-    nca.fit(X_train, y_train)
-    
-    # Project Training Data to Learned Space
-    X_train_nca = nca.transform(X_train)
-    
-    # Build Semantic Index
-    knn_semantic = NearestNeighbors(n_neighbors=int(RETRIEVAL_K * (1-TEMPORAL_RATIO)), metric='euclidean', n_jobs=-1)
-    knn_semantic.fit(X_train_nca)
+    # B. Phase 1: Train Metric Learner (NCA) + Semantic Index
+    predictor = build_predictor(X_train, y_train)
+    context_cache = predictor.context_cache
     
-    print(f"       -> NCA Training Done ({time.time()-st:.1f}s)")
+    if RETRIEVAL_BACKEND != 'exact':
+        # Check the approximate index against exact search on a sample of queries
+        X_probe = predictor.nca.transform(X_test[::max(1, len(X_test) // 100)])
+        rep = measure_recall(predictor.index, predictor.nca.transform(X_train), X_probe)
+        print(f"       -> {RETRIEVAL_BACKEND} recall@k vs exact: {rep.recall:.3f} "
+              f"({rep.seconds_per_query*1e3:.2f} ms/query, exact {rep.exact_seconds_per_query*1e3:.2f} ms/query)")
 
     # C. Phase 2: Hybrid Inference Loop
-    device = 'cuda' if torch.cuda.is_available() else 'cpu'
-    classifier = TabPFNClassifier(device=device, n_estimators=32)
-    
     print(f"\n[INFO] Starting Inference Loop (Batch Size={BATCH_SIZE})...")
-    y_preds = []
-    
-    # Compute Temporal Context Indices ONCE (The "Anchor")
-    n_temporal = int(RETRIEVAL_K * TEMPORAL_RATIO)
-    temporal_indices = np.arange(len(X_train) - n_temporal, len(X_train))
+    y_preds = np.empty(len(X_test), dtype=y_train.dtype)
     
     num_batches = int(np.ceil(len(X_test) / BATCH_SIZE))
     
     t_start_inf = time.time()
-    for b in tqdm(range(num_batches), desc="Hybrid Predicting"):
+    contexts = []
+    for b in tqdm(range(num_batches), desc="Hybrid Retrieving"):
         start = b * BATCH_SIZE
         end = min((b + 1) * BATCH_SIZE, len(X_test))
         
-        X_batch_flat = X_test[start:end]
-        
-        # 1. Semantic Retrieval (The "Spark")
-        # Project Batch to NCA Space
-        X_batch_nca = nca.transform(X_batch_flat)
-        
-        # We need a representative query for the batch context.
-        # Strategy: Use the Mean of the batch in projected space.
-        batch_center = np.mean(X_batch_nca, axis=0).reshape(1, -1)
-        
-        # Retrieve KNN
-        _, semantic_indices = knn_semantic.kneighbors(batch_center)
-        semantic_indices = semantic_indices[0] # Flatten
-        
-        # 2. Merge Contexts
-        # Union of indices (Time Anchor + Semantic Spark) via np.unique
-        combined_indices = np.unique(np.concatenate([temporal_indices, semantic_indices]))
-        
-        # If union exceeds budget, trim
-        if len(combined_indices) > RETRIEVAL_K:
-            # Sort to maintain some order, then take last K (bias towards recent)
-            combined_indices.sort() 
-            combined_indices = combined_indices[-RETRIEVAL_K:]
-            
-        X_ctx = X_train[combined_indices]
-        y_ctx = y_train[combined_indices]
-        
-        # 3. Predict
-        classifier.fit(X_ctx, y_ctx)
-        preds = classifier.predict(X_batch_flat)
-        y_preds.extend(preds)
+        # 1. Semantic Retrieval (The "Spark") in NCA space, merged with the Temporal
+        # Anchor and trimmed to RETRIEVAL_K (bias towards recent)
+        for query_rows, combined_indices in predictor.retrieve(gather_rows(X_test, slice(start, end))):
+            contexts.append((start + query_rows, combined_indices))
+    
+    # 2. Fuse batches with overlapping contexts into a single fit + predict
+    plan = predictor.plan(contexts)
+    print(f"       Fusion: {plan.n_contexts} contexts -> {plan.n_forwards} forwards "
+          f"({plan.n_forwards_saved} saved)")
+    
+    for g, group in enumerate(tqdm(plan.groups, desc="Hybrid Predicting")):
+        # 3. Predict (reusing the classifier of an identical/similar recent context)
+        y_preds[group.query_rows] = predictor.predict_group(X_test, group)
         
         # Cleanup
-        if b % 10 == 0:
+        if g % 10 == 0:
             gc.collect()
-            if device=='cuda': torch.cuda.empty_cache()
+            if torch.cuda.is_available(): torch.cuda.empty_cache()
 
     dur_inf = time.time() - t_start_inf
+    print(f"       Context cache: {context_cache.stats}")
     
     # D. Results
     acc = accuracy_score(y_test, y_preds)
@@ -262,5 +357,87 @@ def main():
         
     print(f"\\n[INFO] Saved to {OUTPUT_FILE}")
 
+# ==========================================
+# 3. Online Server Mode
+# ==========================================
+def serve_online():
+    """Serve one prediction per incoming sensor window (see localization.server).
+
+    All windows are used as the train bank. A request carries the raw sensor rows of
+    one window, `{"rows": [[...], ...]}` with WINDOW_SIZE rows of the feature columns;
+    the answer is `{"label": ..., "code": ..., "batch_size": ..., "latency_ms": ...}`.
+    """
+    # Nothing is written to stdout here, all output is diagnostics
+    with contextlib.redirect_stdout(LOG):
+        X_raw, y_raw, le, scaler = load_and_preprocess()
+        if X_raw is None: return
+        X_flat, y_seq = create_sliding_windows(X_raw, y_raw)
+        print(f"       Train Bank: {len(X_flat)}")
+        predictor = build_predictor(X_flat, y_seq)
+
+        def decode(request):
+            rows = np.asarray(request["rows"], dtype=float)
+            if rows.shape != (WINDOW_SIZE, X_raw.shape[1]):
+                raise ValueError(f"Expected rows of shape ({WINDOW_SIZE}, {X_raw.shape[1]}), got {rows.shape}")
+            # Same scaling and (T*F) flattening as the train windows
+            return scaler.transform(rows).reshape(-1)
+
+        def encode(code):
+            return {"label": str(le.classes_[code]), "code": int(code)}
+
+        batcher = MicroBatcher(lambda X: predictor.predict(X, batch_size=BATCH_SIZE),
+                               max_batch_size=SERVE_MAX_BATCH, max_delay=SERVE_MAX_DELAY_MS / 1e3)
+        print(f"\n[INFO] Serving on {SERVE_ADDRESS} (micro-batches of <= {SERVE_MAX_BATCH}, "
+              f"<= {SERVE_MAX_DELAY_MS} ms wait). Ctrl+C to stop.")
+        try:
+            asyncio.run(serve(LocalizationService(batcher, decode, encode), SERVE_ADDRESS))
+        except KeyboardInterrupt:
+            print(f"\n[INFO] Stopped. Batches: {batcher.stats}")
+
+# ==========================================
+# 4. Online Streaming Mode
+# ==========================================
+def stream_online():
+    """Predict the next location after every sensor reading read from stdin.
+
+    Each line holds one reading, the comma-separated feature columns; an empty line
+    marks a gap in the stream and restarts the window. Once WINDOW_SIZE readings are
+    in, every reading prints `label<TAB>code<TAB>latency_ms`. The window and its NCA
+    projection are updated per reading (see localization.stream), so the cost of an
+    event does not depend on how long the stream has been running.
+    """
+    # Setup diagnostics must not mix with the predictions on stdout
+    with contextlib.redirect_stdout(LOG):
+        X_raw, y_raw, le, scaler = load_and_preprocess()
+        if X_raw is None: return
+        X_flat, y_seq = create_sliding_windows(X_raw, y_raw)
+        print(f"       Train Bank: {len(X_flat)}")
+        predictor = build_predictor(X_flat, y_seq)
+
+        stream = SlidingWindowStream(WINDOW_SIZE, X_raw.shape[1], predictor.nca.components_)
+        print(f"\n[INFO] Streaming: one reading per line on stdin ({X_raw.shape[1]} values).")
+    for line in sys.stdin:
+        if not line.strip():
+            stream.reset()
+            continue
+        st = time.perf_counter()
+        reading = np.array(line.split(','), dtype=float)
+        if reading.shape != (X_raw.shape[1],):
+            print(f"[WARN] Skipping reading with {reading.size} values", file=sys.stderr)
+            continue
+        # MinMaxScaler.transform, without its per-call validation
+        out = stream.push(reading * scaler.scale_ + scaler.min_)
+        if out is None: continue
+        window, window_nca = out
+        code = predictor.predict(window[None], X_nca=window_nca[None])[0]
+        print(f"{le.classes_[code]}\t{code}\t{(time.perf_counter() - st) * 1e3:.2f}", flush=True)
+
 if __name__ == "__main__":
-    main()
+    if '--update-bank' in sys.argv[1:]:
+        update_train_bank()
+    elif '--serve' in sys.argv[1:]:
+        serve_online()
+    elif '--stream' in sys.argv[1:]:
+        stream_online()
+    else:
+        main()
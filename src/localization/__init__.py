@@ -0,0 +1 @@
+"""Data and retrieval utilities for the hybrid localization pipeline."""
@@ -0,0 +1,246 @@
+"""Persisted, append-only train bank for incremental ingest of new hour-files.
+
+Re-running the offline pipeline refits the scaler and label encoder over the full
+history and rebuilds every window whenever a new hour-file arrives. `TrainBank` keeps
+the unscaled rows on disk instead, extends the min/max state of the scaler with each
+appended chunk, and only produces the windows that the new rows complete.
+"""
+
+from __future__ import annotations
+
+import dataclasses
+import json
+import os
+from pathlib import Path
+
+import numpy as np
+from sklearn.preprocessing import MinMaxScaler
+
+from localization.windows import sliding_window_matrix
+
+
+@dataclasses.dataclass
+class BankUpdate:
+    """Result of appending rows to a `TrainBank`."""
+
+    X_windows: np.ndarray
+    """The flattened windows completed by the appended rows, scaled with the updated
+    scaler, shape ``(n_new_windows, window_size * n_features)``."""
+
+    y_windows: np.ndarray
+    """The encoded "next step" labels of `X_windows`."""
+
+    first_window: int
+    """The index of the first new window within all windows of the bank."""
+
+    changed_features: np.ndarray
+    """The feature columns whose min/max range was extended by the appended rows."""
+
+    rescale_rows: np.ndarray
+    """The earlier rows whose scaled values changed because of `changed_features`.
+    Windows built before the update are stale for these rows."""
+
+    rescale_windows: np.ndarray
+    """The earlier windows that contain at least one row of `rescale_rows`."""
+
+    label_remap: np.ndarray | None
+    """If new classes appeared, maps each previous label code to its new code
+    (``new_code = label_remap[old_code]``), otherwise None."""
+
+
+class TrainBank:
+    """Append-only store of unscaled sensor rows and their cleaned labels.
+
+    The bank lives in a directory holding one ``.npy`` chunk per appended batch of
+    rows and a ``meta.json`` with the feature columns, the scaler min/max, the known
+    classes and the hour-files that were already ingested. Appending writes a new
+    chunk rather than rewriting the existing rows.
+
+    Labels are encoded like `sklearn.preprocessing.LabelEncoder`, i.e. as indices into
+    the sorted classes, so codes agree with a full offline refit.
+    """
+
+    def __init__(self, path: str | Path, feature_cols: list[str], window_size: int):
+        super().__init__()
+        self.path = Path(path)
+        self.feature_cols = list(feature_cols)
+        self.window_size = window_size
+        self.classes_ = np.array([], dtype=str)
+        self.ingested_files: list[str] = []
+        self.scaler = MinMaxScaler()
+        self._chunks: list[tuple[np.ndarray, np.ndarray]] = []
+
+    @classmethod
+    def load(cls, path: str | Path) -> TrainBank:
+        """Load a bank written by `save`."""
+        path = Path(path)
+        with open(path / "meta.json", encoding="utf-8") as f:
+            meta = json.load(f)
+
+        bank = cls(path, meta["feature_cols"], meta["window_size"])
+        bank.classes_ = np.array(meta["classes"], dtype=str)
+        bank.ingested_files = meta["ingested_files"]
+        if meta["data_min"] is not None:
+            # Restore the fitted scaler state from its running min/max.
+            bank.scaler.partial_fit(
+                np.array([meta["data_min"], meta["data_max"]], dtype=np.float64)
+            )
+            bank.scaler.n_samples_seen_ = meta["n_samples_seen"]
+        for i in range(meta["n_chunks"]):
+            X = np.load(path / f"rows_{i:05d}.npy", mmap_mode="r")
+            labels = np.load(path / f"labels_{i:05d}.npy")
+            bank._chunks.append((X, labels))
+        return bank
+
+    def save(self) -> None:
+        """Write new chunks and the metadata to the bank directory."""
+        self.path.mkdir(parents=True, exist_ok=True)
+        for i, (X, labels) in enumerate(self._chunks):
+            rows_file = self.path / f"rows_{i:05d}.npy"
+            if not rows_file.exists():
+                np.save(self.path / f"labels_{i:05d}.npy", labels)
+                np.save(rows_file, X)
+
+        fitted = hasattr(self.scaler, "data_min_")
+        meta = {
+            "feature_cols": self.feature_cols,
+            "window_size": self.window_size,
+            "classes": self.classes_.tolist(),
+            "ingested_files": self.ingested_files,
+            "data_min": self.scaler.data_min_.tolist() if fitted else None,
+            "data_max": self.scaler.data_max_.tolist() if fitted else None,
+            "n_samples_seen": int(self.scaler.n_samples_seen_) if fitted else 0,
+            "n_chunks": len(self._chunks),
+        }
+        tmp = self.path / "meta.json.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(meta, f)
+        os.replace(tmp, self.path / "meta.json")
+
+    @property
+    def n_rows(self) -> int:
+        """The number of rows in the bank."""
+        return sum(len(X) for X, _ in self._chunks)
+
+    def raw_rows(self) -> np.ndarray:
+        """Return all unscaled rows, shape ``(n_rows, n_features)``."""
+        if not self._chunks:
+            return np.empty((0, len(self.feature_cols)))
+        return np.concatenate([X for X, _ in self._chunks])
+
+    def labels(self) -> np.ndarray:
+        """Return the encoded labels of all rows."""
+        if not self._chunks:
+            return np.empty(0, dtype=np.intp)
+        return np.searchsorted(
+            self.classes_, np.concatenate([labels for _, labels in self._chunks])
+        )
+
+    def scaled_rows(self) -> np.ndarray:
+        """Return all rows scaled with the current scaler state."""
+        return self.scaler.transform(self.raw_rows())
+
+    def append(self, X: np.ndarray, labels: np.ndarray) -> BankUpdate:
+        """Append unscaled rows and their cleaned (string) labels.
+
+        The scaler's min/max state is extended with the new rows. The returned
+        `BankUpdate` holds only the windows completed by the new rows; if the scaler
+        range changed, it also lists the earlier rows and windows that are stale,
+        so callers can rescale just those instead of rebuilding everything.
+
+        Args:
+            X: The new rows, with columns in the order of `feature_cols`.
+            labels: The cleaned string label of each new row.
+        """
+        X = np.asarray(X, dtype=np.float64)
+        labels = np.asarray(labels, dtype=str)
+        if X.ndim != 2 or X.shape[1] != len(self.feature_cols):
+            raise ValueError(
+                f"Expected rows with {len(self.feature_cols)} features, got {X.shape}."
+            )
+        if len(X) != len(labels):
+            raise ValueError("X and labels must have the same length.")
+
+        n_old = self.n_rows
+        fitted = hasattr(self.scaler, "data_min_")
+        old_scale = self.scaler.scale_.copy() if fitted else None
+        old_min = self.scaler.min_.copy() if fitted else None
+        if len(X):
+            self.scaler.partial_fit(X)
+
+        changed_features = np.array([], dtype=np.intp)
+        rescale_rows = np.array([], dtype=np.intp)
+        if fitted and n_old:
+            changed = ~(
+                np.isclose(old_scale, self.scaler.scale_)
+                & np.isclose(old_min, self.scaler.min_)
+            )
+            changed_features = np.flatnonzero(changed)
+            if len(changed_features):
+                old_X = self.raw_rows()[:, changed_features]
+                before = old_X * old_scale[changed_features] + old_min[changed_features]
+                after = (
+                    old_X * self.scaler.scale_[changed_features]
+                    + self.scaler.min_[changed_features]
+                )
+                rescale_rows = np.flatnonzero(~np.isclose(before, after).all(axis=1))
+
+        label_remap = None
+        new_classes = np.setdiff1d(labels, self.classes_)
+        if len(new_classes):
+            merged = np.union1d(self.classes_, new_classes)
+            if len(self.classes_):
+                label_remap = np.searchsorted(merged, self.classes_)
+            self.classes_ = merged
+
+        self._chunks.append((X, labels))
+
+        # Only the windows whose "next step" label is one of the new rows are new.
+        # They reach back `window_size` rows into the existing history.
+        T = self.window_size
+        first_window = max(n_old - T, 0)
+        tail_X, tail_labels = self._tail(first_window)
+        X_windows = np.ascontiguousarray(
+            sliding_window_matrix(self.scaler.transform(tail_X), T)
+        )
+        y_windows = np.searchsorted(self.classes_, tail_labels[T:])
+
+        return BankUpdate(
+            X_windows=X_windows,
+            y_windows=y_windows,
+            first_window=first_window,
+            changed_features=changed_features,
+            rescale_rows=rescale_rows,
+            rescale_windows=_windows_touching_rows(rescale_rows, n_old, T),
+            label_remap=label_remap,
+        )
+
+    def _tail(self, start: int) -> tuple[np.ndarray, np.ndarray]:
+        # Gather rows [start, n_rows) from the chunks without touching earlier ones.
+        X_parts, label_parts = [], []
+        offset = self.n_rows
+        for X, labels in reversed(self._chunks):
+            if offset <= start:
+                break
+            offset -= len(X)
+            skip = max(start - offset, 0)
+            X_parts.append(X[skip:])
+            label_parts.append(labels[skip:])
+        if not X_parts:
+            return np.empty((0, len(self.feature_cols))), np.array([], dtype=str)
+        return np.concatenate(X_parts[::-1]), np.concatenate(label_parts[::-1])
+
+
+def _windows_touching_rows(
+    rows: np.ndarray, n_rows: int, window_size: int
+) -> np.ndarray:
+    # Window i covers rows [i, i + window_size), so it is stale iff the prefix count
+    # of stale rows increases over that range.
+    n_windows = max(n_rows - window_size, 0)
+    if not len(rows) or not n_windows:
+        return np.array([], dtype=np.intp)
+    stale = np.zeros(n_rows + 1, dtype=np.intp)
+    stale[rows + 1] = 1
+    counts = np.cumsum(stale)
+    hits = counts[window_size : window_size + n_windows] - counts[:n_windows]
+    return np.flatnonzero(hits > 0)
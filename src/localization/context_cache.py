@@ -0,0 +1,154 @@
+"""Reuse of fitted classifiers across batches whose retrieved contexts overlap.
+
+Consecutive test batches of the hybrid loop often retrieve (nearly) the same context
+rows: the temporal anchor is identical for every batch and the semantic rows of
+neighbouring windows overlap heavily. `ContextCache` keeps the classifiers fitted on
+the most recent contexts, keyed by the set of train-bank indices they were fitted on.
+"""
+
+from __future__ import annotations
+
+import copy
+import hashlib
+from collections import OrderedDict
+from typing import Any, Literal
+
+import numpy as np
+from sklearn.base import clone
+
+
+def context_fingerprint(indices: np.ndarray) -> str:
+    """Return a fingerprint of a set of train-bank indices (order-insensitive)."""
+    indices = np.unique(np.asarray(indices, dtype=np.int64))
+    return hashlib.sha1(indices.tobytes()).hexdigest()
+
+
+def jaccard_distance(a: np.ndarray, b: np.ndarray) -> float:
+    """Jaccard distance of two sorted arrays of unique indices."""
+    n_common = len(np.intersect1d(a, b, assume_unique=True))
+    n_union = len(a) + len(b) - n_common
+    return 1.0 - n_common / n_union if n_union else 0.0
+
+
+class ContextCache:
+    """LRU cache of classifiers fitted on retrieved contexts.
+
+    `fit` returns a fitted classifier for a context, given as indices into the train
+    bank:
+
+        - If a classifier fitted on exactly the same index set is cached, it is
+          returned as-is.
+        - Otherwise, if `max_jaccard_distance` > 0 and a cached classifier was fitted
+          on a context within that Jaccard distance, its fitted engine is patched to
+          use the new context. The fitted preprocessors are reused and only
+          transform the new rows (see `InferenceEngineCachePreprocessing
+          .with_train_set`), skipping the expensive re-fit. Patching requires the
+          same set of classes, ``fit_mode="fit_preprocessors"``, a numeric `X` and
+          a classifier without categorical features.
+        - Otherwise, a fresh clone of `estimator` is fitted.
+
+    Patched classifiers are cached under their own context, but distances for
+    further patching are always measured against the context on which the
+    preprocessors were actually fitted, so patches do not drift.
+    """
+
+    def __init__(
+        self,
+        estimator: Any,
+        *,
+        max_entries: int = 4,
+        max_jaccard_distance: float = 0.0,
+    ) -> None:
+        """Create the cache.
+
+        Args:
+            estimator: The unfitted classifier to clone for each new context.
+            max_entries: The number of fitted classifiers to keep. Each holds its
+                preprocessed context, so this bounds the memory of the cache.
+            max_jaccard_distance: The maximum Jaccard distance between contexts for
+                patching a cached classifier. 0 disables patching.
+        """
+        super().__init__()
+        self.estimator = estimator
+        self.max_entries = max_entries
+        self.max_jaccard_distance = max_jaccard_distance
+        self.stats = {"hit": 0, "patched": 0, "miss": 0}
+        # fingerprint -> (classifier, indices the preprocessors were fitted on)
+        self._entries: OrderedDict[str, tuple[Any, np.ndarray]] = OrderedDict()
+
+    def fit(
+        self, indices: np.ndarray, X_train: np.ndarray, y_train: np.ndarray
+    ) -> tuple[Any, Literal["hit", "patched", "miss"]]:
+        """Return a classifier fitted on ``X_train[indices]``, ``y_train[indices]``.
+
+        Args:
+            indices: The context, as indices into `X_train`/`y_train`.
+            X_train: The train bank.
+            y_train: The labels of the train bank.
+
+        Returns:
+            The fitted classifier and whether it was a cache hit, a patched cached
+            classifier or a new fit.
+        """
+        indices = np.unique(np.asarray(indices, dtype=np.int64))
+        key = context_fingerprint(indices)
+
+        if key in self._entries:
+            self._entries.move_to_end(key)
+            self.stats["hit"] += 1
+            return self._entries[key][0], "hit"
+
+        X_ctx = np.ascontiguousarray(X_train[indices])
+        y_ctx = y_train[indices]
+
+        status: Literal["patched", "miss"] = "miss"
+        clf, fitted_on = None, indices
+        if self.max_jaccard_distance > 0:
+            for cached_clf, cached_fitted_on in reversed(self._entries.values()):
+                distance = jaccard_distance(indices, cached_fitted_on)
+                if distance > self.max_jaccard_distance:
+                    continue
+                clf = _patch_context(cached_clf, X_ctx, y_ctx)
+                if clf is not None:
+                    status, fitted_on = "patched", cached_fitted_on
+                    break
+
+        if clf is None:
+            clf = clone(self.estimator)
+            clf.fit(X_ctx, y_ctx)
+
+        self._entries[key] = (clf, fitted_on)
+        if len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+        self.stats[status] += 1
+        return clf, status
+
+
+def _patch_context(clf: Any, X_ctx: np.ndarray, y_ctx: np.ndarray) -> Any | None:
+    # Return a shallow copy of `clf` whose fitted engine uses the new context, or
+    # None if the classifier's state cannot be patched for it.
+    engine = getattr(clf, "executor_", None)
+    if not hasattr(engine, "with_train_set") or not hasattr(clf, "classes_"):
+        return None
+    if not np.issubdtype(X_ctx.dtype, np.number):
+        return None
+    # The engine expects the context after the classifier's input handling. For
+    # numeric columns without categorical features that is a float64 cast, but
+    # categorical columns are ordinal-encoded and moved to the front, which only the
+    # classifier's own fitted encoder can reproduce, so such classifiers are refitted.
+    categorical = getattr(clf, "inferred_categorical_indices_", None)
+    if categorical is None or len(categorical) > 0:
+        return None
+    classes = np.unique(y_ctx)
+    if not np.array_equal(classes, clf.classes_):
+        return None
+    try:
+        patched_engine = engine.with_train_set(
+            X_ctx.astype(np.float64), np.searchsorted(classes, y_ctx)
+        )
+    except NotImplementedError:
+        return None
+
+    patched = copy.copy(clf)
+    patched.executor_ = patched_engine
+    return patched
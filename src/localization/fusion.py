@@ -0,0 +1,112 @@
+"""Fusion of test batches with overlapping contexts into a single predict.
+
+The hybrid loop fits TabPFN on a retrieved context and predicts a small batch of
+queries, so most of the work of every forward goes into the context rows. Test rows
+only attend to the context, not to each other, so batches whose contexts (nearly)
+agree can be served by one forward over their fused context and the union of their
+queries. `plan_fused_contexts` groups consecutive contexts greedily.
+"""
+
+from __future__ import annotations
+
+import dataclasses
+from collections.abc import Sequence
+
+import numpy as np
+
+
+@dataclasses.dataclass
+class FusedContext:
+    """A group of contexts that are served by a single fit and predict."""
+
+    query_rows: np.ndarray
+    """The queries of all fused contexts, in the order of the contexts."""
+
+    context_indices: np.ndarray
+    """The sorted union of the fused contexts."""
+
+    members: list[int]
+    """The positions of the fused contexts in the planned sequence."""
+
+
+@dataclasses.dataclass
+class FusionPlan:
+    """The result of `plan_fused_contexts`."""
+
+    groups: list[FusedContext]
+    n_contexts: int
+    """The number of contexts before fusion, i.e. the forwards without fusion."""
+
+    @property
+    def n_forwards(self) -> int:
+        """The number of forwards after fusion."""
+        return len(self.groups)
+
+    @property
+    def n_forwards_saved(self) -> int:
+        """The number of forwards saved by fusion."""
+        return self.n_contexts - self.n_forwards
+
+
+def plan_fused_contexts(
+    contexts: Sequence[tuple[np.ndarray, np.ndarray]],
+    *,
+    min_overlap: float = 1.0,
+    max_context_size: int | None = None,
+    max_queries: int | None = None,
+) -> FusionPlan:
+    """Group consecutive contexts whose rows overlap into fused contexts.
+
+    Each context is compared with the union of the current group. It joins the group
+    if their Jaccard similarity is at least `min_overlap` and neither the fused
+    context nor the fused queries grow beyond their limits; otherwise it starts a new
+    group. With ``min_overlap=1.0`` only identical contexts are fused, which leaves
+    the predictions unchanged.
+
+    Args:
+        contexts: ``(query_rows, context_indices)`` pairs in the order of the batches,
+            e.g. from `retrieve_batch_contexts` with `query_rows` offset to global
+            positions.
+        min_overlap: The minimum Jaccard similarity for fusing, in ``[0, 1]``.
+        max_context_size: The maximum number of rows of a fused context. Contexts
+            that are already larger are never fused. None for no limit.
+        max_queries: The maximum number of queries of a fused context. None for no
+            limit.
+    """
+    if not 0.0 <= min_overlap <= 1.0:
+        raise ValueError(f"min_overlap must be in [0, 1], got {min_overlap}.")
+
+    groups: list[FusedContext] = []
+    current: FusedContext | None = None
+    for i, (query_rows, context_indices) in enumerate(contexts):
+        query_rows = np.asarray(query_rows)
+        context_indices = np.unique(np.asarray(context_indices, dtype=np.int64))
+
+        if current is not None:
+            union = np.union1d(current.context_indices, context_indices)
+            n_queries = len(current.query_rows) + len(query_rows)
+            if (
+                _jaccard_similarity(current.context_indices, context_indices, union)
+                >= min_overlap
+                and (max_context_size is None or len(union) <= max_context_size)
+                and (max_queries is None or n_queries <= max_queries)
+            ):
+                current.query_rows = np.concatenate([current.query_rows, query_rows])
+                current.context_indices = union
+                current.members.append(i)
+                continue
+
+        current = FusedContext(
+            query_rows=query_rows, context_indices=context_indices, members=[i]
+        )
+        groups.append(current)
+
+    return FusionPlan(groups=groups, n_contexts=len(contexts))
+
+
+def _jaccard_similarity(a: np.ndarray, b: np.ndarray, union: np.ndarray) -> float:
+    # Computed directly rather than as ``1 - jaccard_distance``, which can round
+    # below an exactly matching `min_overlap`.
+    if not len(union):
+        return 1.0
+    return (len(a) + len(b) - len(union)) / len(union)
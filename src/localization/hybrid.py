@@ -0,0 +1,132 @@
+"""Retrieval and prediction steps of the hybrid (temporal + NCA) strategy.
+
+`HybridPredictor` holds the warm state of the pipeline: the NCA projection, the
+semantic index over the projected train bank and the cache of fitted classifiers.
+The offline evaluation in ``run_localization_hybrid.py`` and the inference server
+(`localization.server`) both predict through it.
+"""
+
+from __future__ import annotations
+
+import dataclasses
+from collections.abc import Sequence
+from typing import Any, Literal
+
+import numpy as np
+
+from localization.context_cache import ContextCache
+from localization.fusion import FusedContext, FusionPlan, plan_fused_contexts
+from localization.retrieval import RetrievalIndex, retrieve_batch_contexts
+from localization.windows import gather_rows
+
+
+@dataclasses.dataclass
+class HybridPredictor:
+    """Predicts windows from a temporal anchor plus their retrieved neighbours.
+
+    Every batch of queries is served by the context made of the last
+    ``retrieval_k * temporal_ratio`` train windows (the anchor) and the semantic
+    neighbours of the batch in NCA space, trimmed to `retrieval_k` rows. Batches with
+    overlapping contexts are fused before fitting, see `plan_fused_contexts`.
+    """
+
+    nca: Any
+    """The fitted projection into the retrieval space, with a ``transform`` method."""
+
+    index: RetrievalIndex
+    """The fitted semantic index over ``nca.transform(X_train)``."""
+
+    X_train: np.ndarray
+    y_train: np.ndarray
+    context_cache: ContextCache
+    retrieval_k: int
+    temporal_ratio: float
+    retrieval_mode: Literal["centroid", "per_query", "cluster"] = "centroid"
+    n_query_clusters: int = 2
+    random_state: int | None = None
+    fusion_min_overlap: float = 1.0
+    max_fused_context: int | None = None
+    max_fused_queries: int | None = None
+
+    temporal_indices: np.ndarray = dataclasses.field(init=False, repr=False)
+    """The anchor: the most recent train windows, shared by every context."""
+
+    def __post_init__(self) -> None:
+        n_temporal = int(self.retrieval_k * self.temporal_ratio)
+        n_train = len(self.X_train)
+        self.temporal_indices = np.arange(max(n_train - n_temporal, 0), n_train)
+
+    def retrieve(
+        self, X_batch: np.ndarray, X_batch_nca: np.ndarray | None = None
+    ) -> list[tuple[np.ndarray, np.ndarray]]:
+        """Return the ``(query_rows, context_indices)`` pairs of a batch of queries.
+
+        `query_rows` are positions in `X_batch`, `context_indices` index the train
+        bank, see `retrieve_batch_contexts`. `X_batch_nca` is the projection of
+        `X_batch` if already known, e.g. from a `SlidingWindowStream`.
+        """
+        if X_batch_nca is None:
+            X_batch_nca = self.nca.transform(X_batch)
+        contexts = []
+        for query_rows, semantic_indices in retrieve_batch_contexts(
+            self.index,
+            X_batch_nca,
+            mode=self.retrieval_mode,
+            n_clusters=self.n_query_clusters,
+            random_state=self.random_state,
+        ):
+            combined = np.unique(
+                np.concatenate([self.temporal_indices, semantic_indices])
+            )
+            if len(combined) > self.retrieval_k:
+                # np.unique sorts, so this keeps the most recent rows.
+                combined = combined[-self.retrieval_k :]
+            contexts.append((query_rows, combined))
+        return contexts
+
+    def plan(self, contexts: Sequence[tuple[np.ndarray, np.ndarray]]) -> FusionPlan:
+        """Fuse the contexts of consecutive batches, see `plan_fused_contexts`."""
+        return plan_fused_contexts(
+            contexts,
+            min_overlap=self.fusion_min_overlap,
+            max_context_size=self.max_fused_context,
+            max_queries=self.max_fused_queries,
+        )
+
+    def predict_group(self, X: np.ndarray, group: FusedContext) -> np.ndarray:
+        """Predict the queries of a fused context, ``group.query_rows`` index `X`."""
+        fitted, _ = self.context_cache.fit(
+            group.context_indices, self.X_train, self.y_train
+        )
+        return fitted.predict(gather_rows(X, group.query_rows))
+
+    def predict(
+        self,
+        X: np.ndarray,
+        *,
+        batch_size: int | None = None,
+        X_nca: np.ndarray | None = None,
+    ) -> np.ndarray:
+        """Predict the label codes of `X`, retrieving a context per `batch_size` rows.
+
+        Args:
+            X: The query windows, shape ``(n, T*F)``.
+            batch_size: The number of queries per retrieval, defaults to all of `X`.
+            X_nca: The projection of `X`, computed with `nca` if None.
+        """
+        batch_size = batch_size or max(len(X), 1)
+        contexts = []
+        for start in range(0, len(X), batch_size):
+            rows = slice(start, start + batch_size)
+            X_batch_nca = None if X_nca is None else X_nca[rows]
+            contexts.extend(
+                (start + query_rows, indices)
+                for query_rows, indices in self.retrieve(
+                    gather_rows(X, rows), X_batch_nca
+                )
+            )
+
+        y_pred = np.empty(len(X), dtype=self.y_train.dtype)
+        for group in self.plan(contexts).groups:
+            y_pred[group.query_rows] = self.predict_group(X, group)
+        return y_pred
@@ -0,0 +1,334 @@
+"""Ingest of the hourly sensor workbooks, with an on-disk columnar cache.
+
+Parsing an ``.xlsx`` file with openpyxl is by far the slowest step of the pipeline
+start-up. `SensorFileCache` converts each workbook once into one ``.npy`` file per
+column, so later runs can memory-map the columns instead of re-parsing the workbook.
+Workbooks that do need parsing are read in a process pool by `read_sensor_files`.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import logging
+import os
+import shutil
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+from tqdm import tqdm
+
+logger = logging.getLogger(__name__)
+
+CACHE_FORMAT_VERSION = 1
+
+# Parsing is CPU-bound, but each worker holds a full workbook in memory, so we do not
+# scale up to very large core counts by default.
+DEFAULT_MAX_READ_WORKERS = 8
+
+
+def list_sensor_files(data_dir: str | Path) -> list[str]:
+    """Return the paths of all ``.xlsx`` files in `data_dir`, sorted by file name.
+
+    The hour-files are named by timestamp, so sorting by name keeps the concatenated
+    time series in chronological order.
+    """
+    return [
+        os.path.join(data_dir, f)
+        for f in sorted(os.listdir(data_dir))
+        if f.endswith(".xlsx")
+    ]
+
+
+def select_sensor_columns(df: pd.DataFrame, target_col: str) -> pd.DataFrame:
+    """Keep only the sensor ``value`` columns and the target column.
+
+    The target column is matched case-insensitively, as in `load_and_preprocess`.
+    """
+    keep = [
+        c
+        for c in df.columns
+        if "value" in str(c) or str(c).lower() == target_col.lower()
+    ]
+    return df[keep]
+
+
+def read_sensor_file(
+    path: str | Path,
+    *,
+    target_col: str | None = None,
+    cache: SensorFileCache | None = None,
+) -> pd.DataFrame:
+    """Read one sensor workbook.
+
+    Args:
+        path: The ``.xlsx`` file to read.
+        target_col: If given, only the ``value`` columns and this column are kept.
+        cache: If given, the (filtered) columns are served from and stored in this
+            cache. The cache is keyed by `target_col`, so it must match.
+    """
+    if cache is not None:
+        return cache.read(path)
+    df = pd.read_excel(path, engine="openpyxl")
+    if target_col is not None:
+        df = select_sensor_columns(df, target_col)
+    return df
+
+
+def read_sensor_files(
+    paths: list[str],
+    *,
+    target_col: str | None = None,
+    cache: SensorFileCache | None = None,
+    n_workers: int | None = None,
+    desc: str | None = None,
+) -> list[tuple[str, pd.DataFrame]]:
+    """Read several sensor workbooks, parsing them in a process pool.
+
+    Files that fail to parse are skipped with a logged warning, so the result only
+    contains the files that could be read. The result is in the order of `paths` regardless of the order in
+    which the workers finish, which keeps the concatenated time series deterministic.
+
+    Cache hits are served in the current process; only the workbooks that actually
+    need parsing are dispatched to the pool.
+
+    Args:
+        paths: The ``.xlsx`` files to read, e.g. from `list_sensor_files`.
+        target_col: See `read_sensor_file`.
+        cache: See `read_sensor_file`.
+        n_workers: The maximum number of worker processes. If None, up to
+            `DEFAULT_MAX_READ_WORKERS` (bounded by the CPU count). If 1, the files are
+            read in the current process.
+        desc: If given, show a progress bar with this description.
+
+    Returns:
+        A list of ``(path, dataframe)`` pairs for the files that were read.
+    """
+    frames: list[pd.DataFrame | None] = [None] * len(paths)
+    to_parse = []
+    for i, path in enumerate(paths):
+        if cache is not None:
+            try:
+                frames[i] = cache.load(path)
+            except Exception:  # noqa: BLE001
+                frames[i] = None
+        if frames[i] is None:
+            to_parse.append(i)
+
+    if n_workers is None:
+        n_workers = min(DEFAULT_MAX_READ_WORKERS, os.cpu_count() or 1)
+    n_workers = max(1, min(n_workers, len(to_parse)))
+
+    progress = tqdm(total=len(paths), desc=desc, disable=desc is None)
+    progress.update(len(paths) - len(to_parse))
+    args = [(paths[i], target_col, cache) for i in to_parse]
+    if n_workers == 1:
+        results = (_read_sensor_file_or_error(*a) for a in args)
+        for i, (df, error) in zip(to_parse, results):
+            frames[i] = _log_unreadable(paths[i], df, error)
+            progress.update()
+    else:
+        with ProcessPoolExecutor(max_workers=n_workers) as pool:
+            # `map` yields in submission order, so the file order is preserved.
+            results = pool.map(_read_sensor_file_or_error, *zip(*args))
+            for i, (df, error) in zip(to_parse, results):
+                frames[i] = _log_unreadable(paths[i], df, error)
+                progress.update()
+    progress.close()
+
+    return [(path, df) for path, df in zip(paths, frames) if df is not None]
+
+
+def load_sensor_data(
+    data_dir: str | Path,
+    *,
+    target_col: str | None = None,
+    cache: SensorFileCache | None = None,
+    n_workers: int | None = None,
+    desc: str | None = None,
+) -> pd.DataFrame | None:
+    """Read all workbooks in `data_dir` and concatenate them in file-name order.
+
+    See `read_sensor_files` for the arguments. Returns None if no file could be read.
+    """
+    frames = read_sensor_files(
+        list_sensor_files(data_dir),
+        target_col=target_col,
+        cache=cache,
+        n_workers=n_workers,
+        desc=desc,
+    )
+    if not frames:
+        return None
+    return pd.concat([df for _, df in frames], ignore_index=True)
+
+
+def _read_sensor_file_or_error(
+    path: str, target_col: str | None, cache: SensorFileCache | None
+) -> tuple[pd.DataFrame | None, str | None]:
+    # Unreadable hour-files (e.g. partially written exports) are skipped rather than
+    # aborting the whole ingest. The error is returned, not logged, as this runs in
+    # the worker processes.
+    try:
+        return read_sensor_file(path, target_col=target_col, cache=cache), None
+    except Exception as e:  # noqa: BLE001
+        return None, f"{type(e).__name__}: {e}"
+
+
+def _log_unreadable(
+    path: str, df: pd.DataFrame | None, error: str | None
+) -> pd.DataFrame | None:
+    if error is not None:
+        logger.warning("Skipping unreadable sensor file %s (%s)", path, error)
+    return df
+
+
+class SensorFileCache:
+    """Columnar on-disk cache of parsed sensor workbooks.
+
+    Every workbook gets its own directory under `cache_dir`, derived from the absolute
+    path of the workbook. It holds one ``.npy`` file per kept column plus a
+    ``meta.json`` recording the source path, mtime and size. An entry whose recorded
+    mtime or size no longer matches the workbook is treated as missing and rebuilt,
+    so edited or re-exported hour-files are picked up automatically.
+
+    Numeric columns are stored as-is and loaded with ``mmap_mode="r"``. Text columns
+    (e.g. ``Location``) are stored as fixed-width unicode arrays with a separate
+    missing-value mask, so they stay memory-mappable as well.
+    """
+
+    def __init__(self, cache_dir: str | Path, target_col: str) -> None:
+        super().__init__()
+        self.cache_dir = Path(cache_dir)
+        self.target_col = target_col
+
+    def read(self, path: str | Path) -> pd.DataFrame:
+        """Return the filtered columns of `path`, parsing the workbook on a miss."""
+        df = self.load(path)
+        if df is None:
+            df = select_sensor_columns(
+                pd.read_excel(path, engine="openpyxl"), self.target_col
+            )
+            # The workbook was read, so a failing cache write must not lose it.
+            try:
+                self.store(path, df)
+            except Exception as e:  # noqa: BLE001
+                logger.warning("Could not cache sensor file %s (%s)", path, e)
+        return df
+
+    def load(self, path: str | Path) -> pd.DataFrame | None:
+        """Load the cached columns of `path`, or None if the entry is missing/stale."""
+        entry = self._entry_dir(path)
+        try:
+            with open(entry / "meta.json", encoding="utf-8") as f:
+                meta = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if meta.get("source") != self._signature(path):
+            return None
+
+        columns = {}
+        try:
+            for i, (name, kind) in enumerate(zip(meta["columns"], meta["kinds"])):
+                values = np.load(entry / f"col_{i:03d}.npy", mmap_mode="r")
+                if kind == "text":
+                    missing = np.load(entry / f"col_{i:03d}.mask.npy")
+                    values = values.astype(object)
+                    values[missing] = np.nan
+                columns[name] = values
+        except OSError:
+            # The entry was replaced by a concurrent `store` while being read.
+            return None
+        return pd.DataFrame(columns, columns=meta["columns"])
+
+    def store(self, path: str | Path, df: pd.DataFrame) -> None:
+        """Write the columns of `df` as the cache entry for `path`.
+
+        The entry is written to a unique temporary directory first and then renamed
+        into place, so a crashed or concurrent writer never leaves a half-written
+        entry. If another writer stored a current entry first, it is kept and this
+        copy is discarded. A stale entry is renamed away before it is deleted, so
+        readers see either the old or the new entry, or a miss.
+        """
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        tmp = Path(tempfile.mkdtemp(dir=self.cache_dir, prefix=".tmp-"))
+        try:
+            kinds = []
+            for i, name in enumerate(df.columns):
+                col = df[name]
+                if pd.api.types.is_numeric_dtype(col):
+                    kinds.append("numeric")
+                    np.save(tmp / f"col_{i:03d}.npy", col.to_numpy())
+                else:
+                    kinds.append("text")
+                    missing = col.isna().to_numpy()
+                    text = col.astype(str).to_numpy().astype(np.str_)
+                    np.save(tmp / f"col_{i:03d}.npy", text)
+                    np.save(tmp / f"col_{i:03d}.mask.npy", missing)
+            meta = {
+                "source": self._signature(path),
+                "columns": [str(c) for c in df.columns],
+                "kinds": kinds,
+            }
+            with open(tmp / "meta.json", "w", encoding="utf-8") as f:
+                json.dump(meta, f)
+
+            self._publish(tmp, self._entry_dir(path), meta["source"])
+        except BaseException:
+            shutil.rmtree(tmp, ignore_errors=True)
+            raise
+
+    def _publish(self, tmp: Path, entry: Path, source: dict) -> None:
+        # Renaming a directory onto a non-empty one fails, which is what keeps a live
+        # entry from being replaced under its readers.
+        try:
+            os.replace(tmp, entry)
+            return
+        except OSError:
+            pass
+        try:
+            with open(entry / "meta.json", encoding="utf-8") as f:
+                is_current = json.load(f).get("source") == source
+        except (OSError, ValueError):
+            is_current = False
+        if not is_current:
+            stale = Path(tempfile.mkdtemp(dir=self.cache_dir, prefix=".old-"))
+            try:
+                os.replace(entry, stale / "entry")
+                os.replace(tmp, entry)
+            except OSError:
+                # Another writer replaced the entry in the meantime; its copy is
+                # as good as ours.
+                pass
+            finally:
+                shutil.rmtree(stale, ignore_errors=True)
+        shutil.rmtree(tmp, ignore_errors=True)
+
+    def prune(self, keep_paths: list[str]) -> None:
+        """Remove the entries of workbooks that are not in `keep_paths`."""
+        if not self.cache_dir.exists():
+            return
+        keep = {self._entry_dir(p).name for p in keep_paths}
+        for entry in self.cache_dir.iterdir():
+            # Skip the in-progress ".tmp-*" directories of concurrent writers.
+            if entry.name.startswith(".") or not entry.is_dir():
+                continue
+            if entry.name not in keep:
+                shutil.rmtree(entry, ignore_errors=True)
+
+    def _entry_dir(self, path: str | Path) -> Path:
+        key = hashlib.sha1(os.path.abspath(path).encode()).hexdigest()[:16]
+        return self.cache_dir / key
+
+    def _signature(self, path: str | Path) -> dict:
+        st = os.stat(path)
+        return {
+            "path": os.path.abspath(path),
+            "mtime_ns": st.st_mtime_ns,
+            "size": st.st_size,
+            "target_col": self.target_col,
+            "version": CACHE_FORMAT_VERSION,
+        }
@@ -0,0 +1,386 @@
+"""Nearest-neighbour indices for the semantic (NCA-space) retrieval.
+
+All indices follow the ``fit``/``kneighbors`` interface of
+`sklearn.neighbors.NearestNeighbors`, so they can be swapped without touching the
+inference loop:
+
+    - `ExactIndex`: brute-force/tree search via `NearestNeighbors`.
+    - `IVFIndex`: inverted-file index; the train bank is partitioned with k-means and
+      a query only scans the `n_probe` partitions closest to it.
+    - `HNSWIndex`: graph index from the optional ``hnswlib`` package.
+
+`measure_recall` compares an approximate index against the exact search, and
+`retrieve_batch_contexts` turns the neighbours of a batch of queries into contexts.
+"""
+
+from __future__ import annotations
+
+import dataclasses
+import math
+import time
+from abc import ABC, abstractmethod
+from typing import Literal
+
+import numpy as np
+from sklearn.cluster import KMeans
+from sklearn.neighbors import NearestNeighbors
+
+
+class RetrievalIndex(ABC):
+    """Interface of a k-nearest-neighbour index over the projected train bank."""
+
+    n_samples_: int
+    """The number of indexed rows, set by `fit`."""
+
+    def __init__(self, n_neighbors: int) -> None:
+        super().__init__()
+        self.n_neighbors = n_neighbors
+
+    @abstractmethod
+    def fit(self, X: np.ndarray) -> RetrievalIndex:
+        """Index the rows of `X`."""
+        ...
+
+    @abstractmethod
+    def kneighbors(
+        self, X: np.ndarray, n_neighbors: int | None = None
+    ) -> tuple[np.ndarray, np.ndarray]:
+        """Find the nearest indexed rows of each query.
+
+        Args:
+            X: The queries, shape ``(n_queries, n_features)``.
+            n_neighbors: The number of neighbours per query, defaults to the value
+                passed at construction.
+
+        Returns:
+            The euclidean distances and the indices of the neighbours, each of shape
+            ``(n_queries, n_neighbors)`` and sorted by increasing distance.
+        """
+        ...
+
+
+class ExactIndex(RetrievalIndex):
+    """Exact euclidean search, see `sklearn.neighbors.NearestNeighbors`."""
+
+    def __init__(self, n_neighbors: int, *, n_jobs: int | None = -1) -> None:
+        super().__init__(n_neighbors)
+        self._nn = NearestNeighbors(
+            n_neighbors=n_neighbors, metric="euclidean", n_jobs=n_jobs
+        )
+
+    def fit(self, X: np.ndarray) -> ExactIndex:
+        self._nn.fit(X)
+        self.n_samples_ = len(X)
+        return self
+
+    def kneighbors(
+        self, X: np.ndarray, n_neighbors: int | None = None
+    ) -> tuple[np.ndarray, np.ndarray]:
+        return self._nn.kneighbors(X, n_neighbors or self.n_neighbors)
+
+
+class IVFIndex(RetrievalIndex):
+    """Inverted-file index with a k-means coarse quantiser.
+
+    The indexed rows are assigned to `n_lists` k-means cells. A query computes exact
+    distances only to the rows of its `n_probe` closest cells, so the cost per query
+    is roughly ``n_probe / n_lists`` of the exact search. Raising `n_probe` trades
+    latency for recall; ``n_probe == n_lists`` is an exact search.
+
+    If the probed cells hold fewer than `n_neighbors` rows, further cells are probed
+    in order of distance until there are enough candidates.
+    """
+
+    def __init__(
+        self,
+        n_neighbors: int,
+        *,
+        n_lists: int | None = None,
+        n_probe: int = 8,
+        random_state: int | None = None,
+    ) -> None:
+        """Create the index.
+
+        Args:
+            n_neighbors: The default number of neighbours per query.
+            n_lists: The number of k-means cells. If None, ``sqrt(n_samples)``.
+            n_probe: The number of cells scanned per query.
+            random_state: Seed of the k-means initialisation.
+        """
+        super().__init__(n_neighbors)
+        self.n_lists = n_lists
+        self.n_probe = n_probe
+        self.random_state = random_state
+
+    def fit(self, X: np.ndarray) -> IVFIndex:
+        X = np.ascontiguousarray(X, dtype=np.float64)
+        n_lists = self.n_lists or max(1, int(np.sqrt(len(X))))
+        n_lists = min(n_lists, len(X))
+        kmeans = KMeans(n_clusters=n_lists, n_init=1, random_state=self.random_state)
+        assignment = kmeans.fit_predict(X)
+
+        # Store the rows grouped by cell, so that each cell is a contiguous slice.
+        self._order = np.argsort(assignment, kind="stable")
+        self._X = X[self._order]
+        self._sq_norms = np.einsum("ij,ij->i", self._X, self._X)
+        self._offsets = np.searchsorted(
+            assignment[self._order], np.arange(n_lists + 1)
+        )
+        self._centroids = kmeans.cluster_centers_
+        self.n_samples_ = len(X)
+        return self
+
+    def kneighbors(
+        self, X: np.ndarray, n_neighbors: int | None = None
+    ) -> tuple[np.ndarray, np.ndarray]:
+        k = min(n_neighbors or self.n_neighbors, len(self._X))
+        X = np.asarray(X, dtype=np.float64)
+        sizes = np.diff(self._offsets)
+        cell_order = np.argsort(_sq_distances(X, self._centroids), axis=1)
+
+        distances = np.empty((len(X), k))
+        indices = np.empty((len(X), k), dtype=np.intp)
+        for q, x in enumerate(X):
+            # Probe the n_probe closest cells, plus more if they hold < k rows.
+            n_cells = min(self.n_probe, len(sizes))
+            counts = np.cumsum(sizes[cell_order[q]])
+            n_cells = max(n_cells, int(np.searchsorted(counts, k)) + 1)
+            cells = cell_order[q, :n_cells]
+            candidates = np.concatenate(
+                [np.arange(self._offsets[c], self._offsets[c + 1]) for c in cells]
+            )
+
+            sq = self._sq_norms[candidates] - 2 * self._X[candidates] @ x + x @ x
+            top = np.argpartition(sq, k - 1)[:k]
+            top = top[np.argsort(sq[top])]
+            distances[q] = np.sqrt(np.maximum(sq[top], 0))
+            indices[q] = self._order[candidates[top]]
+        return distances, indices
+
+
+class HNSWIndex(RetrievalIndex):
+    """Hierarchical navigable small-world graph index, using ``hnswlib``.
+
+    ``hnswlib`` is an optional dependency; install it with ``pip install hnswlib``.
+    `ef_search` is the main recall/latency knob at query time, `M` and
+    `ef_construction` control the graph quality at build time.
+    """
+
+    def __init__(
+        self,
+        n_neighbors: int,
+        *,
+        M: int = 16,
+        ef_construction: int = 200,
+        ef_search: int | None = None,
+        n_threads: int = -1,
+        random_state: int = 0,
+    ) -> None:
+        """Create the index.
+
+        Args:
+            n_neighbors: The default number of neighbours per query.
+            M: The number of graph links per element.
+            ef_construction: The candidate list size while building the graph.
+            ef_search: The candidate list size at query time. It is raised to at
+                least the number of requested neighbours. If None,
+                ``2 * n_neighbors``.
+            n_threads: The number of threads used by hnswlib, -1 for all cores.
+            random_state: Seed of the graph construction.
+        """
+        try:
+            import hnswlib  # noqa: F401
+        except ImportError as e:
+            raise ImportError(
+                "The 'hnsw' retrieval backend requires hnswlib. "
+                "Install it with: pip install hnswlib"
+            ) from e
+
+        super().__init__(n_neighbors)
+        self.M = M
+        self.ef_construction = ef_construction
+        self.ef_search = ef_search
+        self.n_threads = n_threads
+        self.random_state = random_state
+
+    def fit(self, X: np.ndarray) -> HNSWIndex:
+        import hnswlib
+
+        X = np.ascontiguousarray(X, dtype=np.float32)
+        self._index = hnswlib.Index(space="l2", dim=X.shape[1])
+        self._index.init_index(
+            max_elements=len(X),
+            M=self.M,
+            ef_construction=self.ef_construction,
+            random_seed=self.random_state,
+        )
+        self._index.add_items(X, np.arange(len(X)), num_threads=self.n_threads)
+        self.n_samples_ = len(X)
+        return self
+
+    def kneighbors(
+        self, X: np.ndarray, n_neighbors: int | None = None
+    ) -> tuple[np.ndarray, np.ndarray]:
+        k = min(n_neighbors or self.n_neighbors, self.n_samples_)
+        ef = max(self.ef_search or 2 * self.n_neighbors, k)
+        self._index.set_ef(ef)
+        labels, sq_distances = self._index.knn_query(
+            np.ascontiguousarray(X, dtype=np.float32), k=k, num_threads=self.n_threads
+        )
+        # hnswlib's "l2" space returns squared distances.
+        return np.sqrt(sq_distances.astype(np.float64)), labels.astype(np.intp)
+
+
+def make_retrieval_index(
+    backend: Literal["exact", "ivf", "hnsw"], n_neighbors: int, **kwargs
+) -> RetrievalIndex:
+    """Create a retrieval index by name, passing `kwargs` to its constructor."""
+    if backend == "exact":
+        return ExactIndex(n_neighbors, **kwargs)
+    if backend == "ivf":
+        return IVFIndex(n_neighbors, **kwargs)
+    if backend == "hnsw":
+        return HNSWIndex(n_neighbors, **kwargs)
+    raise ValueError(f"Unknown retrieval backend: {backend}")
+
+
+@dataclasses.dataclass
+class RecallReport:
+    """Result of `measure_recall`."""
+
+    recall: float
+    """Mean fraction of the exact neighbours that the index returned."""
+
+    seconds_per_query: float
+    """Mean query latency of the index."""
+
+    exact_seconds_per_query: float
+    """Mean query latency of the exact search on the same queries."""
+
+
+def measure_recall(
+    index: RetrievalIndex,
+    X_indexed: np.ndarray,
+    X_queries: np.ndarray,
+    n_neighbors: int | None = None,
+) -> RecallReport:
+    """Measure the recall@k and latency of `index` against an exact search.
+
+    Args:
+        index: A fitted index over `X_indexed`.
+        X_indexed: The rows `index` was fitted on.
+        X_queries: The queries, e.g. projected test windows or batch centroids.
+        n_neighbors: k, defaults to ``index.n_neighbors``.
+    """
+    k = n_neighbors or index.n_neighbors
+    exact = ExactIndex(k).fit(X_indexed)
+
+    start = time.perf_counter()
+    _, exact_indices = exact.kneighbors(X_queries, k)
+    exact_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    _, indices = index.kneighbors(X_queries, k)
+    seconds = time.perf_counter() - start
+
+    hits = [
+        len(np.intersect1d(found, expected, assume_unique=True))
+        for found, expected in zip(indices, exact_indices)
+    ]
+    return RecallReport(
+        recall=float(np.mean(hits)) / exact_indices.shape[1],
+        seconds_per_query=seconds / len(X_queries),
+        exact_seconds_per_query=exact_seconds / len(X_queries),
+    )
+
+
+def retrieve_batch_contexts(
+    index: RetrievalIndex,
+    X_queries: np.ndarray,
+    n_neighbors: int | None = None,
+    *,
+    mode: Literal["centroid", "per_query", "cluster"] = "centroid",
+    n_clusters: int = 2,
+    oversample: float = 4.0,
+    random_state: int | None = None,
+) -> list[tuple[np.ndarray, np.ndarray]]:
+    """Retrieve the semantic context(s) for a batch of queries.
+
+    Modes:
+        - ``"centroid"``: a single context of the neighbours of the batch mean. This
+          is cheap but blurs the context of heterogeneous batches.
+        - ``"per_query"``: a single context merged from the neighbour lists of all
+          queries. The lists are interleaved by rank (every query's nearest
+          neighbour first, then every second-nearest, ...) and deduplicated, so each
+          query contributes its closest rows until the budget is filled.
+        - ``"cluster"``: the queries are grouped into `n_clusters` k-means clusters
+          and every cluster gets its own context, merged as in ``"per_query"``. This
+          costs one ``fit`` per cluster downstream.
+
+    In all modes the index is queried with a single vectorised `kneighbors` call.
+
+    Args:
+        index: The fitted retrieval index.
+        X_queries: The queries in the index space, shape ``(n_queries, n_features)``.
+        n_neighbors: The number of context rows per context, defaults to
+            ``index.n_neighbors``.
+        mode: See above.
+        n_clusters: The number of query clusters for ``mode="cluster"``.
+        oversample: For the merged modes, each query retrieves
+            ``oversample * n_neighbors / n_queries`` neighbours. If the merged lists
+            do not fill the budget, they are retrieved again with `n_neighbors` each.
+        random_state: Seed of the query clustering.
+
+    Returns:
+        A list of ``(query_rows, context_indices)`` pairs, where `query_rows` are the
+        positions in `X_queries` served by the context. The context indices are
+        ordered by priority, not by index.
+    """
+    budget = min(n_neighbors or index.n_neighbors, index.n_samples_)
+    X_queries = np.asarray(X_queries)
+    all_rows = np.arange(len(X_queries))
+
+    if mode == "centroid":
+        center = X_queries.mean(axis=0, keepdims=True)
+        _, indices = index.kneighbors(center, budget)
+        return [(all_rows, indices[0])]
+
+    if mode == "per_query":
+        groups = [all_rows]
+    elif mode == "cluster":
+        # k-means leaves clusters empty if there are fewer distinct queries than
+        # clusters, e.g. for a batch of repeated windows.
+        n_clusters = min(n_clusters, len(np.unique(X_queries, axis=0)))
+        labels = KMeans(
+            n_clusters=n_clusters, n_init=1, random_state=random_state
+        ).fit_predict(X_queries)
+        groups = [np.flatnonzero(labels == c) for c in range(n_clusters)]
+        groups = [rows for rows in groups if len(rows)]
+    else:
+        raise ValueError(f"Unknown retrieval mode: {mode}")
+
+    smallest = min(len(rows) for rows in groups)
+    k = min(budget, max(1, math.ceil(oversample * budget / smallest)))
+    _, indices = index.kneighbors(X_queries, k)
+    contexts = [_merge_neighbor_lists(indices[rows], budget) for rows in groups]
+    if k < budget and any(len(ctx) < budget for ctx in contexts):
+        _, indices = index.kneighbors(X_queries, budget)
+        contexts = [_merge_neighbor_lists(indices[rows], budget) for rows in groups]
+    return list(zip(groups, contexts))
+
+
+def _merge_neighbor_lists(indices: np.ndarray, budget: int) -> np.ndarray:
+    # Interleave the (n_queries, k) neighbour lists by rank and keep the first
+    # occurrence of each index, i.e. the rank at which any query first asked for it.
+    flat = indices.T.reshape(-1)
+    unique, first = np.unique(flat, return_index=True)
+    return unique[np.argsort(first, kind="stable")][:budget]
+
+
+def _sq_distances(X: np.ndarray, Y: np.ndarray) -> np.ndarray:
+    # Squared euclidean distances between the rows of X and Y.
+    return (
+        np.einsum("ij,ij->i", X, X)[:, None]
+        - 2 * X @ Y.T
+        + np.einsum("ij,ij->i", Y, Y)[None, :]
+    )
@@ -0,0 +1,288 @@
+"""Long-lived inference server for online localisation.
+
+The server keeps a predictor warm (for the hybrid pipeline: the NCA projection, the
+semantic index and the fitted classifiers of `HybridPredictor`) and answers one
+sensor window per request. Concurrent requests are coalesced by `MicroBatcher`: the
+first request of a batch waits at most `max_delay` seconds for others to join, so
+every request pays at most that much latency for batching, and a burst of windows
+costs one retrieval and ``predict`` instead of one per window.
+
+Two transports are served by `serve`, both with JSON bodies:
+
+    - TCP (``"host:port"``): HTTP/1.1 with ``POST /predict`` and ``GET /stats``.
+    - Unix socket (``"unix:/path"``): one JSON request per line, answered by one
+      JSON line. Requests with ``"stats": true`` return the statistics.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import dataclasses
+import json
+import os
+import time
+from collections.abc import Callable
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any
+
+import numpy as np
+
+
+@dataclasses.dataclass
+class BatcherStats:
+    """Counters of a `MicroBatcher`."""
+
+    n_requests: int = 0
+    n_batches: int = 0
+    n_errors: int = 0
+    predict_seconds: float = 0.0
+    """The total time spent in ``predict_batch``."""
+
+    @property
+    def mean_batch_size(self) -> float:
+        return self.n_requests / self.n_batches if self.n_batches else 0.0
+
+
+class MicroBatcher:
+    """Coalesce concurrent single-row requests into batches for a predictor.
+
+    Batches are predicted one at a time in a worker thread, so the event loop keeps
+    accepting requests meanwhile; these form the next batch. The predictor therefore
+    never runs concurrently with itself and need not be thread-safe.
+    """
+
+    def __init__(
+        self,
+        predict_batch: Callable[[np.ndarray], np.ndarray],
+        *,
+        max_batch_size: int = 50,
+        max_delay: float = 0.02,
+    ) -> None:
+        """Create the batcher.
+
+        Args:
+            predict_batch: Predicts a ``(n, ...)`` batch of rows, returning ``n``
+                results.
+            max_batch_size: The maximum number of rows per batch.
+            max_delay: The maximum time in seconds that the first request of a
+                batch waits for more requests. 0 only batches the requests that
+                arrived while the previous batch was predicted.
+        """
+        super().__init__()
+        self.predict_batch = predict_batch
+        self.max_batch_size = max_batch_size
+        self.max_delay = max_delay
+        self.stats = BatcherStats()
+        self._queue: asyncio.Queue[tuple[np.ndarray, asyncio.Future]] | None = None
+        self._worker: asyncio.Task | None = None
+        self._executor = ThreadPoolExecutor(max_workers=1)
+
+    async def submit(self, row: np.ndarray) -> tuple[Any, int]:
+        """Predict a single row.
+
+        Returns:
+            The prediction and the size of the batch it was predicted in.
+        """
+        if self._worker is None:
+            self._queue = asyncio.Queue()
+            self._worker = asyncio.create_task(self._run())
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((np.asarray(row), future))
+        return await future
+
+    async def close(self) -> None:
+        """Stop the batching task and the worker thread."""
+        if self._worker is not None:
+            self._worker.cancel()
+            try:
+                await self._worker
+            except asyncio.CancelledError:
+                pass
+            self._worker = None
+        self._executor.shutdown(wait=True)
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._queue.get()]
+            deadline = loop.time() + self.max_delay
+            while len(batch) < self.max_batch_size:
+                timeout = deadline - loop.time()
+                try:
+                    if timeout > 0:
+                        batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                    else:
+                        batch.append(self._queue.get_nowait())
+                except (asyncio.TimeoutError, asyncio.QueueEmpty):
+                    break
+
+            # Requests whose client went away are not predicted.
+            batch = [(row, future) for row, future in batch if not future.done()]
+            if not batch:
+                continue
+            X = np.stack([row for row, _ in batch])
+            start = time.perf_counter()
+            try:
+                predictions = await loop.run_in_executor(
+                    self._executor, self.predict_batch, X
+                )
+            except Exception as e:  # noqa: BLE001
+                self.stats.n_errors += len(batch)
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+            finally:
+                self.stats.predict_seconds += time.perf_counter() - start
+
+            self.stats.n_requests += len(batch)
+            self.stats.n_batches += 1
+            for (_, future), prediction in zip(batch, predictions):
+                if not future.done():
+                    future.set_result((prediction, len(batch)))
+
+
+@dataclasses.dataclass
+class LocalizationService:
+    """Turns JSON requests into batcher rows and predictions into JSON responses."""
+
+    batcher: MicroBatcher
+    decode: Callable[[dict], np.ndarray]
+    """Returns the row of a request, raising ValueError for malformed requests."""
+
+    encode: Callable[[Any], dict]
+    """Returns the response fields of a prediction."""
+
+    async def handle(self, request: dict) -> dict:
+        start = time.perf_counter()
+        prediction, batch_size = await self.batcher.submit(self.decode(request))
+        response = self.encode(prediction)
+        response["batch_size"] = batch_size
+        response["latency_ms"] = round((time.perf_counter() - start) * 1e3, 3)
+        return response
+
+    def stats(self) -> dict:
+        stats = dataclasses.asdict(self.batcher.stats)
+        stats["mean_batch_size"] = self.batcher.stats.mean_batch_size
+        return stats
+
+
+async def serve(service: LocalizationService, address: str) -> None:
+    """Serve `service` on `address` until cancelled.
+
+    Args:
+        service: The service to answer requests with.
+        address: ``"host:port"`` for HTTP over TCP, or ``"unix:/path"`` for JSON
+            lines over a Unix socket. An existing socket file is replaced.
+    """
+    if address.startswith("unix:"):
+        path = address[len("unix:") :]
+        if os.path.exists(path):
+            os.unlink(path)
+        server = await asyncio.start_unix_server(
+            lambda r, w: _handle_json_lines(service, r, w), path=path
+        )
+    else:
+        host, _, port = address.rpartition(":")
+        server = await asyncio.start_server(
+            lambda r, w: _handle_http(service, r, w), host=host or None, port=int(port)
+        )
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        await service.batcher.close()
+
+
+async def _handle_json_lines(
+    service: LocalizationService,
+    reader: asyncio.StreamReader,
+    writer: asyncio.StreamWriter,
+) -> None:
+    # Requests of a connection are answered in order, but several connections are
+    # batched together.
+    try:
+        while line := await reader.readline():
+            try:
+                request = json.loads(line)
+                if request.get("stats"):
+                    response = service.stats()
+                else:
+                    response = await service.handle(request)
+            except KeyError as e:
+                response = {"error": f"Missing field {e}"}
+            except (ValueError, TypeError) as e:
+                response = {"error": str(e)}
+            except Exception as e:  # noqa: BLE001
+                response = {"error": f"Prediction failed: {e}"}
+            writer.write(json.dumps(response).encode() + b"\n")
+            await writer.drain()
+    except (ConnectionError, asyncio.CancelledError):
+        # The client went away or the server is shutting down.
+        pass
+    finally:
+        writer.close()
+
+
+_HTTP_REASONS = {
+    200: "OK",
+    400: "Bad Request",
+    404: "Not Found",
+    500: "Internal Server Error",
+}
+
+
+async def _handle_http(
+    service: LocalizationService,
+    reader: asyncio.StreamReader,
+    writer: asyncio.StreamWriter,
+) -> None:
+    # A minimal HTTP/1.1 server: JSON bodies with Content-Length, keep-alive.
+    try:
+        while request_line := await reader.readline():
+            method, path, _ = request_line.decode("latin-1").split(" ", 2)
+            headers = {}
+            while (line := await reader.readline()) not in (b"\r\n", b"\n", b""):
+                name, _, value = line.decode("latin-1").partition(":")
+                headers[name.strip().lower()] = value.strip()
+            body = await reader.readexactly(int(headers.get("content-length", 0)))
+
+            status = 200
+            try:
+                if method == "POST" and path == "/predict":
+                    response = await service.handle(json.loads(body))
+                elif method == "GET" and path == "/stats":
+                    response = service.stats()
+                else:
+                    status, response = 404, {"error": f"No route {method} {path}"}
+            except KeyError as e:
+                status, response = 400, {"error": f"Missing field {e}"}
+            except (ValueError, TypeError) as e:
+                status, response = 400, {"error": str(e)}
+            except Exception as e:  # noqa: BLE001
+                status, response = 500, {"error": f"Prediction failed: {e}"}
+
+            payload = json.dumps(response).encode()
+            keep_alive = headers.get("connection", "").lower() != "close"
+            writer.write(
+                f"HTTP/1.1 {status} {_HTTP_REASONS[status]}\r\n"
+                "Content-Type: application/json\r\n"
+                f"Content-Length: {len(payload)}\r\n"
+                f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n"
+                "\r\n".encode("latin-1")
+                + payload
+            )
+            await writer.drain()
+            if not keep_alive:
+                break
+    except (
+        ConnectionError,
+        ValueError,
+        asyncio.IncompleteReadError,
+        asyncio.CancelledError,
+    ):
+        # The client went away, sent something that is not HTTP, or the server is
+        # shutting down.
+        pass
+    finally:
+        writer.close()
@@ -0,0 +1,109 @@
+"""Online sliding windows over a stream of sensor readings.
+
+`sliding_window_matrix` builds the windows of a complete history. `SlidingWindowStream`
+builds the same windows one reading at a time, together with their projection into
+the retrieval space, so a live deployment can hand every new window to
+`HybridPredictor` without re-projecting it.
+"""
+
+from __future__ import annotations
+
+import numpy as np
+
+
+class SlidingWindowStream:
+    """Ring buffer of the last `window_size` readings and their window projection.
+
+    Every `push` of a ``(F,)`` reading completes the window of the last `window_size`
+    readings, flattened like the rows of `sliding_window_matrix`, and its projection
+    ``window @ projection.T``.
+
+    The readings are stored twice, ``window_size`` rows apart, so the current window
+    is always a contiguous slice of the buffer. It is emitted and projected without a
+    copy, and every push costs one ``(T*F,) @ (T*F, d)`` product, the same as
+    projecting the window in a batch.
+    """
+
+    def __init__(
+        self,
+        window_size: int,
+        n_features: int,
+        projection: np.ndarray | None = None,
+    ) -> None:
+        """Create an empty stream.
+
+        Args:
+            window_size: The number of readings per window.
+            n_features: The number of features of a reading.
+            projection: The ``(d, window_size * n_features)`` matrix of a linear
+                projection of the flattened windows, e.g. the ``components_`` of a
+                fitted `sklearn.neighbors.NeighborhoodComponentsAnalysis`. If None,
+                only the windows are emitted.
+        """
+        super().__init__()
+        self.window_size = window_size
+        self.n_features = n_features
+        self._buffer = np.zeros((2 * window_size, n_features))
+        self._n_seen = 0
+
+        self._projection = None
+        if projection is not None:
+            projection = np.asarray(projection, dtype=float)
+            if projection.shape[1] != window_size * n_features:
+                raise ValueError(
+                    f"Expected a projection with {window_size * n_features} columns, "
+                    f"got {projection.shape}."
+                )
+            # (T*F, d), so the window is projected by a contiguous matrix-vector product
+            self._projection = np.ascontiguousarray(projection.T)
+
+    @property
+    def ready(self) -> bool:
+        """Whether `window_size` readings have been pushed, i.e. a window exists."""
+        return self._n_seen >= self.window_size
+
+    @property
+    def window(self) -> np.ndarray:
+        """The flattened ``(window_size * n_features,)`` current window.
+
+        This is a read-only view into the ring buffer that changes on the next `push`;
+        copy it to keep it.
+        """
+        if not self.ready:
+            raise ValueError(
+                f"Only {self._n_seen} of {self.window_size} readings have been pushed."
+            )
+        start = (self._n_seen - self.window_size) % self.window_size
+        window = self._buffer[start : start + self.window_size].reshape(-1)
+        window.flags.writeable = False
+        return window
+
+    def push(self, reading: np.ndarray) -> tuple[np.ndarray, np.ndarray | None] | None:
+        """Add a reading and return the completed window and its projection.
+
+        Returns:
+            None while fewer than `window_size` readings have been pushed, else the
+            `window` ending with `reading` and its ``(d,)`` projection (None without
+            a projection matrix).
+        """
+        reading = np.asarray(reading, dtype=float)
+        if reading.shape != (self.n_features,):
+            raise ValueError(
+                f"Expected a reading of shape ({self.n_features},), got "
+                f"{reading.shape}."
+            )
+        slot = self._n_seen % self.window_size
+        self._buffer[slot] = reading
+        self._buffer[slot + self.window_size] = reading
+        self._n_seen += 1
+
+        if not self.ready:
+            return None
+        window = self.window
+        projected = None if self._projection is None else window @ self._projection
+        return window, projected
+
+    def reset(self) -> None:
+        """Forget all readings, e.g. after a gap in the stream."""
+        self._n_seen = 0
+        self._buffer[:] = 0.0
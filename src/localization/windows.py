@@ -0,0 +1,43 @@
+"""Sliding-window design matrices over the sensor time series."""
+
+from __future__ import annotations
+
+import numpy as np
+from numpy.lib.stride_tricks import as_strided
+
+
+def sliding_window_matrix(X: np.ndarray, window_size: int) -> np.ndarray:
+    """Return the flattened sliding windows of `X` as a zero-copy view.
+
+    Row ``i`` of the result equals ``X[i : i + window_size].reshape(-1)``, i.e. the
+    ``(N, T*F)`` design matrix that TabPFN consumes. Only windows that have a "next
+    step" label are included, so ``N = len(X) - window_size``, matching the labels
+    ``y[window_size:]``.
+
+    For a C-contiguous ``(n, F)`` array the rows of a window are adjacent in memory,
+    so window ``i`` is simply the ``T*F`` elements starting at ``X[i]``. This lets us
+    express the flattened windows with strides alone, which
+    `numpy.lib.stride_tricks.sliding_window_view` cannot do (its ``(N, T, F)`` output
+    has to be copied to be reshaped to ``(N, T*F)``).
+
+    The view is read-only, as its rows overlap in memory. Index it with an integer
+    array (see `gather_rows`) to obtain a contiguous copy of just the rows needed.
+
+    Args:
+        X: The ``(n, F)`` sensor history. Copied only if it is not C-contiguous.
+        window_size: The number of time steps per window.
+    """
+    X = np.ascontiguousarray(X)
+    n_rows, n_features = X.shape
+    n_windows = max(n_rows - window_size, 0)
+    return as_strided(
+        X,
+        shape=(n_windows, window_size * n_features),
+        strides=(X.strides[0], X.strides[1]),
+        writeable=False,
+    )
+
+
+def gather_rows(X: np.ndarray, rows: np.ndarray | slice) -> np.ndarray:
+    """Materialise the selected rows of a window view into a contiguous array."""
+    return np.ascontiguousarray(X[rows])
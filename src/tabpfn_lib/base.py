@@ -4,6 +4,8 @@
 
 from __future__ import annotations
 
+import logging
+import os
 import pathlib
 import warnings
 from collections.abc import Sequence
@@ -16,6 +18,7 @@ from tabpfn_lib.architectures.base.bar_distribution import FullSupportBarDistrib
 
 # --- TabPFN imports ---
 from tabpfn_lib.constants import (
+    AUTO_FIT_MODE_MEMORY_FRACTION,
     AUTOCAST_DTYPE_BYTE_SIZE,
     DEFAULT_DTYPE_BYTE_SIZE,
     ModelPath,
@@ -23,13 +26,18 @@ from tabpfn_lib.constants import (
     YType,
 )
 from tabpfn_lib.inference import (
+    EngineMemoryEstimate,
     InferenceEngine,
     InferenceEngineBatchedNoPreprocessing,
     InferenceEngineCacheKV,
     InferenceEngineCachePreprocessing,
     InferenceEngineOnDemand,
+    KVCacheProgress,
+    PinnedContextPrefix,
+    estimate_engine_memory,
 )
 from tabpfn_lib.model_loading import load_model_criterion_config, resolve_model_version
+from tabpfn_lib.parallel_execute import ParallelBackend
 from tabpfn_lib.preprocessing import (
     BaseDatasetConfig,
     ClassifierDatasetConfig,
@@ -55,6 +63,8 @@ if TYPE_CHECKING:
     from tabpfn_lib.inference_config import InferenceConfig
     from tabpfn_lib.regressor import TabPFNRegressor
 
+logger = logging.getLogger(__name__)
+
 
 class BaseModelSpecs:
     """Base class for model specifications."""
@@ -274,6 +284,137 @@ def determine_precision(
     return use_autocast_, forced_inference_dtype_, byte_size
 
 
+AutoFitMode = Literal["low_memory", "fit_preprocessors", "fit_with_cache"]
+
+# The engines that `fit_mode="auto"` chooses from, fastest first.
+_AUTO_FIT_MODES: tuple[AutoFitMode, ...] = (
+    "fit_with_cache",
+    "fit_preprocessors",
+    "low_memory",
+)
+
+
+def select_fit_mode(  # noqa: PLR0913
+    *,
+    models: list[Architecture],
+    n_train: int,
+    n_test: int,
+    n_features: int,
+    n_estimators: int,
+    devices_: Sequence[torch.device],
+    byte_size: int,
+    candidates: Sequence[AutoFitMode] = _AUTO_FIT_MODES,
+    memory_budget_bytes: int | None = None,
+) -> tuple[AutoFitMode, list[EngineMemoryEstimate]]:
+    """Pick the fastest engine whose estimated memory fits into the free memory.
+
+    The engines are tried fastest first, see `estimate_engine_memory()` for the
+    estimates. An engine fits if its host memory fits into the free CPU memory and
+    its device memory into the free memory of every inference device, each scaled by
+    `AUTO_FIT_MODE_MEMORY_FRACTION`. CPU devices share the CPU memory with the host
+    state. If no engine fits, the one with the smallest estimate is used.
+
+    Args:
+        models: The loaded TabPFN models.
+        n_train: The number of context rows.
+        n_test: The number of test rows per predict.
+        n_features: The number of features before preprocessing.
+        n_estimators: The number of ensemble members.
+        devices_: The devices for inference.
+        byte_size: Byte size for the chosen inference precision.
+        candidates: The engines to choose from, fastest first.
+        memory_budget_bytes: If given, used as the free memory of every device and
+            the host instead of querying it.
+
+    Returns:
+        The chosen fit mode and the estimates of all candidates. The decision is
+        also logged at INFO level.
+    """
+    fraction = AUTO_FIT_MODE_MEMORY_FRACTION
+    host_budget = (
+        memory_budget_bytes
+        if memory_budget_bytes is not None
+        else _free_host_memory_bytes()
+    )
+    device_budgets = [
+        memory_budget_bytes
+        if memory_budget_bytes is not None
+        else _free_device_memory_bytes(device)
+        for device in devices_
+    ]
+    n_cpu_devices = sum(device.type == "cpu" for device in devices_)
+
+    def _fits(estimate: EngineMemoryEstimate) -> bool:
+        host_bytes = estimate.host_bytes + n_cpu_devices * estimate.device_bytes
+        if host_budget is not None and host_bytes > fraction * host_budget:
+            return False
+        return all(
+            budget is None or estimate.device_bytes <= fraction * budget
+            for device, budget in zip(devices_, device_budgets)
+            if device.type != "cpu"
+        )
+
+    estimates = [
+        estimate_engine_memory(
+            fit_mode,
+            models=models,
+            n_train=n_train,
+            n_test=n_test,
+            n_features=n_features,
+            n_estimators=n_estimators,
+            n_devices=len(devices_),
+            dtype_byte_size=byte_size,
+        )
+        for fit_mode in candidates
+    ]
+    fitting = [estimate for estimate in estimates if _fits(estimate)]
+    if fitting:
+        chosen = fitting[0]
+    else:
+        chosen = min(estimates, key=lambda e: (e.device_bytes, e.host_bytes))
+
+    logger.info(
+        'fit_mode="auto" chose %r for %d train rows, %d test rows, %d features and '
+        "%d estimators (free host memory: %s, free device memory: %s):\n%s",
+        chosen.fit_mode,
+        n_train,
+        n_test,
+        n_features,
+        n_estimators,
+        _format_bytes(host_budget),
+        ", ".join(
+            f"{device}={_format_bytes(budget)}"
+            for device, budget in zip(devices_, device_budgets)
+        ),
+        "\n".join(
+            f"  {e.fit_mode}: host {_format_bytes(e.host_bytes)}, device "
+            f"{_format_bytes(e.device_bytes)}, {'fits' if _fits(e) else 'too large'}"
+            for e in estimates
+        ),
+    )
+    return chosen.fit_mode, estimates
+
+
+def _free_host_memory_bytes() -> int | None:
+    try:
+        return os.sysconf("SC_AVPHYS_PAGES") * os.sysconf("SC_PAGE_SIZE")
+    except (AttributeError, ValueError, OSError):
+        return None
+
+
+def _free_device_memory_bytes(device: torch.device) -> int | None:
+    if device.type == "cuda":
+        free, _ = torch.cuda.mem_get_info(device)
+        return free
+    if device.type == "cpu":
+        return _free_host_memory_bytes()
+    return None
+
+
+def _format_bytes(n_bytes: int | None) -> str:
+    return "unknown" if n_bytes is None else f"{n_bytes / 2**20:.0f} MiB"
+
+
 def create_inference_engine(  # noqa: PLR0913
     *,
     X_train: np.ndarray,
@@ -281,7 +422,9 @@ def create_inference_engine(  # noqa: PLR0913
     models: list[Architecture],
     ensemble_configs: Any,
     cat_ix: list[int],
-    fit_mode: Literal["low_memory", "fit_preprocessors", "fit_with_cache", "batched"],
+    fit_mode: Literal[
+        "low_memory", "fit_preprocessors", "fit_with_cache", "batched", "auto"
+    ],
     devices_: Sequence[torch.device],
     rng: np.random.Generator,
     n_preprocessing_jobs: int,
@@ -290,6 +433,13 @@ def create_inference_engine(  # noqa: PLR0913
     memory_saving_mode: bool | Literal["auto"] | float | int,
     use_autocast_: bool,
     inference_mode: bool = True,
+    pinned_prefix: PinnedContextPrefix | None = None,
+    kv_cache_progress: Callable[[KVCacheProgress], None] | None = None,
+    member_batch_size: int = 1,
+    preprocessing_queue_depth: int = 0,
+    n_test_rows_hint: int | None = None,
+    auto_memory_budget_bytes: int | None = None,
+    parallel_backend: ParallelBackend = "thread",
 ) -> InferenceEngine:
     """Creates the appropriate TabPFN inference engine based on `fit_mode`.
 
@@ -304,7 +454,9 @@ def create_inference_engine(  # noqa: PLR0913
         models: The loaded TabPFN models.
         ensemble_configs: The ensemble configurations to create multiple "prompts".
         cat_ix: Indices of inferred categorical features.
-        fit_mode: Determines how we prepare inference (pre-cache or not).
+        fit_mode: Determines how we prepare inference (pre-cache or not). With
+            `"auto"`, the fastest engine that fits into the free memory is chosen,
+            see `select_fit_mode()`.
         devices_: The devices for inference.
         rng: Numpy random generator.
         n_preprocessing_jobs: Number of parallel CPU workers to use for the
@@ -315,6 +467,26 @@ def create_inference_engine(  # noqa: PLR0913
         use_autocast_: Whether we use torch.autocast for inference.
         inference_mode: Whether to use torch.inference_mode (set False if
             backprop is needed)
+        pinned_prefix: Only for `fit_mode="fit_preprocessors"` and
+            `fit_mode="fit_with_cache"`. If given, the context is this prefix
+            followed by `X_train`, and the preprocessing of the prefix is reused
+            where possible, see `PinnedContextPrefix`.
+        kv_cache_progress: Only for `fit_mode="fit_with_cache"`. If given, called
+            once the KV cache of each ensemble member is built.
+        member_batch_size: Only for `fit_mode="fit_preprocessors"`. The maximum
+            number of ensemble members to evaluate in one forward pass, see
+            `InferenceEngineCachePreprocessing.prepare()`.
+        preprocessing_queue_depth: Only for `fit_mode="low_memory"`. The number of
+            ensemble members to preprocess ahead of the model forward passes in a
+            background thread, see `InferenceEngineOnDemand.prepare()`. 0 disables
+            the pipelining.
+        n_test_rows_hint: Only for `fit_mode="auto"`. The expected number of test
+            rows per predict. Defaults to the number of training rows.
+        auto_memory_budget_bytes: Only for `fit_mode="auto"`. If given, used as the
+            free memory instead of querying the host and the devices.
+        parallel_backend: Only for `fit_mode="fit_preprocessors"`. With
+            ``"process"``, several CPU devices run the ensemble members in worker
+            processes instead of threads, see `parallel_execute()`.
     """
     engine: (
         InferenceEngineOnDemand
@@ -322,6 +494,35 @@ def create_inference_engine(  # noqa: PLR0913
         | InferenceEngineCacheKV
         | InferenceEngineBatchedNoPreprocessing
     )
+    if fit_mode == "auto":
+        n_train = len(X_train)
+        if pinned_prefix is not None:
+            n_train += len(pinned_prefix.X_prefix)
+        fit_mode, _ = select_fit_mode(
+            models=models,
+            n_train=n_train,
+            n_test=n_test_rows_hint if n_test_rows_hint is not None else n_train,
+            n_features=X_train.shape[1],
+            n_estimators=len(ensemble_configs),
+            devices_=devices_,
+            byte_size=byte_size,
+            candidates=(
+                _AUTO_FIT_MODES
+                if pinned_prefix is None
+                else ("fit_with_cache", "fit_preprocessors")
+            ),
+            memory_budget_bytes=auto_memory_budget_bytes,
+        )
+
+    if pinned_prefix is not None and fit_mode not in (
+        "fit_preprocessors",
+        "fit_with_cache",
+    ):
+        raise ValueError(
+            "A pinned context prefix is only supported with "
+            'fit_mode="fit_preprocessors" or fit_mode="fit_with_cache".'
+        )
+
     if fit_mode == "low_memory":
         engine = InferenceEngineOnDemand.prepare(
             X_train=X_train,
@@ -334,6 +535,23 @@ def create_inference_engine(  # noqa: PLR0913
             dtype_byte_size=byte_size,
             force_inference_dtype=forced_inference_dtype_,
             save_peak_mem=memory_saving_mode,
+            preprocessing_queue_depth=preprocessing_queue_depth,
+        )
+    elif fit_mode == "fit_preprocessors" and pinned_prefix is not None:
+        engine = InferenceEngineCachePreprocessing.prepare_with_prefix(
+            pinned_prefix,
+            X_train=X_train,
+            y_train=y_train,
+            cat_ix=cat_ix,
+            models=models,
+            n_preprocessing_jobs=n_preprocessing_jobs,
+            rng=rng,
+            dtype_byte_size=byte_size,
+            force_inference_dtype=forced_inference_dtype_,
+            save_peak_mem=memory_saving_mode,
+            inference_mode=inference_mode,
+            max_member_batch_size=member_batch_size,
+            parallel_backend=parallel_backend,
         )
     elif fit_mode == "fit_preprocessors":
         engine = InferenceEngineCachePreprocessing.prepare(
@@ -348,6 +566,8 @@ def create_inference_engine(  # noqa: PLR0913
             force_inference_dtype=forced_inference_dtype_,
             save_peak_mem=memory_saving_mode,
             inference_mode=inference_mode,
+            max_member_batch_size=member_batch_size,
+            parallel_backend=parallel_backend,
         )
     elif fit_mode == "fit_with_cache":
         engine = InferenceEngineCacheKV.prepare(
@@ -363,6 +583,8 @@ def create_inference_engine(  # noqa: PLR0913
             force_inference_dtype=forced_inference_dtype_,
             save_peak_mem=memory_saving_mode,
             autocast=use_autocast_,
+            pinned_prefix=pinned_prefix,
+            progress=kv_cache_progress,
         )
     elif fit_mode == "batched":
         engine = InferenceEngineBatchedNoPreprocessing.prepare(
@@ -51,6 +51,15 @@ DEFAULT_NUMPY_PREPROCESSING_DTYPE = np.float64
 # TODO(eddiebergman): Maybe make these a parameter
 MEMORY_SAFETY_FACTOR = 5.0  # Taken as default from function
 
+# Rough number of activation values held per test cell at the widest point of a
+# forward pass (embedding size 192 times the MLP hidden factor 4 of TabPFN v2).
+# Used to size the test chunks when streaming predictions under a memory budget.
+TEST_CELL_ACTIVATION_ELEMENTS = 192 * 4
+
+# The fraction of the free memory that `fit_mode="auto"` lets an engine plan for, the
+# rest is headroom for the estimation error and other allocations.
+AUTO_FIT_MODE_MEMORY_FRACTION = 0.8
+
 
 # TODO(eddiebergman): Pulled from `def get_ensemble_configurations()`
 ENSEMBLE_CONFIGURATION_MAX_STEP = 2
@@ -5,14 +5,22 @@
 from __future__ import annotations
 
 import itertools
+import json
+import os
+import pickle
+import queue
+import shutil
+import time
 from abc import ABC, abstractmethod
-from collections.abc import Iterator, Sequence
-from copy import deepcopy
-from dataclasses import dataclass
+from collections import OrderedDict
+from collections.abc import Callable, Iterable, Iterator, Sequence
+from contextlib import nullcontext
+from copy import copy, deepcopy
+from dataclasses import dataclass, field, replace
 from functools import partial
 from pathlib import Path
-from threading import Lock
-from typing import TYPE_CHECKING, Literal
+from threading import Event, Lock, Thread
+from typing import TYPE_CHECKING, Literal, TypeVar
 from typing_extensions import override
 
 import joblib
@@ -23,7 +31,16 @@ from tabpfn_lib.architectures.base.memory import (
     DEFAULT_SAVE_PEAK_MEMORY_FACTOR,
     should_save_peak_mem,
 )
-from tabpfn_lib.parallel_execute import parallel_execute
+from tabpfn_lib.constants import (
+    DEFAULT_NUMPY_PREPROCESSING_DTYPE,
+    TEST_CELL_ACTIVATION_ELEMENTS,
+)
+from tabpfn_lib.parallel_execute import (
+    MappedModule,
+    ParallelBackend,
+    parallel_execute,
+    shared_tensor,
+)
 from tabpfn_lib.preprocessing import fit_preprocessing
 from tabpfn_lib.utils import get_autocast_context
 
@@ -32,6 +49,10 @@ if TYPE_CHECKING:
     from tabpfn_lib.preprocessing import EnsembleConfig
     from tabpfn_lib.preprocessors import SequentialFeatureTransformer
 
+ModelResidencyPolicy = Literal["evict_after_predict", "pin", "lru"]
+
+T = TypeVar("T")
+
 
 @dataclass
 class InferenceEngine(ABC):
@@ -116,6 +137,36 @@ class InferenceEngine(ABC):
             "This inference engine does not support torch.inference_mode changes."
         )
 
+    def set_model_residency(
+        self,
+        policy: ModelResidencyPolicy,
+        *,
+        memory_budget_bytes: int | None = None,
+    ) -> None:
+        """Set whether the models stay on their devices between predictions.
+
+        Args:
+            policy: One of
+                - ``"evict_after_predict"`` (default): the models are moved back to
+                  the CPU at the end of every `iter_outputs()`.
+                - ``"pin"``: the models stay on their devices until `release_models()`
+                  is called.
+                - ``"lru"``: the models stay on their devices, but when a model is
+                  moved to a device, the least recently used models on that device
+                  are moved back to the CPU until the weights on the device fit into
+                  `memory_budget_bytes`.
+            memory_budget_bytes: The weight memory per device for ``"lru"``.
+        """
+        residency = _ModelResidency(policy, memory_budget_bytes=memory_budget_bytes)
+        self.release_models()
+        for model_cache in self.model_caches:
+            model_cache.residency = residency
+
+    def release_models(self) -> None:
+        """Move all models back to the CPU, whatever the residency policy."""
+        for model_cache in self.model_caches:
+            model_cache.release()
+
     def save_state_except_model_weights(self, path: str | Path) -> None:
         """Persist the executor state to ``path`` without the model weights.
 
@@ -124,10 +175,37 @@ class InferenceEngine(ABC):
         """
         _raise_if_kv_cache_enabled_on_save_or_load(self)
 
-        state_copy = deepcopy(self)
+        # A shallow copy suffices, only the reference to the models is dropped.
+        state_copy = copy(self)
         state_copy.model_caches = None  # type: ignore
         joblib.dump(state_copy, path)
 
+    def save_snapshot(self, path: str | Path) -> None:
+        """Persist the fitted engine to the directory ``path`` for a fast reload.
+
+        Unlike `save_state_except_model_weights()`, this supports all engines,
+        including the KV cache, and does not copy the engine in memory. Large arrays
+        and tensors (the cached train sets, the KV tensors and large fitted
+        preprocessor state) are written as separate ``.npy`` files, which
+        `load_snapshot()` memory-maps instead of reading them. The model weights are
+        not saved, they are referenced by name and taken from the models passed to
+        `load_snapshot()`.
+        """
+        _save_snapshot(self, Path(path))
+
+    @staticmethod
+    def load_snapshot(path: str | Path, models: list[Architecture]) -> InferenceEngine:
+        """Load an engine saved with `save_snapshot()`.
+
+        Args:
+            path: The snapshot directory.
+            models: The models the engine was fitted with, in the same order.
+
+        Returns:
+            The engine, with all models on the CPU and the default model residency.
+        """
+        return _load_snapshot(Path(path), models)
+
     @staticmethod
     def load_state(path: str | Path, models: list[Architecture]) -> InferenceEngine:
         """Load an executor saved to disk with save_state_except_model_weights().
@@ -147,7 +225,8 @@ def _raise_if_kv_cache_enabled_on_save_or_load(engine: InferenceEngine) -> None:
     if isinstance(engine, InferenceEngineCacheKV):
         raise NotImplementedError(
             "Saving and loading fitted models that use "
-            '`fit_mode="fit_with_cache"` is not currently supported.'
+            '`fit_mode="fit_with_cache"` is not supported by this format, use '
+            "`save_snapshot()` instead."
         )
 
 
@@ -167,6 +246,7 @@ class InferenceEngineOnDemand(InferenceEngine):
     n_preprocessing_jobs: int
     force_inference_dtype: torch.dtype | None
     ensemble_configs: list[EnsembleConfig]
+    preprocessing_queue_depth: int = 0
 
     @classmethod
     def prepare(
@@ -182,6 +262,7 @@ class InferenceEngineOnDemand(InferenceEngine):
         dtype_byte_size: int,
         force_inference_dtype: torch.dtype | None,
         save_peak_mem: bool | Literal["auto"] | float | int,
+        preprocessing_queue_depth: int = 0,
     ) -> InferenceEngineOnDemand:
         """Prepare the inference engine.
 
@@ -196,6 +277,12 @@ class InferenceEngineOnDemand(InferenceEngine):
             dtype_byte_size: The byte size of the dtype.
             force_inference_dtype: The dtype to force inference to.
             save_peak_mem: Whether to save peak memory usage.
+            preprocessing_queue_depth: If above 0, the ensemble members are
+                preprocessed in a background thread, up to this many members ahead
+                of the model forward passes, so that the CPU preprocessing overlaps
+                with the forwards. Each queued member holds its preprocessed train
+                and test sets in memory. If 0, every member is preprocessed right
+                before its forward pass.
         """
         # We save it as a static seed to be reproducible across predicts
         static_seed = rng.integers(0, int(np.iinfo(np.int32).max))
@@ -210,6 +297,7 @@ class InferenceEngineOnDemand(InferenceEngine):
             dtype_byte_size=dtype_byte_size,
             force_inference_dtype=force_inference_dtype,
             save_peak_mem=save_peak_mem,
+            preprocessing_queue_depth=preprocessing_queue_depth,
         )
 
     @override
@@ -241,7 +329,17 @@ class InferenceEngineOnDemand(InferenceEngine):
             dtype_byte_size=self.dtype_byte_size,
         )
 
-        ensemble_configs, preprocessings = itertools.tee(preprocessed_data_iterator)
+        preprocessed_members = (
+            (config, X_train, preprocessor.transform(X).X, y_train, cat_ix)
+            for config, preprocessor, X_train, y_train, cat_ix in (
+                preprocessed_data_iterator
+            )
+        )
+        if self.preprocessing_queue_depth > 0:
+            preprocessed_members = _prefetch_in_thread(
+                preprocessed_members, depth=self.preprocessing_queue_depth
+            )
+        ensemble_configs, preprocessings = itertools.tee(preprocessed_members)
 
         if self.force_inference_dtype is not None:
             for model_cache in self.model_caches:
@@ -251,7 +349,7 @@ class InferenceEngineOnDemand(InferenceEngine):
             partial(
                 self._call_model,
                 X_train=X_train,
-                X_test=preprocessor.transform(X).X,
+                X_test=X_test,
                 y_train=y_train,
                 cat_ix=cat_ix,
                 only_return_standard_out=only_return_standard_out,
@@ -259,7 +357,7 @@ class InferenceEngineOnDemand(InferenceEngine):
                 model_index=config._model_index,
                 save_peak_mem=save_peak_mem,
             )
-            for config, preprocessor, X_train, y_train, cat_ix in preprocessings
+            for config, X_train, X_test, y_train, cat_ix in preprocessings
         )
         outputs = parallel_execute(devices, model_forward_functions)
 
@@ -267,7 +365,7 @@ class InferenceEngineOnDemand(InferenceEngine):
             yield _move_and_squeeze_output(output, devices[0]), config
 
         for model_cache in self.model_caches:
-            model_cache.to_cpu()
+            model_cache.end_predict()
 
     def _call_model(
         self,
@@ -417,7 +515,7 @@ class InferenceEngineBatchedNoPreprocessing(InferenceEngine):
 
             yield output, self.ensemble_configs[i]
         if self.inference_mode:
-            [model_cache.to_cpu() for model_cache in self.model_caches]
+            [model_cache.end_predict() for model_cache in self.model_caches]
 
     @override
     def use_torch_inference_mode(self, *, use_inference: bool) -> None:
@@ -446,6 +544,11 @@ class InferenceEngineCachePreprocessing(InferenceEngine):
     inference_mode: bool
     ensemble_configs: list[EnsembleConfig]
     no_preprocessing: bool = False
+    max_member_batch_size: int = 1
+    parallel_backend: ParallelBackend = "thread"
+    context_buffers: _ContextBuffers = field(
+        default_factory=lambda: _ContextBuffers(), repr=False
+    )
 
     @classmethod
     def prepare(  # noqa: PLR0913
@@ -463,6 +566,8 @@ class InferenceEngineCachePreprocessing(InferenceEngine):
         save_peak_mem: bool | Literal["auto"] | float | int,
         inference_mode: bool,
         no_preprocessing: bool = False,
+        max_member_batch_size: int = 1,
+        parallel_backend: ParallelBackend = "thread",
     ) -> InferenceEngineCachePreprocessing:
         """Prepare the inference engine.
 
@@ -481,6 +586,17 @@ class InferenceEngineCachePreprocessing(InferenceEngine):
                 (this is quicker but disables backpropagation)
             no_preprocessing: If turned of, the preprocessing on the test
                 tensors is tuned off. Used for differentiablity.
+            max_member_batch_size: If above 1, up to this many ensemble members
+                that use the same model and have equally shaped contexts are
+                evaluated in a single forward pass, stacked along the batch axis.
+                This does not change the predictions, but uses the accelerator
+                better at the cost of more memory per forward pass.
+            parallel_backend: With ``"process"`` and several CPU devices, the test
+                preprocessing and the forward passes run in worker processes, see
+                `parallel_execute()`. The workers read the cached training sets from
+                shared memory and the models from memory-mapped files. Only used in
+                inference mode; otherwise, and with a single or non-CPU devices, the
+                members run in threads.
 
         Returns:
             The prepared inference engine.
@@ -508,6 +624,8 @@ class InferenceEngineCachePreprocessing(InferenceEngine):
             save_peak_mem=save_peak_mem,
             inference_mode=inference_mode,
             no_preprocessing=no_preprocessing,
+            max_member_batch_size=max_member_batch_size,
+            parallel_backend=parallel_backend,
         )
 
     @override
@@ -518,16 +636,109 @@ class InferenceEngineCachePreprocessing(InferenceEngine):
         devices: Sequence[torch.device],
         autocast: bool,
         only_return_standard_out: bool = True,
+    ) -> Iterator[tuple[torch.Tensor | dict, EnsembleConfig]]:
+        yield from self._iter_member_outputs(
+            X,
+            devices=devices,
+            autocast=autocast,
+            only_return_standard_out=only_return_standard_out,
+        )
+
+        if self.inference_mode:
+            self._end_predict()
+
+    @override
+    def release_models(self) -> None:
+        super().release_models()
+        self.context_buffers.clear()
+
+    def _end_predict(self) -> None:
+        for model_cache in self.model_caches:
+            model_cache.end_predict()
+        # The train sets leave a device together with the model they are fed to.
+        self.context_buffers.clear(
+            keep=lambda members, device: self.model_caches[
+                self.ensemble_configs[members[0]]._model_index
+            ].is_on(device)
+        )
+
+    def iter_output_chunks(
+        self,
+        X: np.ndarray | torch.Tensor,
+        *,
+        devices: Sequence[torch.device],
+        autocast: bool,
+        chunk_size: int | None = None,
+        memory_budget_bytes: int | None = None,
+        only_return_standard_out: bool = True,
+    ) -> Iterator[tuple[slice, list[tuple[torch.Tensor | dict, EnsembleConfig]]]]:
+        """Stream the outputs of all ensemble members over chunks of the test rows.
+
+        `iter_outputs()` transforms and forwards all of `X` at once, so its peak
+        memory grows with ``len(X)``. This splits `X` into chunks of rows and runs
+        every chunk through all ensemble members before moving on to the next one,
+        so only one chunk is held at a time. The models stay on the devices until
+        the last chunk has been processed, then the residency policy applies.
+
+        Args:
+            X: The input data to make predictions on.
+            devices: The devices to run the model on.
+            autocast: Whether to use torch.autocast during inference.
+            chunk_size: The number of test rows per chunk. If None, it is derived
+                from `memory_budget_bytes`.
+            memory_budget_bytes: The memory to allow for the test rows of a forward
+                pass, estimated from the number of features. If both this and
+                `chunk_size` are None, `X` is processed as a single chunk.
+            only_return_standard_out: Whether to only return the standard output.
+
+        Yields:
+            The rows of `X` covered by the chunk, and the outputs of every ensemble
+            member for these rows with their ensemble configuration.
+        """
+        n_rows = len(X)
+        if chunk_size is None:
+            chunk_size = (
+                _test_chunk_size(X.shape[1], self.dtype_byte_size, memory_budget_bytes)
+                if memory_budget_bytes is not None
+                else n_rows
+            )
+        chunk_size = max(chunk_size, 1)
+
+        try:
+            for start in range(0, n_rows, chunk_size):
+                rows = slice(start, min(start + chunk_size, n_rows))
+                outputs = list(
+                    self._iter_member_outputs(
+                        X[rows],
+                        devices=devices,
+                        autocast=autocast,
+                        only_return_standard_out=only_return_standard_out,
+                    )
+                )
+                yield rows, outputs
+        finally:
+            if self.inference_mode:
+                self._end_predict()
+
+    def _iter_member_outputs(
+        self,
+        X: np.ndarray | torch.Tensor,
+        *,
+        devices: Sequence[torch.device],
+        autocast: bool,
+        only_return_standard_out: bool,
     ) -> Iterator[tuple[torch.Tensor | dict, EnsembleConfig]]:
         if self.force_inference_dtype is not None:
             for model_cache in self.model_caches:
                 model_cache.set_dtype(self.force_inference_dtype)
 
         if self.inference_mode:
+            # A batch of members needs the memory of as many test sets.
+            n_rows, n_features = X.shape
             save_peak_mem = should_save_peak_mem(
                 memory_saving_mode=self.save_peak_mem,
                 X_train_shape=self.X_train_shape_before_preprocessing,
-                X_test_shape=tuple[int, int](X.shape),
+                X_test_shape=(n_rows * max(self.max_member_batch_size, 1), n_features),
                 devices=devices,
                 dtype_byte_size=self.dtype_byte_size,
             )
@@ -537,65 +748,286 @@ class InferenceEngineCachePreprocessing(InferenceEngine):
         def _transform_X_test(i: int) -> np.ndarray | torch.Tensor:
             return X if self.no_preprocessing else self.preprocessors[i].transform(X).X
 
-        model_forward_functions = (
-            partial(
-                self._call_model,
-                X_train=self.X_trains[i],
-                X_test=_transform_X_test(i),
-                y_train=self.y_trains[i],
-                cat_ix=self.cat_ixs[i],
+        member_batches = self._member_batches(
+            only_return_standard_out=only_return_standard_out
+        )
+        # Worker processes only pay off with several CPU devices, see
+        # `parallel_execute()`; otherwise the members run in threads.
+        use_processes = (
+            self.parallel_backend == "process"
+            and self.inference_mode
+            and len(devices) > 1
+            and all(device.type == "cpu" for device in devices)
+        )
+        backend = "process" if use_processes else "thread"
+        if use_processes:
+            model_forward_functions = self._process_forward_functions(
+                X,
+                member_batches,
                 autocast=autocast,
                 only_return_standard_out=only_return_standard_out,
-                model_index=self.ensemble_configs[i]._model_index,
                 save_peak_mem=save_peak_mem,
             )
-            for i in range(len(self.ensemble_configs))
+        else:
+            model_forward_functions = (
+                partial(
+                    self._call_model,
+                    members=members,
+                    X_tests=[_transform_X_test(i) for i in members],
+                    autocast=autocast,
+                    only_return_standard_out=only_return_standard_out,
+                    save_peak_mem=save_peak_mem,
+                )
+                for members in member_batches
+            )
+        # Members with larger (e.g. not subsampled) contexts are started first.
+        costs = [
+            sum(self.X_trains[i].shape[0] * self.X_trains[i].shape[1] for i in members)
+            for members in member_batches
+        ]
+        outputs = parallel_execute(
+            devices, model_forward_functions, costs=costs, backend=backend
         )
-        outputs = parallel_execute(devices, model_forward_functions)
 
-        for output, i in zip(outputs, range(len(self.ensemble_configs))):
-            yield _move_and_squeeze_output(output, devices[0]), self.ensemble_configs[i]
+        # Yield the outputs in the order of the members, as soon as they are ready.
+        ready: dict[int, torch.Tensor | dict] = {}
+        next_member = 0
+        for members, output in zip(member_batches, outputs):
+            if len(members) == 1:
+                ready[members[0]] = output
+            else:
+                for j, i in enumerate(members):
+                    ready[i] = output[:, j : j + 1]
+            while next_member in ready:
+                yield (
+                    _move_and_squeeze_output(ready.pop(next_member), devices[0]),
+                    self.ensemble_configs[next_member],
+                )
+                next_member += 1
 
-        if self.inference_mode:
-            for model_cache in self.model_caches:
-                model_cache.to_cpu()
+    def _process_forward_functions(
+        self,
+        X: np.ndarray | torch.Tensor,
+        member_batches: list[list[int]],
+        *,
+        autocast: bool,
+        only_return_standard_out: bool,
+        save_peak_mem: bool,
+    ) -> Iterator[partial[torch.Tensor | dict[str, torch.Tensor]]]:
+        # The functions for ``parallel_backend="process"``: module-level, and with
+        # all tensors in shared memory, so that pickling them copies no data. The test
+        # preprocessing runs in the workers as well.
+        X_shared = shared_tensor(X)
+        for members in member_batches:
+            X_train, y_train = self.context_buffers.shared_train_set(
+                tuple(members),
+                lambda members=members: (
+                    _stack_members([self.X_trains[i] for i in members]),
+                    _stack_members([self.y_trains[i] for i in members]),
+                ),
+            )
+            model_index = self.ensemble_configs[members[0]]._model_index
+            yield partial(
+                _forward_members_in_process,
+                model=self.model_caches[model_index].mapped(),
+                preprocessors=(
+                    None
+                    if self.no_preprocessing
+                    else [self.preprocessors[i] for i in members]
+                ),
+                X=X_shared,
+                X_train=X_train,
+                y_train=y_train,
+                cat_ixs=[self.cat_ixs[i] for i in members],
+                force_inference_dtype=self.force_inference_dtype,
+                autocast=autocast,
+                only_return_standard_out=only_return_standard_out,
+                save_peak_mem=save_peak_mem,
+            )
+
+    def _member_batches(self, *, only_return_standard_out: bool) -> list[list[int]]:
+        # Group the members that can share a forward pass: the same model and
+        # context shape. The batch axis of non-standard outputs is not known, so these
+        # are never batched.
+        n_members = len(self.ensemble_configs)
+        if self.max_member_batch_size <= 1 or not only_return_standard_out:
+            return [[i] for i in range(n_members)]
+
+        batches: list[list[int]] = []
+        open_batches: dict[tuple[int, int, int], list[int]] = {}
+        for i in range(n_members):
+            key = (
+                self.ensemble_configs[i]._model_index,
+                self.X_trains[i].shape[1],
+                len(self.y_trains[i]),
+            )
+            batch = open_batches.get(key)
+            if batch is None or len(batch) >= self.max_member_batch_size:
+                batch = []
+                open_batches[key] = batch
+                batches.append(batch)
+            batch.append(i)
+        return batches
+
+    def with_train_set(
+        self,
+        X_train: np.ndarray | torch.Tensor,
+        y_train: np.ndarray | torch.Tensor,
+    ) -> InferenceEngineCachePreprocessing:
+        """Return a copy of the engine that uses a different training set as context.
+
+        The preprocessors fitted in `prepare()` are not re-fitted, they are only used
+        to transform the new training set. This is much cheaper than `prepare()`, but
+        is only appropriate if the new training set is drawn from the same
+        distribution as the one the preprocessors were fitted on, e.g. a retrieved
+        context that overlaps heavily with the previous one.
+
+        Only classification ensembles without row subsampling are supported, as
+        these map each training row to exactly one context row.
+
+        Args:
+            X_train: The new training data, in the same space as the `X_train` that
+                was passed to `prepare()`.
+            y_train: The new training target, encoded as in `prepare()`.
+        """
+        X_trains = []
+        y_trains = []
+        for config, preprocessor in zip(self.ensemble_configs, self.preprocessors):
+            X, y = _transform_train_set(
+                config,
+                None if self.no_preprocessing else preprocessor,
+                X_train,
+                y_train,
+            )
+            X_trains.append(X)
+            y_trains.append(y)
+
+        return replace(
+            self,
+            X_trains=X_trains,
+            y_trains=y_trains,
+            context_buffers=_ContextBuffers(),
+            X_train_shape_before_preprocessing=tuple[int, int](X_train.shape),
+        )
+
+    @classmethod
+    def prepare_with_prefix(  # noqa: PLR0913
+        cls,
+        prefix: PinnedContextPrefix,
+        X_train: np.ndarray | torch.Tensor,
+        y_train: np.ndarray | torch.Tensor,
+        *,
+        cat_ix: list[int],
+        models: list[Architecture],
+        n_preprocessing_jobs: int,
+        rng: np.random.Generator,
+        dtype_byte_size: int,
+        force_inference_dtype: torch.dtype | None,
+        save_peak_mem: bool | Literal["auto"] | float | int,
+        inference_mode: bool,
+        max_member_batch_size: int = 1,
+        parallel_backend: ParallelBackend = "thread",
+    ) -> InferenceEngineCachePreprocessing:
+        """Prepare the engine on a context made of a pinned prefix plus `X_train`.
+
+        For the ensemble members whose preprocessing is fit-stable (see
+        `PinnedContextPrefix`), the transformed prefix is reused and only `X_train`
+        is transformed, with the preprocessors fitted on the prefix. The other
+        members are fitted on the concatenated context, as in `prepare()`.
+
+        Args:
+            prefix: The pinned prefix, fitted with the same ensemble configurations
+                that `prepare()` would receive.
+            X_train: The context rows that follow the prefix.
+            y_train: The targets of `X_train`.
+            See `prepare()` for the other arguments.
+        """
+        members = _preprocess_with_prefix(
+            prefix,
+            X_train,
+            y_train,
+            cat_ix=cat_ix,
+            n_preprocessing_jobs=n_preprocessing_jobs,
+            rng=rng,
+        )
+        configs, preprocessors, X_trains, y_trains, cat_ixs = map(list, zip(*members))
+        X_full_shape = (len(prefix.X_prefix) + len(X_train), X_train.shape[1])
+
+        return InferenceEngineCachePreprocessing(
+            X_trains=X_trains,
+            y_trains=y_trains,
+            X_train_shape_before_preprocessing=X_full_shape,
+            model_caches=[_PerDeviceModelCache(model) for model in models],
+            cat_ixs=cat_ixs,
+            ensemble_configs=configs,
+            preprocessors=preprocessors,
+            dtype_byte_size=dtype_byte_size,
+            force_inference_dtype=force_inference_dtype,
+            save_peak_mem=save_peak_mem,
+            inference_mode=inference_mode,
+            max_member_batch_size=max_member_batch_size,
+            parallel_backend=parallel_backend,
+        )
 
     def _call_model(
         self,
         *,
         device: torch.device,
         is_parallel: bool,
-        X_train: torch.Tensor | np.ndarray,
-        X_test: torch.Tensor | np.ndarray,
-        y_train: torch.Tensor | np.ndarray,
-        cat_ix: list[int],
+        members: list[int],
+        X_tests: list[torch.Tensor | np.ndarray],
         autocast: bool,
         only_return_standard_out: bool,
-        model_index: int,
         save_peak_mem: bool,
     ) -> torch.Tensor | dict[str, torch.Tensor]:
         """Execute a model forward pass on the provided device.
 
+        Several members are evaluated in one forward pass by stacking them along the
+        batch axis, see `_member_batches()`.
+
         Note that several instances of this function may be executed in parallel in
         different threads, one for each device in the system.
         """
         # In parallel mode, the inference engine uses multiple devices. Otherwise, it
         # uses a single device.
+        model_index = self.ensemble_configs[members[0]]._model_index
         model = self.model_caches[model_index].get(device, multiple_devices=is_parallel)
 
-        X_full, y_train = _prepare_model_inputs(
-            device, self.force_inference_dtype, X_train, X_test, y_train
+        # Without gradients, the train rows are kept on the device and the test rows
+        # are written after them, instead of uploading and concatenating both.
+        context_buffer = (
+            self.context_buffers.get(
+                tuple(members), device, self.force_inference_dtype
+            )
+            if self.inference_mode
+            else None
         )
-        batched_cat_ix = [cat_ix]
+        batched_cat_ix = [self.cat_ixs[i] for i in members]
+        X_test = _stack_members(X_tests)
 
         save_peak_memory_factor = (
             DEFAULT_SAVE_PEAK_MEMORY_FACTOR if save_peak_mem else None
         )
 
         with (
+            context_buffer.lock if context_buffer is not None else nullcontext(),
             get_autocast_context(device, enabled=autocast),
             torch.inference_mode(self.inference_mode),
         ):
+            if context_buffer is not None:
+                X_train = y_train = None
+                if not context_buffer.filled:
+                    X_train = _stack_members([self.X_trains[i] for i in members])
+                    y_train = _stack_members([self.y_trains[i] for i in members])
+                X_full, y_train = context_buffer.model_inputs(X_train, X_test, y_train)
+            else:
+                X_full, y_train = _prepare_model_inputs(
+                    device,
+                    self.force_inference_dtype,
+                    _stack_members([self.X_trains[i] for i in members]),
+                    X_test,
+                    _stack_members([self.y_trains[i] for i in members]),
+                )
             return model(
                 X_full,
                 y_train,
@@ -609,14 +1041,196 @@ class InferenceEngineCachePreprocessing(InferenceEngine):
         self.inference_mode = use_inference
 
 
+@dataclass
+class PinnedContextPrefix:
+    """A fixed block of context rows whose preprocessing is computed once.
+
+    Callers that predict with many contexts sharing the same leading rows (e.g. a
+    fixed temporal anchor followed by retrieved rows) can fit the prefix once and
+    pass it to `InferenceEngineCachePreprocessing.prepare_with_prefix()`.
+
+    The prefix is only reused for ensemble members whose preprocessing is
+    fit-stable, i.e. whose fitted state does not depend much on which rows it was
+    fitted on, such that fitting on the prefix alone is a good stand-in for fitting
+    on the whole context. These are classification members without row subsampling,
+    using the ``"none"`` feature transform, without a global transformer and with
+    numeric handling of categoricals. Note that preprocessing steps such as
+    removing constant features are still decided on the prefix. For the other
+    members, `preprocessors[i]` is None and they are fitted on every full context.
+    """
+
+    ensemble_configs: list[EnsembleConfig]
+    preprocessors: list[SequentialFeatureTransformer | None]
+    X_trains: list[np.ndarray | torch.Tensor | None]
+    y_trains: list[np.ndarray | torch.Tensor | None]
+    cat_ixs: list[list[int] | None]
+    X_prefix: np.ndarray | torch.Tensor
+    y_prefix: np.ndarray | torch.Tensor
+
+    @classmethod
+    def fit(
+        cls,
+        X_prefix: np.ndarray | torch.Tensor,
+        y_prefix: np.ndarray | torch.Tensor,
+        *,
+        cat_ix: list[int],
+        ensemble_configs: Sequence[EnsembleConfig],
+        n_preprocessing_jobs: int,
+        rng: np.random.Generator,
+    ) -> PinnedContextPrefix:
+        """Fit the preprocessing of the fit-stable members on the prefix.
+
+        Args:
+            X_prefix: The pinned context rows.
+            y_prefix: The targets of the pinned rows.
+            cat_ix: The categorical indices.
+            ensemble_configs: The ensemble configurations to use.
+            n_preprocessing_jobs: The number of workers to use.
+            rng: The random number generator.
+        """
+        ensemble_configs = list(ensemble_configs)
+        n_members = len(ensemble_configs)
+        preprocessors: list[SequentialFeatureTransformer | None] = [None] * n_members
+        X_trains: list[np.ndarray | torch.Tensor | None] = [None] * n_members
+        y_trains: list[np.ndarray | torch.Tensor | None] = [None] * n_members
+        cat_ixs: list[list[int] | None] = [None] * n_members
+
+        stable_ix = [
+            i for i, config in enumerate(ensemble_configs) if _is_fit_stable(config)
+        ]
+        if stable_ix:
+            itr = fit_preprocessing(
+                configs=[ensemble_configs[i] for i in stable_ix],
+                X_train=X_prefix,
+                y_train=y_prefix,
+                random_state=rng,
+                cat_ix=cat_ix,
+                n_preprocessing_jobs=n_preprocessing_jobs,
+                parallel_mode="block",
+            )
+            for i, (_, preprocessor, X, y, member_cat_ix) in zip(stable_ix, itr):
+                preprocessors[i] = preprocessor
+                X_trains[i] = X
+                y_trains[i] = y
+                cat_ixs[i] = member_cat_ix
+
+        return cls(
+            ensemble_configs=ensemble_configs,
+            preprocessors=preprocessors,
+            X_trains=X_trains,
+            y_trains=y_trains,
+            cat_ixs=cat_ixs,
+            X_prefix=X_prefix,
+            y_prefix=y_prefix,
+        )
+
+
+def _is_fit_stable(config: EnsembleConfig) -> bool:
+    preprocess_config = config.preprocess_config
+    return (
+        hasattr(config, "class_permutation")
+        and config.subsample_ix is None
+        and preprocess_config.name == "none"
+        and preprocess_config.global_transformer_name is None
+        and preprocess_config.categorical_name in ("numeric", "none")
+    )
+
+
+def _preprocess_with_prefix(
+    prefix: PinnedContextPrefix,
+    X_train: np.ndarray | torch.Tensor,
+    y_train: np.ndarray | torch.Tensor,
+    *,
+    cat_ix: list[int],
+    n_preprocessing_jobs: int,
+    rng: np.random.Generator,
+) -> list[
+    tuple[
+        EnsembleConfig,
+        SequentialFeatureTransformer,
+        np.ndarray | torch.Tensor,
+        np.ndarray | torch.Tensor,
+        list[int],
+    ]
+]:
+    # Preprocess the context `prefix` + `X_train` for every ensemble member, in the
+    # order of `prefix.ensemble_configs`, with the same tuples as `fit_preprocessing`.
+    configs = prefix.ensemble_configs
+    refit_ix = [i for i, p in enumerate(prefix.preprocessors) if p is None]
+    refit = {}
+    if refit_ix:
+        itr = fit_preprocessing(
+            configs=[configs[i] for i in refit_ix],
+            X_train=_concat_rows(prefix.X_prefix, X_train),
+            y_train=_concat_rows(prefix.y_prefix, y_train),
+            random_state=rng,
+            cat_ix=cat_ix,
+            n_preprocessing_jobs=n_preprocessing_jobs,
+            parallel_mode="block",
+        )
+        refit = dict(zip(refit_ix, itr))
+
+    members = []
+    for i, config in enumerate(configs):
+        if i in refit:
+            members.append(refit[i])
+            continue
+        preprocessor = prefix.preprocessors[i]
+        X, y = _transform_train_set(config, preprocessor, X_train, y_train)
+        X = _concat_rows(prefix.X_trains[i], X)
+        y = _concat_rows(prefix.y_trains[i], y)
+        members.append((config, preprocessor, X, y, prefix.cat_ixs[i]))
+    return members
+
+
+def _transform_train_set(
+    config: EnsembleConfig,
+    preprocessor: SequentialFeatureTransformer | None,
+    X_train: np.ndarray | torch.Tensor,
+    y_train: np.ndarray | torch.Tensor,
+) -> tuple[np.ndarray | torch.Tensor, np.ndarray | torch.Tensor]:
+    # Map training rows into the context of an ensemble member with an already
+    # fitted preprocessor, mirroring what `fit_preprocessing` does at fit time.
+    if not hasattr(config, "class_permutation"):
+        raise NotImplementedError(
+            "Reusing fitted preprocessors is only supported for classification."
+        )
+    if config.subsample_ix is not None:
+        raise NotImplementedError(
+            "Reusing fitted preprocessors is not supported when subsampling."
+        )
+    X = X_train if preprocessor is None else preprocessor.transform(X_train).X
+    y = y_train
+    if config.class_permutation is not None:
+        y = config.class_permutation[y]
+    return X, y
+
+
+def _concat_rows(
+    a: np.ndarray | torch.Tensor, b: np.ndarray | torch.Tensor
+) -> np.ndarray | torch.Tensor:
+    if isinstance(a, torch.Tensor) or isinstance(b, torch.Tensor):
+        return torch.cat([torch.as_tensor(a), torch.as_tensor(b)], dim=0)
+    return np.concatenate([a, b], axis=0)
+
+
 @dataclass
 class InferenceEngineCacheKV(InferenceEngine):
     """Inference engine that caches the actual KV cache calculated from the context
     of the processed training data.
 
     This is by far the most memory intensive inference engine, as for each ensemble
-    member we store the full KV cache of that model. For now this is held in CPU RAM
-    (TODO(eddiebergman): verify)
+    member we store the full KV cache of that model. The members share the model
+    weights, one copy per device, and only the KV caches are held per member
+    (see `_SharedWeights`). With a single device, this is
+    held in CPU RAM between predictions. With several devices, the members are
+    sharded over the devices and each KV cache stays resident on the device it was
+    built on; the outputs are gathered on the first device.
+
+    With a `PinnedContextPrefix`, the preprocessing of the prefix is reused, but the
+    KV cache is still computed over the whole context: the training rows attend to
+    each other in every layer, so the keys and values of the prefix rows depend on
+    the rows that follow them and cannot be computed once and extended.
     """
 
     preprocessors: list[SequentialFeatureTransformer]
@@ -624,6 +1238,7 @@ class InferenceEngineCacheKV(InferenceEngine):
     n_train_samples: list[int]
     force_inference_dtype: torch.dtype | None
     ensemble_configs: list[EnsembleConfig]
+    member_devices: list[torch.device]
 
     @classmethod
     def prepare(  # noqa: PLR0913
@@ -642,9 +1257,15 @@ class InferenceEngineCacheKV(InferenceEngine):
         save_peak_mem: bool | Literal["auto"] | float | int,
         autocast: bool,
         only_return_standard_out: bool = True,
+        pinned_prefix: PinnedContextPrefix | None = None,
+        progress: Callable[[KVCacheProgress], None] | None = None,
     ) -> InferenceEngineCacheKV:
         """Prepare the inference engine.
 
+        The KV caches of the members are built by `parallel_execute()` as soon as
+        their preprocessing is ready, while the preprocessing of the next members
+        continues in the background.
+
         Args:
             X_train: The training data.
             y_train: The training target.
@@ -659,69 +1280,89 @@ class InferenceEngineCacheKV(InferenceEngine):
             save_peak_mem: Whether to save peak memory usage.
             autocast: Whether to use torch.autocast during inference.
             only_return_standard_out: Whether to only return the standard output
+            pinned_prefix: If given, the context is this prefix followed by
+                `X_train`, and the preprocessing of the prefix is reused where
+                possible. It must be fitted with `ensemble_configs`.
+            progress: If given, called in the calling thread once the KV cache of
+                each member is built.
         """
-        # This engine currently only supports one device, so just take the first.
-        device = devices[0]
+        n_members = len(ensemble_configs)
+        if pinned_prefix is not None:
+            itr = _preprocess_with_prefix(
+                pinned_prefix,
+                X_train,
+                y_train,
+                cat_ix=cat_ix,
+                n_preprocessing_jobs=n_preprocessing_jobs,
+                rng=rng,
+            )
+        else:
+            itr = fit_preprocessing(
+                configs=ensemble_configs,
+                X_train=X_train,
+                y_train=y_train,
+                random_state=rng,
+                cat_ix=cat_ix,
+                n_preprocessing_jobs=n_preprocessing_jobs,
+                parallel_mode="as-ready",
+            )
 
-        itr = fit_preprocessing(
-            configs=ensemble_configs,
-            X_train=X_train,
-            y_train=y_train,
-            random_state=rng,
-            cat_ix=cat_ix,
-            n_preprocessing_jobs=n_preprocessing_jobs,
-            parallel_mode="as-ready",
-        )
-        ens_models: list[Architecture] = []
-        preprocessors: list[SequentialFeatureTransformer] = []
-        correct_order_configs: list[EnsembleConfig] = []
-        cat_ixs: Sequence[list[int]] = []
-        n_train_samples: list[int] = []
-
-        for config, preprocessor, X, y, preprocessor_cat_ix in itr:
-            cat_ixs.append(preprocessor_cat_ix)
-            preprocessors.append(preprocessor)
-            correct_order_configs.append(config)
-            n_train_samples.append(len(y))
-
-            ens_model = deepcopy(models[config._model_index])
-            ens_model = ens_model.to(device)
-            if not isinstance(X, torch.Tensor):
-                X = torch.as_tensor(X, dtype=torch.float32, device=device)  # noqa: PLW2901
-            X = X.unsqueeze(1)  # noqa: PLW2901
-            if not isinstance(y, torch.Tensor):
-                y = torch.as_tensor(y, dtype=torch.float32, device=device)  # noqa: PLW2901
-
-            batched_preprocessor_cat_ix = [preprocessor_cat_ix]
-
-            # We do not reset the peak memory for cache_kv mode
-            # because the entire data has to be passed through the model
-            # at once to generate the KV cache
-            with (
-                get_autocast_context(device, enabled=autocast),
-                torch.inference_mode(),
-            ):
-                ens_model.forward(
-                    X,
-                    y,
-                    only_return_standard_out=only_return_standard_out,
-                    categorical_inds=batched_preprocessor_cat_ix,
+        # The members are sharded over the devices by `parallel_execute()`: each KV
+        # cache is built on whichever device is free when its preprocessing is ready.
+        shared_weights = _SharedWeights(models)
+        build_functions = (
+            partial(
+                _build_kv_cache,
+                config=config,
+                preprocessor=preprocessor,
+                X=X,
+                y=y,
+                cat_ix=preprocessor_cat_ix,
+                shared_weights=shared_weights,
+                autocast=autocast,
+                only_return_standard_out=only_return_standard_out,
+                # With a single device, the caches are kept in CPU RAM between
+                # predictions, otherwise they stay on their devices.
+                keep_on_device=len(devices) > 1,
+            )
+            for config, preprocessor, X, y, preprocessor_cat_ix in _prefetch_in_thread(
+                itr, depth=len(devices)
+            )
+        )
+        members = []
+        start = time.perf_counter()
+        for member in parallel_execute(devices, build_functions):
+            members.append(member)
+            if progress is not None:
+                progress(
+                    KVCacheProgress(
+                        n_done=len(members),
+                        n_members=n_members,
+                        config=member.config,
+                        device=member.device,
+                        forward_seconds=member.forward_seconds,
+                        elapsed_seconds=time.perf_counter() - start,
+                    )
                 )
 
-            if device.type != "cpu":
-                ens_model = ens_model.cpu()
-
-            ens_models.append(ens_model)
-
+        residency = _ModelResidency("pin") if len(devices) > 1 else None
+        model_caches = [
+            _PerDeviceModelCache(
+                member.model, residency, on_device=member.resident_device
+            )
+            for member in members
+        ]
+        _link_shared_weights(model_caches)
         return InferenceEngineCacheKV(
-            preprocessors=preprocessors,
-            ensemble_configs=correct_order_configs,
-            cat_ixs=cat_ixs,
-            n_train_samples=n_train_samples,
-            model_caches=[_PerDeviceModelCache(model) for model in ens_models],
+            preprocessors=[member.preprocessor for member in members],
+            ensemble_configs=[member.config for member in members],
+            cat_ixs=[member.cat_ix for member in members],
+            n_train_samples=[member.n_train_samples for member in members],
+            model_caches=model_caches,
             dtype_byte_size=dtype_byte_size,
             force_inference_dtype=force_inference_dtype,
             save_peak_mem=save_peak_mem,
+            member_devices=[member.device for member in members],
         )
 
     @override
@@ -733,45 +1374,359 @@ class InferenceEngineCacheKV(InferenceEngine):
         autocast: bool,
         only_return_standard_out: bool = True,
     ) -> Iterator[tuple[torch.Tensor | dict, EnsembleConfig]]:
-        # This engine currently only supports one device, so just take the first.
-        device = devices[0]
+        # Each member runs on the device that holds its KV cache, if that device is
+        # in use. Otherwise, the members of each missing device are moved together,
+        # as they share their weights, and these groups are spread over `devices`.
+        devices = list(devices)
+        missing = list(dict.fromkeys(d for d in self.member_devices if d not in devices))
+        device_indices = [
+            devices.index(device)
+            if device in devices
+            else missing.index(device) % len(devices)
+            for device in self.member_devices
+        ]
+        forward_functions = (
+            partial(
+                self._call_model,
+                X=X,
+                member_index=i,
+                autocast=autocast,
+                only_return_standard_out=only_return_standard_out,
+            )
+            for i in range(len(self.ensemble_configs))
+        )
+        outputs = parallel_execute(
+            devices, forward_functions, device_indices=device_indices
+        )
+
+        for output, config in zip(outputs, self.ensemble_configs):
+            yield _move_and_squeeze_output(output, devices[0]), config
 
-        for preprocessor, model_cache, config, cat_ix, _X_train_len in zip(
-            self.preprocessors,
-            self.model_caches,
-            self.ensemble_configs,
-            self.cat_ixs,
-            self.n_train_samples,
+    def _call_model(
+        self,
+        *,
+        device: torch.device,
+        is_parallel: bool,  # noqa: ARG002
+        X: np.ndarray,
+        member_index: int,
+        autocast: bool,
+        only_return_standard_out: bool,
+    ) -> torch.Tensor | dict[str, torch.Tensor]:
+        # Every member has its own module, holding its KV cache, so it is never
+        # copied here. The members share the weights on each device, see
+        # `_SharedWeights`, and their model caches move them together.
+        model_cache = self.model_caches[member_index]
+        model = model_cache.get(device, multiple_devices=False)
+        X_test = self.preprocessors[member_index].transform(X).X
+        X_test = torch.as_tensor(X_test, dtype=torch.float32, device=device)
+        X_test = X_test.unsqueeze(1)
+        batched_cat_ix = [self.cat_ixs[member_index]]
+
+        if self.force_inference_dtype is not None:
+            model.type(self.force_inference_dtype)
+            X_test = X_test.type(self.force_inference_dtype)
+        with (
+            get_autocast_context(device, enabled=autocast),
+            torch.inference_mode(),
         ):
-            model = model_cache.get(device, multiple_devices=False)
-            X_test = preprocessor.transform(X).X
-            X_test = torch.as_tensor(X_test, dtype=torch.float32, device=device)
-            X_test = X_test.unsqueeze(1)
-            batched_cat_ix = [cat_ix]
+            output = model(
+                X_test,
+                y=None,
+                only_return_standard_out=only_return_standard_out,
+                categorical_inds=batched_cat_ix,
+                # When the KV cache is enabled, we assume we are under memory
+                # pressure and enable the saving mode.
+                # TODO: Use the heuristic in this case also.
+                save_peak_memory_factor=DEFAULT_SAVE_PEAK_MEMORY_FACTOR,
+            )
+
+        model_cache.end_predict()
+        return output
 
-            if self.force_inference_dtype is not None:
-                model.type(self.force_inference_dtype)
-                X_test = X_test.type(self.force_inference_dtype)
-            with (
-                get_autocast_context(device, enabled=autocast),
-                torch.inference_mode(),
-            ):
-                output = model(
-                    X_test,
-                    y=None,
-                    only_return_standard_out=only_return_standard_out,
-                    categorical_inds=batched_cat_ix,
-                    # When the KV cache is enabled, we assume we are under memory
-                    # pressure and enable the saving mode.
-                    # TODO: Use the heuristic in this case also.
-                    save_peak_memory_factor=DEFAULT_SAVE_PEAK_MEMORY_FACTOR,
-                )
 
-            model_cache.to_cpu()
+@dataclass
+class KVCacheProgress:
+    """Progress of `InferenceEngineCacheKV.prepare()`, reported per member."""
 
-            output = output if isinstance(output, dict) else output.squeeze(1)
+    n_done: int
+    """The number of members whose KV cache is built, including this one."""
 
-            yield output, config
+    n_members: int
+    config: EnsembleConfig
+    device: torch.device
+    """The device the KV cache was built on."""
+
+    forward_seconds: float
+    """The time of the context forward pass of this member."""
+
+    elapsed_seconds: float
+    """The time since the first member was submitted."""
+
+
+@dataclass
+class EngineMemoryEstimate:
+    """The estimated peak memory of an inference engine, see `estimate_engine_memory`.
+
+    The estimates are coarse, they are meant to rank the engines and to compare them
+    with the available memory, not to predict the exact usage.
+    """
+
+    fit_mode: Literal["low_memory", "fit_preprocessors", "fit_with_cache"]
+    host_bytes: int
+    """The CPU memory for the cached state and the model weights."""
+
+    device_bytes: int
+    """The memory on each inference device during a forward pass."""
+
+
+def estimate_engine_memory(  # noqa: PLR0913
+    fit_mode: Literal["low_memory", "fit_preprocessors", "fit_with_cache"],
+    *,
+    models: Sequence[Architecture],
+    n_train: int,
+    n_test: int,
+    n_features: int,
+    n_estimators: int,
+    n_devices: int,
+    dtype_byte_size: int,
+) -> EngineMemoryEstimate:
+    """Estimate the peak memory of the engine that `fit_mode` creates.
+
+    Args:
+        fit_mode: The engine to estimate.
+        models: The loaded models, used for the size of the weights and the
+            embedding size, number of layers and feature group size.
+        n_train: The number of context rows.
+        n_test: The number of test rows per predict.
+        n_features: The number of features before preprocessing.
+        n_estimators: The number of ensemble members.
+        n_devices: The number of inference devices.
+        dtype_byte_size: The byte size of the inference dtype.
+    """
+    weights = max(_model_nbytes(model) for model in models)
+    emsize, n_layers, features_per_group = _model_geometry(models[0])
+    n_feature_groups = -(-max(n_features, 1) // features_per_group) + 1
+    preprocessed_bytes = np.dtype(DEFAULT_NUMPY_PREPROCESSING_DTYPE).itemsize
+
+    def _activations(n_rows: int) -> int:
+        return (
+            n_rows * max(n_features, 1) * TEST_CELL_ACTIVATION_ELEMENTS * dtype_byte_size
+        )
+
+    # The member's preprocessed context, held on the host while it is forwarded.
+    member_context = (n_train + n_test) * n_features * preprocessed_bytes
+    if fit_mode == "low_memory":
+        host = weights + member_context
+        device = weights + _activations(n_train + n_test)
+    elif fit_mode == "fit_preprocessors":
+        host = weights + n_estimators * member_context
+        device = weights + _activations(n_train + n_test)
+    elif fit_mode == "fit_with_cache":
+        # The keys and values of every layer for the context rows and feature groups.
+        kv_cache = 2 * n_layers * n_train * n_feature_groups * emsize * dtype_byte_size
+        if n_devices > 1:
+            # The members stay on the device that built their cache.
+            members_per_device = -(-n_estimators // n_devices)
+            host = weights + member_context
+            device = weights + members_per_device * kv_cache
+        else:
+            host = weights + n_estimators * kv_cache + member_context
+            device = weights + kv_cache
+        device += max(_activations(n_train), _activations(n_test))
+    else:
+        raise ValueError(f"Cannot estimate the memory of fit_mode={fit_mode!r}.")
+
+    return EngineMemoryEstimate(
+        fit_mode=fit_mode, host_bytes=int(host), device_bytes=int(device)
+    )
+
+
+# The embedding size, number of layers and feature group size of TabPFN v2, used for
+# architectures that do not expose them.
+_DEFAULT_EMSIZE = 192
+_DEFAULT_N_LAYERS = 12
+_DEFAULT_FEATURE_GROUP = 2
+
+
+def _model_geometry(model: Architecture) -> tuple[int, int, int]:
+    emsize = getattr(model, "ninp", _DEFAULT_EMSIZE)
+    encoder = getattr(model, "transformer_encoder", None)
+    layers = getattr(encoder, "layers", None)
+    n_layers = len(layers) if layers is not None else _DEFAULT_N_LAYERS
+    features_per_group = getattr(model, "features_per_group", _DEFAULT_FEATURE_GROUP)
+    return int(emsize), int(n_layers), max(int(features_per_group), 1)
+
+
+@dataclass
+class _KVCacheMember:
+    config: EnsembleConfig
+    preprocessor: SequentialFeatureTransformer
+    cat_ix: list[int]
+    n_train_samples: int
+    model: Architecture
+    device: torch.device
+    """The device the KV cache was built on."""
+    resident_device: torch.device | None
+    """The device the model is on, or None if it was moved to the CPU."""
+    forward_seconds: float
+
+
+def _build_kv_cache(  # noqa: PLR0913
+    *,
+    device: torch.device,
+    is_parallel: bool,  # noqa: ARG001
+    config: EnsembleConfig,
+    preprocessor: SequentialFeatureTransformer,
+    X: np.ndarray | torch.Tensor,
+    y: np.ndarray | torch.Tensor,
+    cat_ix: list[int],
+    shared_weights: _SharedWeights,
+    autocast: bool,
+    only_return_standard_out: bool,
+    keep_on_device: bool,
+) -> _KVCacheMember:
+    # Each member gets its own module, which holds its KV cache, but the weights are
+    # shared with the other members on the device.
+    ens_model = shared_weights.member_model(config._model_index, device)
+    ens_model = ens_model.to(_storage_device(device))
+    n_train_samples = len(y)
+    if not isinstance(X, torch.Tensor):
+        X = torch.as_tensor(X, dtype=torch.float32, device=device)
+    X = X.unsqueeze(1)
+    if not isinstance(y, torch.Tensor):
+        y = torch.as_tensor(y, dtype=torch.float32, device=device)
+
+    # We do not reset the peak memory for cache_kv mode
+    # because the entire data has to be passed through the model
+    # at once to generate the KV cache
+    start = time.perf_counter()
+    with (
+        get_autocast_context(device, enabled=autocast),
+        torch.inference_mode(),
+    ):
+        ens_model.forward(
+            X,
+            y,
+            only_return_standard_out=only_return_standard_out,
+            categorical_inds=[cat_ix],
+        )
+    if device.type == "cuda":
+        torch.cuda.synchronize(device)
+    forward_seconds = time.perf_counter() - start
+
+    resident_device: torch.device | None = device
+    if device.type != "cpu" and not keep_on_device:
+        ens_model = ens_model.cpu()
+        resident_device = None
+
+    return _KVCacheMember(
+        config=config,
+        preprocessor=preprocessor,
+        cat_ix=cat_ix,
+        n_train_samples=n_train_samples,
+        model=ens_model,
+        device=device,
+        resident_device=resident_device,
+        forward_seconds=forward_seconds,
+    )
+
+
+class _SharedWeights:
+    """One copy of the weights of each model per device, shared by the KV members.
+
+    `member_model()` returns a new module for each member, so that each member can
+    hold its own KV cache, but the parameters of these modules are the same tensors.
+    Moving one member between devices therefore moves the weights of all members
+    that were created for the same device.
+    """
+
+    def __init__(self, models: list[Architecture]) -> None:
+        super().__init__()
+        self._models = models
+        self._on_device: dict[tuple[int, torch.device], Architecture] = {}
+        self._lock = Lock()
+
+    def member_model(self, model_index: int, device: torch.device) -> Architecture:
+        """Return a new module for a member, sharing the weights on `device`."""
+        # The logical CPU devices of `cpu_devices()` share one copy.
+        key = (model_index, _storage_device(device))
+        with self._lock:
+            if key not in self._on_device:
+                model = deepcopy(self._models[model_index])
+                self._on_device[key] = model.to(key[1])
+            weights = self._on_device[key]
+
+        # Copy the module structure, but not the parameters.
+        memo = {id(param): param for param in weights.parameters()}
+        return deepcopy(weights, memo)
+
+
+def _storage_device(device: torch.device) -> torch.device:
+    # The logical CPU devices of `cpu_devices()` all store their tensors on the CPU;
+    # `.to("cpu:1")` would copy tensors that are already there.
+    return torch.device("cpu") if device.type == "cpu" else device
+
+
+def _module_sharing_tensors(module: Architecture) -> Architecture:
+    """Return a copy of `module` whose parameters and buffers are those of `module`."""
+    memo = {
+        id(tensor): tensor
+        for tensor in itertools.chain(module.parameters(), module.buffers())
+    }
+    return deepcopy(module, memo)
+
+
+def _prefetch_in_thread(iterable: Iterable[T], *, depth: int) -> Iterator[T]:
+    """Iterate over `iterable` in a background thread, up to `depth` items ahead.
+
+    This lets CPU-bound producers, such as the preprocessing generators, run while
+    the consumer waits on a device. Exceptions of the producer are re-raised in the
+    consumer. If the consumer stops early, the producer stops after its current item.
+    """
+    items: queue.Queue[tuple[bool, object]] = queue.Queue(maxsize=max(depth, 1))
+    stop = Event()
+
+    def _put(item: tuple[bool, object]) -> bool:
+        while not stop.is_set():
+            try:
+                items.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _produce() -> None:
+        try:
+            for item in iterable:
+                if not _put((False, item)):
+                    return
+        except BaseException as e:  # noqa: BLE001
+            _put((True, e))
+        else:
+            _put((True, None))
+
+    producer = Thread(target=_produce, daemon=True)
+    producer.start()
+    try:
+        while True:
+            is_last, item = items.get()
+            if is_last:
+                if item is not None:
+                    raise item  # type: ignore[misc]
+                return
+            yield item  # type: ignore[misc]
+    finally:
+        stop.set()
+        producer.join()
+
+
+def _test_chunk_size(
+    n_features: int, dtype_byte_size: int, memory_budget_bytes: int
+) -> int:
+    # The number of test rows whose activations fit into the budget at the widest
+    # point of a forward pass.
+    bytes_per_row = max(n_features, 1) * TEST_CELL_ACTIVATION_ELEMENTS * dtype_byte_size
+    return max(int(memory_budget_bytes // bytes_per_row), 1)
 
 
 def _prepare_model_inputs(
@@ -784,11 +1739,64 @@ def _prepare_model_inputs(
     dtype = force_inference_dtype if force_inference_dtype else torch.float32
     X_train = torch.as_tensor(X_train, dtype=dtype, device=device)
     X_test = torch.as_tensor(X_test, dtype=dtype, device=device)
-    X_full = torch.cat([X_train, X_test], dim=0).unsqueeze(1)
+    X_full = _with_batch_axis(torch.cat([X_train, X_test], dim=0))
     y_train = torch.as_tensor(y_train, dtype=dtype, device=device)
     return X_full, y_train
 
 
+def _stack_members(
+    arrays: list[torch.Tensor | np.ndarray],
+) -> torch.Tensor | np.ndarray:
+    # Stack the rows of several ensemble members along a batch axis at position 1,
+    # a single member is returned as is.
+    if len(arrays) == 1:
+        return arrays[0]
+    if any(isinstance(a, torch.Tensor) for a in arrays):
+        return torch.stack([torch.as_tensor(a) for a in arrays], dim=1)
+    return np.stack(arrays, axis=1)
+
+
+def _with_batch_axis(X: torch.Tensor) -> torch.Tensor:
+    # The model expects (rows, batch, features); unbatched rows get a batch of one.
+    return X.unsqueeze(1) if X.ndim == 2 else X
+
+
+def _forward_members_in_process(  # noqa: PLR0913
+    *,
+    device: torch.device,
+    is_parallel: bool,  # noqa: ARG001
+    model: MappedModule,
+    preprocessors: list[SequentialFeatureTransformer] | None,
+    X: torch.Tensor,
+    X_train: torch.Tensor,
+    y_train: torch.Tensor,
+    cat_ixs: list[list[int]],
+    force_inference_dtype: torch.dtype | None,
+    autocast: bool,
+    only_return_standard_out: bool,
+    save_peak_mem: bool,
+) -> torch.Tensor | dict[str, torch.Tensor]:
+    # The forward pass of `InferenceEngineCachePreprocessing` for a batch of members,
+    # executed in a worker process of `parallel_execute()`.
+    X_tests = (
+        [X]
+        if preprocessors is None
+        else [preprocessor.transform(X.numpy()).X for preprocessor in preprocessors]
+    )
+    X_full, y_train = _prepare_model_inputs(
+        device, force_inference_dtype, X_train, _stack_members(X_tests), y_train
+    )
+    save_peak_memory_factor = DEFAULT_SAVE_PEAK_MEMORY_FACTOR if save_peak_mem else None
+    with get_autocast_context(device, enabled=autocast), torch.inference_mode():
+        return model.module(
+            X_full,
+            y_train,
+            only_return_standard_out=only_return_standard_out,
+            categorical_inds=cat_ixs,
+            save_peak_memory_factor=save_peak_memory_factor,
+        )
+
+
 def _move_and_squeeze_output(
     output: dict | torch.Tensor, device: torch.device
 ) -> dict[str, torch.Tensor] | torch.Tensor:
@@ -797,14 +1805,257 @@ def _move_and_squeeze_output(
     return output.squeeze(1).to(device)
 
 
+class _ContextBuffer:
+    """The train rows of one ensemble member on one device, followed by spare rows
+    for the test rows.
+
+    The train rows are uploaded and converted to the inference dtype once. The model
+    input is then a view of the buffer into whose tail the test rows are written,
+    so no per-call concatenation is needed. The tail grows geometrically when a
+    larger test set arrives. Callers must hold `lock` while the returned view is in
+    use.
+    """
+
+    def __init__(self, device: torch.device, dtype: torch.dtype) -> None:
+        super().__init__()
+        self.device = device
+        self.dtype = dtype
+        self.lock = Lock()
+        self._X: torch.Tensor | None = None
+        self._y: torch.Tensor | None = None
+        self._n_train = 0
+
+    def model_inputs(
+        self,
+        X_train: torch.Tensor | np.ndarray | None,
+        X_test: torch.Tensor | np.ndarray,
+        y_train: torch.Tensor | np.ndarray | None,
+    ) -> tuple[torch.Tensor, torch.Tensor]:
+        """Return the model inputs, equal to those of `_prepare_model_inputs()`.
+
+        `X_train` and `y_train` are only read until the buffer is `filled`, they
+        must not change between calls. The rows may have a batch axis, see
+        `_stack_members()`.
+        """
+        X_test = torch.as_tensor(X_test)
+        n_test = X_test.shape[0]
+        if self._X is None:
+            self._n_train = len(X_train)
+            self._X = self._allocate(
+                torch.as_tensor(X_train, dtype=self.dtype, device=self.device), n_test
+            )
+            self._y = torch.as_tensor(y_train, dtype=self.dtype, device=self.device)
+        elif self._X.shape[0] < self._n_train + n_test:
+            spare = max(n_test, 2 * (self._X.shape[0] - self._n_train))
+            self._X = self._allocate(self._X[: self._n_train], spare)
+
+        X_full = self._X[: self._n_train + n_test]
+        X_full[self._n_train :].copy_(X_test)
+        return _with_batch_axis(X_full), self._y
+
+    @property
+    def filled(self) -> bool:
+        """Whether the train rows are in the buffer."""
+        return self._X is not None
+
+    def _allocate(self, X_train: torch.Tensor, n_spare: int) -> torch.Tensor:
+        X = torch.empty(
+            (X_train.shape[0] + n_spare, *X_train.shape[1:]),
+            dtype=self.dtype,
+            device=self.device,
+        )
+        X[: X_train.shape[0]] = X_train
+        return X
+
+
+class _ContextBuffers:
+    """The `_ContextBuffer`s of an engine, by batch of ensemble members and device.
+
+    Also holds the training sets in shared memory for ``parallel_backend="process"``.
+    Buffers are not pickled or copied, they are rebuilt on demand.
+    """
+
+    def __init__(self) -> None:
+        super().__init__()
+        self._buffers: dict[tuple[tuple[int, ...], torch.device], _ContextBuffer] = {}
+        self._shared_train_sets: dict[
+            tuple[int, ...], tuple[torch.Tensor, torch.Tensor]
+        ] = {}
+        self._lock = Lock()
+
+    def get(
+        self,
+        members: tuple[int, ...],
+        device: torch.device,
+        force_inference_dtype: torch.dtype | None,
+    ) -> _ContextBuffer:
+        """Return the buffer of a batch of ensemble members on the device."""
+        dtype = force_inference_dtype if force_inference_dtype else torch.float32
+        key = (members, device)
+        with self._lock:
+            buffer = self._buffers.get(key)
+            if buffer is None or buffer.dtype != dtype:
+                buffer = _ContextBuffer(device, dtype)
+                self._buffers[key] = buffer
+            return buffer
+
+    def shared_train_set(
+        self,
+        members: tuple[int, ...],
+        make: Callable[[], tuple[np.ndarray | torch.Tensor, np.ndarray | torch.Tensor]],
+    ) -> tuple[torch.Tensor, torch.Tensor]:
+        """Return the training set of a batch of members in shared memory.
+
+        `make` returns the training set, it is only called the first time.
+        """
+        with self._lock:
+            shared = self._shared_train_sets.get(members)
+            if shared is None:
+                X_train, y_train = make()
+                shared = (shared_tensor(X_train), shared_tensor(y_train))
+                self._shared_train_sets[members] = shared
+            return shared
+
+    def clear(
+        self, *, keep: Callable[[tuple[int, ...], torch.device], bool] | None = None
+    ) -> None:
+        """Release all buffers and shared training sets.
+
+        Args:
+            keep: If given, only the buffers for which ``keep(members, device)`` is
+                False are released, and the shared training sets are kept.
+        """
+        with self._lock:
+            if keep is None:
+                self._buffers.clear()
+                self._shared_train_sets.clear()
+                return
+            for members, device in list(self._buffers):
+                if not keep(members, device):
+                    del self._buffers[members, device]
+
+    def __getstate__(self) -> dict:
+        return {}
+
+    def __setstate__(self, state: dict) -> None:
+        self.__init__()
+
+    def __deepcopy__(self, memo: dict) -> _ContextBuffers:
+        return _ContextBuffers()
+
+
+class _ModelResidency:
+    """Tracks the models on each device and applies a `ModelResidencyPolicy`.
+
+    A single instance is shared by the `_PerDeviceModelCache`s of an engine, so that
+    the ``"lru"`` budget covers all of its models.
+    """
+
+    def __init__(
+        self,
+        policy: ModelResidencyPolicy = "evict_after_predict",
+        *,
+        memory_budget_bytes: int | None = None,
+    ) -> None:
+        super().__init__()
+        if policy not in ("evict_after_predict", "pin", "lru"):
+            raise ValueError(f"Unknown model residency policy: {policy}")
+        if policy == "lru" and memory_budget_bytes is None:
+            raise ValueError('The "lru" residency policy needs memory_budget_bytes.')
+        self.policy = policy
+        self.memory_budget_bytes = memory_budget_bytes
+        # (id of the model cache, device) -> (model cache, bytes), least recent first
+        self._resident: OrderedDict[
+            tuple[int, torch.device], tuple[_PerDeviceModelCache, int]
+        ] = OrderedDict()
+        self._lock = Lock()
+
+    def touch(
+        self, model_cache: _PerDeviceModelCache, device: torch.device, n_bytes: int
+    ) -> None:
+        """Record that the model of `model_cache` is used on `device`."""
+        if device.type == "cpu":
+            return
+        key = (id(model_cache), device)
+        with self._lock:
+            self._resident[key] = (model_cache, n_bytes)
+            self._resident.move_to_end(key)
+            if self.policy != "lru":
+                return
+            # Models that share their parameters (see `_SharedWeights`) are counted
+            # once and evicted together, by the most recent use of any of them.
+            groups: dict[int, tuple[_PerDeviceModelCache, int]] = {}
+            for (_, d), (other, other_bytes) in self._resident.items():
+                if d == device:
+                    groups.pop(id(other.weight_group), None)
+                    groups[id(other.weight_group)] = (other, other_bytes)
+            used = sum(group_bytes for _, group_bytes in groups.values())
+            evict = []
+            for other, group_bytes in list(groups.values())[:-1]:
+                if used <= self.memory_budget_bytes:
+                    break
+                used -= group_bytes
+                evict.append(other)
+                for k, (cache, _) in list(self._resident.items()):
+                    if k[1] == device and cache.weight_group is other.weight_group:
+                        del self._resident[k]
+        for other in evict:
+            other.evict(device)
+
+    def forget(
+        self, model_cache: _PerDeviceModelCache, device: torch.device | None = None
+    ) -> None:
+        """Stop tracking the model of `model_cache` on `device`, or on all devices."""
+        with self._lock:
+            for key in list(self._resident):
+                if key[0] == id(model_cache) and device in (None, key[1]):
+                    del self._resident[key]
+
+    def __getstate__(self) -> dict:
+        # Which models are on a device is not persisted, neither is the lock.
+        return {
+            "policy": self.policy,
+            "memory_budget_bytes": self.memory_budget_bytes,
+        }
+
+    def __setstate__(self, state: dict) -> None:
+        self.__init__(state["policy"], memory_budget_bytes=state["memory_budget_bytes"])
+
+
 class _PerDeviceModelCache:
-    """Maintains a copy of a model on each device."""
+    """Maintains a copy of a model on each device.
+
+    When the models leave the devices is decided by the shared `residency`, see
+    `InferenceEngine.set_model_residency()`.
+    """
 
-    def __init__(self, model: Architecture) -> None:
+    def __init__(
+        self,
+        model: Architecture,
+        residency: _ModelResidency | None = None,
+        *,
+        on_device: torch.device | None = None,
+    ) -> None:
+        """Create the cache.
+
+        Args:
+            model: The model, on the CPU unless `on_device` is given.
+            residency: The residency shared with the other model caches of the
+                engine, by default a new ``"evict_after_predict"`` one.
+            on_device: The device the model already lives on, if not the CPU.
+        """
         super().__init__()
         self._model = model
         self._on_device_cache: dict[torch.device, Architecture] = {}
         self._on_device_cache_lock = Lock()
+        self._mapped: MappedModule | None = None
+        self.residency = residency if residency is not None else _ModelResidency()
+        self.weight_group: list[_PerDeviceModelCache] = [self]
+        """The model caches whose models share their parameters with this one,
+        including this one, see `_link_shared_weights()`."""
+        if on_device is not None and on_device.type != "cpu":
+            self._on_device_cache[on_device] = model
+            self.residency.touch(self, on_device, _model_nbytes(model))
 
     def get(self, device: torch.device, *, multiple_devices: bool) -> Architecture:
         """Return the model on the specified device.
@@ -823,23 +2074,67 @@ class _PerDeviceModelCache:
                 If False, then the model is moved to the target device without copying
                 to save time.
         """
+        if not multiple_devices and device not in self._on_device_cache:
+            # The parameters move with the model, so they leave the devices of the
+            # other models that share them.
+            for other in self.weight_group:
+                if other is not self:
+                    other._drop(except_device=device)
+
         with self._on_device_cache_lock:
             not_on_device = device not in self._on_device_cache
 
             if not_on_device:
-                if multiple_devices:
+                if multiple_devices and device.type == "cpu":
+                    # Logical CPU devices, see `cpu_devices()`, share the memory, so
+                    # they do not copy the weights. Each still gets its own module,
+                    # as the modules keep state during the forward pass and the
+                    # devices run concurrently.
+                    self._on_device_cache[device] = _module_sharing_tensors(
+                        self._model
+                    )
+                elif multiple_devices:
                     self._on_device_cache[device] = deepcopy(self._model)
                 else:
+                    for other_device in self._on_device_cache:
+                        self.residency.forget(self, other_device)
                     self._on_device_cache.clear()
                     self._on_device_cache[device] = self._model
 
+        model = self._on_device_cache[device]
         if not_on_device:
-            self._on_device_cache[device].to(device)
+            model.to(_storage_device(device))
+        self.residency.touch(self, device, _model_nbytes(model))
+        return model
 
-        return self._on_device_cache[device]
+    def end_predict(self) -> None:
+        """Apply the residency policy at the end of a prediction."""
+        if self.residency.policy == "evict_after_predict":
+            self.to_cpu()
+
+    def release(self) -> None:
+        """Move the model back to the CPU, whatever the residency policy."""
+        self.to_cpu()
+
+    def evict(self, device: torch.device) -> None:
+        """Remove the model from one device.
+
+        The models that share its parameters are removed from all devices, as the
+        parameters move with it.
+        """
+        with self._on_device_cache_lock:
+            model = self._on_device_cache.pop(device, None)
+            if model is self._model:
+                self._model.cpu()
+        self.residency.forget(self, device)
+        if model is self._model:
+            self._drop_weight_group()
 
     def to_cpu(self) -> None:
-        """Remove the models from the target devices, keeping one copy on the CPU."""
+        """Remove the models from the target devices, keeping one copy on the CPU.
+
+        The models that share its parameters are moved to the CPU as well.
+        """
         with self._on_device_cache_lock:
             # If .get() was called with multiple_devices=True, then ._model will remain
             # on the CPU and only the cached models will be moved to the target devices.
@@ -847,10 +2142,46 @@ class _PerDeviceModelCache:
             # device. Thus, cover both cases by emptying the cache and moving _model.
             self._on_device_cache.clear()
             self._model.cpu()
+        self.residency.forget(self)
+        self._drop_weight_group()
+
+    def _drop_weight_group(self) -> None:
+        for other in self.weight_group:
+            if other is not self:
+                other._drop()
+
+    def _drop(self, *, except_device: torch.device | None = None) -> None:
+        # Forget the devices of the model, but `except_device`, and move the model
+        # to the CPU if it was on one of them. Only the other members of the weight
+        # group call this, so it must not recurse into the group.
+        with self._on_device_cache_lock:
+            dropped = [d for d in self._on_device_cache if d != except_device]
+            moved = False
+            for device in dropped:
+                moved |= self._on_device_cache.pop(device) is self._model
+            if moved:
+                self._model.cpu()
+        for device in dropped:
+            self.residency.forget(self, device)
+
+    def is_on(self, device: torch.device) -> bool:
+        """Whether the model is currently on `device`."""
+        return device in self._on_device_cache
+
+    def mapped(self) -> MappedModule:
+        """Return the model for worker processes, see `MappedModule`."""
+        with self._on_device_cache_lock:
+            if self._mapped is None:
+                self._mapped = MappedModule(self._model)
+            return self._mapped
 
     def set_dtype(self, dtype: torch.dtype) -> None:
         """Set the dtype of the model's parameters."""
         with self._on_device_cache_lock:
+            param = next(self._model.parameters(), None)
+            if param is None or param.dtype != dtype:
+                # The workers would keep the weights in the old dtype.
+                self._mapped = None
             self._model.type(dtype)
             for model in self._on_device_cache.values():
                 model.type(dtype)
@@ -860,6 +2191,7 @@ class _PerDeviceModelCache:
         # scikit-learn estimators have to be picklable, but the lock is not picklable,
         # so we manually delete + recreate it.
         del state["_on_device_cache_lock"]
+        state.pop("_mapped", None)
         return state
 
     def __setstate__(self, state: dict) -> None:
@@ -867,3 +2199,184 @@ class _PerDeviceModelCache:
         # scikit-learn estimators have to be picklable, but the lock is not picklable,
         # so we manually delete + recreate it.
         self._on_device_cache_lock = Lock()
+        self._mapped = None
+
+
+def _link_shared_weights(model_caches: Sequence[_PerDeviceModelCache]) -> None:
+    """Set the `weight_group` of model caches whose models share parameters."""
+    groups: dict[int, list[_PerDeviceModelCache]] = {}
+    for model_cache in model_caches:
+        param = next(model_cache._model.parameters(), None)
+        if param is None:
+            model_cache.weight_group = [model_cache]
+            continue
+        group = groups.setdefault(id(param), [])
+        group.append(model_cache)
+        model_cache.weight_group = group
+
+
+def _model_nbytes(model: Architecture) -> int:
+    return sum(
+        t.numel() * t.element_size()
+        for t in itertools.chain(model.parameters(), model.buffers())
+    )
+
+
+# Snapshots store arrays of at least this size as memory-mapped ``.npy`` files, smaller
+# ones are pickled with the engine.
+_SNAPSHOT_MIN_ARRAY_BYTES = 64 * 1024
+_SNAPSHOT_VERSION = 1
+
+
+class _SnapshotPickler(pickle.Pickler):
+    """Pickles an engine, moving large arrays out to ``.npy`` files.
+
+    Model caches are dropped, and model parameters are replaced by their name, so
+    that they are not saved.
+    """
+
+    def __init__(
+        self,
+        file: object,
+        array_dir: Path,
+        param_names: dict[int, tuple[int, str]],
+    ) -> None:
+        super().__init__(file, protocol=pickle.HIGHEST_PROTOCOL)
+        self.array_dir = array_dir
+        self.param_names = param_names
+        self._saved: dict[int, str] = {}
+
+    def persistent_id(self, obj: object) -> tuple | None:
+        if isinstance(obj, _PerDeviceModelCache):
+            return ("model_cache",)
+        if isinstance(obj, torch.nn.Parameter):
+            if id(obj) not in self.param_names:
+                raise ValueError("Cannot snapshot parameters of an unknown model.")
+            return ("parameter", *self.param_names[id(obj)])
+        if isinstance(obj, torch.Tensor):
+            if obj.element_size() * obj.nelement() < _SNAPSHOT_MIN_ARRAY_BYTES:
+                return None
+            tensor = obj.detach().cpu()
+            dtype = str(tensor.dtype).removeprefix("torch.")
+            if tensor.dtype == torch.bfloat16:
+                # numpy has no bfloat16, store the raw bits.
+                tensor = tensor.view(torch.int16)
+            return ("tensor", self._save_array(obj, tensor.numpy()), dtype)
+        if (
+            isinstance(obj, np.ndarray)
+            and not obj.dtype.hasobject
+            and obj.nbytes >= _SNAPSHOT_MIN_ARRAY_BYTES
+        ):
+            return ("ndarray", self._save_array(obj, obj))
+        return None
+
+    def _save_array(self, obj: object, array: np.ndarray) -> str:
+        if id(obj) not in self._saved:
+            name = f"{len(self._saved):05d}.npy"
+            np.save(self.array_dir / name, array)
+            self._saved[id(obj)] = name
+        return self._saved[id(obj)]
+
+
+class _SnapshotUnpickler(pickle.Unpickler):
+    def __init__(
+        self, file: object, array_dir: Path, models: list[Architecture]
+    ) -> None:
+        super().__init__(file)
+        self.array_dir = array_dir
+        self.params = [dict(model.named_parameters()) for model in models]
+
+    def persistent_load(self, pid: tuple) -> object:
+        kind = pid[0]
+        if kind == "model_cache":
+            # Replaced once the whole engine is loaded.
+            return None
+        if kind == "parameter":
+            _, model_index, name = pid
+            return self.params[model_index][name]
+        # Copy-on-write, so that the arrays are writable but only read on demand.
+        array = np.load(self.array_dir / pid[1], mmap_mode="c")
+        if kind == "ndarray":
+            return array
+        if kind == "tensor":
+            tensor = torch.from_numpy(array)
+            if pid[2] == "bfloat16":
+                tensor = tensor.view(torch.bfloat16)
+            return tensor
+        raise pickle.UnpicklingError(f"Unknown persistent id: {kind}")
+
+
+def _save_snapshot(engine: InferenceEngine, path: Path) -> None:
+    # Write to a temporary directory first, so that an existing snapshot is only
+    # replaced by a complete one.
+    tmp = path.with_name(f".{path.name}.tmp-{os.getpid()}")
+    if tmp.exists():
+        shutil.rmtree(tmp)
+    (tmp / "arrays").mkdir(parents=True)
+
+    # The KV engine's members hold their KV caches, so their modules are saved, but
+    # their parameters are the shared model weights.
+    kv_models = None
+    param_names: dict[int, tuple[int, str]] = {}
+    if isinstance(engine, InferenceEngineCacheKV):
+        kv_models = [model_cache._model for model_cache in engine.model_caches]
+        for config, model in zip(engine.ensemble_configs, kv_models):
+            for name, param in model.named_parameters():
+                param_names[id(param)] = (config._model_index, name)
+
+    with open(tmp / "engine.pkl", "wb") as f:
+        _SnapshotPickler(f, tmp / "arrays", param_names).dump(
+            {"engine": engine, "kv_models": kv_models}
+        )
+    with open(tmp / "meta.json", "w", encoding="utf-8") as f:
+        json.dump({"version": _SNAPSHOT_VERSION, "type": type(engine).__name__}, f)
+
+    if path.exists():
+        shutil.rmtree(path)
+    os.replace(tmp, path)
+
+
+def _load_snapshot(path: Path, models: list[Architecture]) -> InferenceEngine:
+    with open(path / "meta.json", encoding="utf-8") as f:
+        meta = json.load(f)
+    if meta["version"] != _SNAPSHOT_VERSION:
+        raise ValueError(f"Unsupported snapshot version: {meta['version']}")
+
+    with open(path / "engine.pkl", "rb") as f:
+        state = _SnapshotUnpickler(f, path / "arrays", models).load()
+
+    engine: InferenceEngine = state["engine"]
+    kv_models = state["kv_models"]
+    if kv_models is not None:
+        _unshare_weights_across_devices(kv_models, engine.member_devices)
+    engine.model_caches = [
+        _PerDeviceModelCache(model)
+        for model in (kv_models if kv_models is not None else models)
+    ]
+    if kv_models is not None:
+        _link_shared_weights(engine.model_caches)
+    return engine
+
+
+def _unshare_weights_across_devices(
+    kv_models: list[Architecture], member_devices: list[torch.device]
+) -> None:
+    # The loaded members of a model all use its parameters, but members that were
+    # sharded over several devices run concurrently, so they need one copy of the
+    # weights per device, as created by `_SharedWeights`.
+    copies: dict[tuple[int, torch.device], dict[int, torch.nn.Parameter]] = {}
+    first_device: dict[int, torch.device] = {}
+    for model, device in zip(kv_models, member_devices):
+        param = next(model.parameters(), None)
+        if param is None or first_device.setdefault(id(param), device) == device:
+            continue
+        replacements = copies.setdefault((id(param), device), {})
+        for module in model.modules():
+            for name, p in module._parameters.items():  # noqa: SLF001
+                if p is None:
+                    continue
+                if id(p) not in replacements:
+                    replacements[id(p)] = torch.nn.Parameter(
+                        p.detach().clone(), requires_grad=p.requires_grad
+                    )
+                module._parameters[name] = replacements[id(p)]  # noqa: SLF001
@@ -2,15 +2,44 @@
 
 from __future__ import annotations
 
+import heapq
+import os
 import queue
-from collections.abc import Generator, Iterable, Sequence
-from multiprocessing.pool import ThreadPool
-from typing import Callable, Generic, Protocol, TypeVar
+import shutil
+import tempfile
+import time
+import warnings
+import weakref
+from collections import OrderedDict
+from collections.abc import Generator, Iterable, Iterator, Sequence
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from threading import Condition, Lock, Thread
+from typing import Any, Callable, Generic, Literal, Protocol, TypeVar
 
+import numpy as np
 import torch
 
+# Importing torch.multiprocessing registers the pickling of tensors through shared
+# memory, which the process backend relies on for its inputs and outputs.
+import torch.multiprocessing as torch_mp
+
 R_co = TypeVar("R_co", covariant=True)
 
+ParallelBackend = Literal["thread", "process"]
+"""How `parallel_execute()` runs functions on several devices, see its docstring."""
+
+# The default number of threads per logical CPU device of `cpu_devices()`. The forward
+# pass of a single member scales well up to a few threads, beyond that it is faster to
+# run several members side by side.
+CPU_THREADS_PER_DEVICE = 4
+
+# With `device_indices`, the functions queued or running per device: one running and
+# one waiting, so that a device never waits for the caller to take its next function.
+_ASSIGNED_IN_FLIGHT_PER_DEVICE = 2
+
 
 class ParallelFunction(Protocol, Generic[R_co]):
     """Interface that functions submitted to `parallel_execute()` should implement."""
@@ -32,9 +61,86 @@ class ParallelFunction(Protocol, Generic[R_co]):
         ...
 
 
+@dataclass
+class ParallelExecutionStats:
+    """The device utilisation of a `parallel_execute()` call.
+
+    Pass an instance to `parallel_execute()`, it is filled in while the generator is
+    consumed.
+    """
+
+    wall_seconds: float = 0.0
+    """The time from the first call of the generator until it was exhausted."""
+
+    busy_seconds: dict[torch.device, float] = field(default_factory=dict)
+    """The time each device spent executing functions. On CUDA devices this is the
+    time between events recorded around the function on its stream."""
+
+    n_functions: dict[torch.device, int] = field(default_factory=dict)
+    """The number of functions each device executed."""
+
+    @property
+    def utilisation(self) -> dict[torch.device, float]:
+        """The fraction of the wall time that each device was busy."""
+        return {
+            device: busy / self.wall_seconds if self.wall_seconds > 0 else 0.0
+            for device, busy in self.busy_seconds.items()
+        }
+
+    def _record(self, device: torch.device, seconds: float) -> None:
+        self.busy_seconds[device] = self.busy_seconds.get(device, 0.0) + seconds
+        self.n_functions[device] = self.n_functions.get(device, 0) + 1
+
+
+def cpu_devices(
+    n_devices: int | None = None, *, n_threads: int | None = None
+) -> list[torch.device]:
+    """Split the CPU cores into logical devices for `parallel_execute()`.
+
+    The devices are ``cpu:0``, ``cpu:1``, ..., which PyTorch all maps to the CPU. When
+    `parallel_execute()` runs on several of them, each device gets its own thread with
+    an equal share of the intra-op threads (``torch.set_num_threads()``), so that
+    ensemble members are evaluated concurrently on separate groups of cores instead
+    of one after the other on all cores.
+
+    Args:
+        n_devices: The number of logical devices. Defaults to one per
+            `CPU_THREADS_PER_DEVICE` threads.
+        n_threads: The number of threads to split. Defaults to
+            ``torch.get_num_threads()``.
+
+    Returns:
+        The logical devices, or the single ``cpu`` device if there is only one.
+    """
+    if n_threads is None:
+        n_threads = torch.get_num_threads()
+    if n_devices is None:
+        n_devices = n_threads // CPU_THREADS_PER_DEVICE
+    else:
+        n_cores = os.cpu_count() or 1
+        if n_devices > min(n_threads, n_cores):
+            warnings.warn(
+                f"Asked for {n_devices} logical CPU devices, but there are only "
+                f"{n_threads} threads on {n_cores} cores, so the devices would compete "
+                f"for the same cores. Using {max(min(n_devices, n_threads), 1)}.",
+                UserWarning,
+                stacklevel=2,
+            )
+    n_devices = max(min(n_devices, n_threads), 1)
+    if n_devices == 1:
+        return [torch.device("cpu")]
+    return [torch.device("cpu", i) for i in range(n_devices)]
+
+
 def parallel_execute(
     devices: Sequence[torch.device],
     functions: Iterable[ParallelFunction[R_co]],
+    *,
+    device_indices: Sequence[int] | None = None,
+    costs: Sequence[float] | None = None,
+    lookahead: int | None = None,
+    stats: ParallelExecutionStats | None = None,
+    backend: ParallelBackend = "thread",
 ) -> Generator[R_co]:
     """Evaluate the given functions in parallel across `devices`.
 
@@ -45,74 +151,547 @@ def parallel_execute(
     If only one device is provided, then the functions are executed in the current
     thread to reduce overhead.
 
+    Otherwise, each device has a worker thread that takes the next function as soon
+    as it is free. Only `lookahead` functions are taken from `functions` at a time,
+    so lazily created functions and their inputs are not all materialised at once.
+    Among these, the functions with the largest `costs` are executed first, which
+    keeps a slow function from being started last and leaving the other devices
+    idle. The threads of CPU devices share the intra-op threads of the calling thread
+    equally, see `cpu_devices()`.
+
+    With ``backend="process"``, the functions are executed in a pool of worker
+    processes instead, one per device, which avoids contention on the global
+    interpreter lock for Python-heavy functions. This is only supported for CPU
+    devices. The functions and their results must be picklable: tensors are passed
+    through shared memory without copying, see `shared_tensor()`, and modules should
+    be wrapped in a `MappedModule`. The pool is kept for later calls with the same
+    devices.
+
     Args:
         devices: The devices to use for evaluation.
         functions: The functions to evaluate following the `ParallelFunction` protocol.
+        device_indices: If given, function ``i`` is executed on
+            ``devices[device_indices[i]]``, e.g. because its state already lives
+            there. The functions are still taken lazily, at most two per device
+            ahead of its results. Otherwise, each function is executed on the next
+            free device.
+        costs: Optional estimates of the relative run time of each function, in the
+            order of `functions`. Not used with `device_indices`.
+        lookahead: The maximum number of functions that are taken from `functions`
+            but whose results are not returned yet. Defaults to twice the number of
+            devices. Not used with `device_indices`.
+        stats: If given, filled in with the device utilisation.
+        backend: ``"thread"`` or ``"process"``, see above. Not used with a single
+            device or with `device_indices`.
 
     Returns:
         A generator consisting of the return values of the functions, in the same order
         as `functions`.
     """
+    _check_backend(backend)
     if len(devices) == 1:
         # If we only have one device then just use the current thread to avoid overhead.
-        yield from _execute_in_current_thread(devices[0], functions)
+        indexed_results = _execute_in_current_thread(devices[0], functions, stats)
+    elif device_indices is not None:
+        indexed_results = _execute_on_assigned_devices(
+            devices, functions, device_indices, stats
+        )
+    elif backend == "process":
+        _check_process_devices(devices)
+        indexed_results = _in_order(
+            _execute_in_processes(
+                devices, functions, costs=costs, lookahead=lookahead, stats=stats
+            )
+        )
     else:
-        yield from _execute_with_multithreading(devices, functions)
+        indexed_results = _in_order(
+            _execute_with_work_stealing(
+                devices, functions, costs=costs, lookahead=lookahead, stats=stats
+            )
+        )
+    for _, result in _timed(indexed_results, stats):
+        yield result
+
+
+def parallel_execute_as_completed(
+    devices: Sequence[torch.device],
+    functions: Iterable[ParallelFunction[R_co]],
+    *,
+    costs: Sequence[float] | None = None,
+    lookahead: int | None = None,
+    stats: ParallelExecutionStats | None = None,
+    backend: ParallelBackend = "thread",
+) -> Generator[tuple[int, R_co]]:
+    """Like `parallel_execute()`, but yields the results as soon as they are ready.
+
+    A slow function then does not hold back the results of the functions after it.
+
+    Returns:
+        A generator of ``(index, result)`` pairs in the order in which the functions
+        completed, where ``index`` is the position of the function in `functions`.
+    """
+    _check_backend(backend)
+    if len(devices) == 1:
+        indexed_results = _execute_in_current_thread(devices[0], functions, stats)
+    elif backend == "process":
+        _check_process_devices(devices)
+        indexed_results = _execute_in_processes(
+            devices, functions, costs=costs, lookahead=lookahead, stats=stats
+        )
+    else:
+        indexed_results = _execute_with_work_stealing(
+            devices, functions, costs=costs, lookahead=lookahead, stats=stats
+        )
+    yield from _timed(indexed_results, stats)
+
+
+def _check_backend(backend: ParallelBackend) -> None:
+    if backend not in ("thread", "process"):
+        raise ValueError(f"Unknown parallel backend {backend!r}.")
+
+
+def _check_process_devices(devices: Sequence[torch.device]) -> None:
+    # Only checked once the process pool is actually used: with a single device the
+    # functions run in the current thread, whatever the backend.
+    if any(device.type != "cpu" for device in devices):
+        raise ValueError('backend="process" only supports CPU devices.')
+
+
+def _timed(
+    indexed_results: Iterator[tuple[int, R_co]],
+    stats: ParallelExecutionStats | None,
+) -> Generator[tuple[int, R_co]]:
+    start = time.perf_counter()
+    try:
+        yield from indexed_results
+    finally:
+        if stats is not None:
+            stats.wall_seconds += time.perf_counter() - start
+
+
+def _in_order(
+    indexed_results: Iterator[tuple[int, R_co]],
+) -> Generator[tuple[int, R_co]]:
+    # Hold back the results that complete early until all results before them are
+    # yielded.
+    ready: dict[int, R_co] = {}
+    next_index = 0
+    for index, result in indexed_results:
+        ready[index] = result
+        while next_index in ready:
+            yield next_index, ready.pop(next_index)
+            next_index += 1
 
 
 def _execute_in_current_thread(
-    device: torch.device, functions: Iterable[ParallelFunction[R_co]]
-) -> Generator[R_co]:
-    for function in functions:
-        yield function(device=device, is_parallel=False)
+    device: torch.device,
+    functions: Iterable[ParallelFunction[R_co]],
+    stats: ParallelExecutionStats | None,
+) -> Generator[tuple[int, R_co]]:
+    for index, function in enumerate(functions):
+        if stats is None:
+            yield index, function(device=device, is_parallel=False)
+        else:
+            yield index, _run_on_device(device, function, stats, is_parallel=False)()
 
 
-def _execute_with_multithreading(
+def _execute_with_work_stealing(
     devices: Sequence[torch.device],
     functions: Iterable[ParallelFunction[R_co]],
-) -> Generator[R_co]:
-    free_devices: queue.Queue[int] = queue.Queue(maxsize=len(devices))
-    for device_index, _ in enumerate(devices):
-        free_devices.put(device_index, block=False)
-
-    with ThreadPool(processes=len(devices)) as pool:
-        async_results = [
-            pool.apply_async(_execute_function_in_thread, (devices, free_devices, func))
-            for func in functions
-        ]
-        for async_result in async_results:
-            sync_and_get_output = async_result.get()
-            yield sync_and_get_output()
-
-
-def _execute_function_in_thread(
-    all_devices: Sequence[torch.device],
-    free_devices: queue.Queue[int],
+    *,
+    costs: Sequence[float] | None,
+    lookahead: int | None,
+    stats: ParallelExecutionStats | None,
+) -> Generator[tuple[int, R_co]]:
+    lookahead = max(lookahead or 2 * len(devices), 1)
+    function_iterator = enumerate(functions)
+    # The functions taken from `functions` but not started yet, largest cost first.
+    # Only the consumer takes functions, as `functions` may be a generator.
+    pending: list[tuple[float, int, ParallelFunction[R_co]]] = []
+    completed: queue.Queue[tuple[int, Callable[[], R_co]]] = queue.Queue()
+    condition = Condition()
+    stopped = False
+
+    n_threads_before = torch.get_num_threads()
+    thread_budgets = _cpu_thread_budgets(devices)
+
+    def _work(device: torch.device, n_threads: int | None) -> None:
+        with _intra_op_threads(n_threads, restore=n_threads_before):
+            while True:
+                with condition:
+                    while not pending and not stopped:
+                        condition.wait()
+                    if stopped:
+                        return
+                    _, index, function = heapq.heappop(pending)
+                try:
+                    sync_and_get_output = _run_on_device(device, function, stats)
+                except BaseException as e:  # noqa: BLE001
+                    sync_and_get_output = _raiser(e)
+                completed.put((index, sync_and_get_output))
+
+    workers = [
+        Thread(target=_work, args=(device, n_threads), daemon=True)
+        for device, n_threads in zip(devices, thread_budgets)
+    ]
+    for worker in workers:
+        worker.start()
+
+    n_taken = n_returned = 0
+    exhausted = False
+    try:
+        while True:
+            with condition:
+                while not exhausted and n_taken - n_returned < lookahead:
+                    next_function = next(function_iterator, None)
+                    if next_function is None:
+                        exhausted = True
+                        break
+                    index, function = next_function
+                    cost = costs[index] if costs is not None else 0.0
+                    # heapq is a min-heap; ties keep the order of `functions`.
+                    heapq.heappush(pending, (-cost, index, function))
+                    n_taken += 1
+                condition.notify_all()
+            if n_returned == n_taken:
+                return
+            index, sync_and_get_output = completed.get()
+            n_returned += 1
+            yield index, sync_and_get_output()
+    finally:
+        with condition:
+            stopped = True
+            condition.notify_all()
+        for worker in workers:
+            worker.join()
+
+
+def _raiser(e: BaseException) -> Callable[[], R_co]:
+    def _raise() -> R_co:
+        raise e
+
+    return _raise
+
+
+def _execute_in_processes(
+    devices: Sequence[torch.device],
+    functions: Iterable[ParallelFunction[R_co]],
+    *,
+    costs: Sequence[float] | None,
+    lookahead: int | None,
+    stats: ParallelExecutionStats | None,
+) -> Generator[tuple[int, R_co]]:
+    pool = _process_pool(devices)
+    lookahead = max(lookahead or 2 * len(devices), 1)
+    function_iterator = enumerate(functions)
+    pending: list[tuple[float, int, ParallelFunction[R_co]]] = []
+    running: dict[Future, int] = {}
+    exhausted = False
+    try:
+        while True:
+            while not exhausted and len(pending) + len(running) < lookahead:
+                next_function = next(function_iterator, None)
+                if next_function is None:
+                    exhausted = True
+                    break
+                index, function = next_function
+                cost = costs[index] if costs is not None else 0.0
+                heapq.heappush(pending, (-cost, index, function))
+            # Only submit as many functions as there are workers, so that the pending
+            # ones can still be reordered by cost.
+            while pending and len(running) < len(devices):
+                _, index, function = heapq.heappop(pending)
+                running[pool.submit(_run_in_worker_process, function)] = index
+            if not running:
+                return
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in sorted(done, key=running.__getitem__):
+                index = running.pop(future)
+                try:
+                    output, device_index, seconds = future.result()
+                except BrokenProcessPool:
+                    # E.g. a worker failed to unpickle a function, start over next time.
+                    _discard_process_pool(devices, pool)
+                    raise
+                if stats is not None:
+                    stats._record(devices[device_index], seconds)
+                yield index, output
+    finally:
+        for future in running:
+            future.cancel()
+
+
+# The process pools of `parallel_execute()`, by devices. They are kept between calls,
+# so that the workers keep the modules they have loaded, see `MappedModule`.
+_process_pools: dict[tuple[torch.device, ...], ProcessPoolExecutor] = {}
+_process_pools_lock = Lock()
+
+# The device index and device of a worker process.
+_worker_device: tuple[int, torch.device] | None = None
+
+
+def _process_pool(devices: Sequence[torch.device]) -> ProcessPoolExecutor:
+    key = tuple(devices)
+    with _process_pools_lock:
+        pool = _process_pools.get(key)
+        if pool is None:
+            # Spawn rather than fork: forking a process that runs PyTorch threads is
+            # not safe.
+            context = torch_mp.get_context("spawn")
+            device_indices = context.Queue()
+            for device_index in range(len(devices)):
+                device_indices.put(device_index)
+            pool = ProcessPoolExecutor(
+                max_workers=len(devices),
+                mp_context=context,
+                initializer=_init_worker_process,
+                initargs=(list(devices), _cpu_thread_budgets(devices), device_indices),
+            )
+            _process_pools[key] = pool
+        return pool
+
+
+def _discard_process_pool(
+    devices: Sequence[torch.device], pool: ProcessPoolExecutor
+) -> None:
+    with _process_pools_lock:
+        if _process_pools.get(tuple(devices)) is pool:
+            del _process_pools[tuple(devices)]
+    pool.shutdown(wait=False, cancel_futures=True)
+
+
+def _init_worker_process(
+    devices: list[torch.device],
+    thread_budgets: list[int | None],
+    device_indices: Any,
+) -> None:
+    global _worker_device  # noqa: PLW0603
+    device_index = device_indices.get()
+    _worker_device = (device_index, devices[device_index])
+    n_threads = thread_budgets[device_index]
+    if n_threads is not None:
+        # The worker process is dedicated to its device, so the budget is not reset.
+        torch.set_num_threads(n_threads)
+
+
+def _run_in_worker_process(
     function: ParallelFunction[R_co],
-) -> Callable[[], R_co]:
-    device_index = free_devices.get(block=True)
+) -> tuple[R_co, int, float]:
+    assert _worker_device is not None
+    device_index, device = _worker_device
+    start = time.perf_counter()
+    output = function(device=device, is_parallel=True)
+    return output, device_index, time.perf_counter() - start
+
+
+def shared_tensor(array: np.ndarray | torch.Tensor) -> torch.Tensor:
+    """Return a CPU tensor with the data of `array` in shared memory.
+
+    Such tensors are passed to the worker processes of ``backend="process"`` by a
+    handle to the memory, not by copying the data. Tensors that are already shared
+    are returned as is.
+    """
+    tensor = torch.as_tensor(array)
+    if tensor.is_shared():
+        return tensor
+    return torch.empty_like(tensor, device="cpu").share_memory_().copy_(tensor)
+
+
+class MappedModule:
+    """A module that the worker processes of `parallel_execute()` share read-only.
+
+    Pickling it does not copy the weights: the module is saved to a temporary file
+    once, and each worker process loads it from there on first use, memory-mapped,
+    so that all processes read the same pages. The workers keep the loaded module
+    for later calls. Changes to the module after it was first pickled are not seen
+    by the workers; create a new `MappedModule` instead.
+    """
+
+    def __init__(self, module: torch.nn.Module) -> None:
+        super().__init__()
+        self.module = module
+        self._path: str | None = None
+        self._lock = Lock()
+
+    def __reduce__(self) -> tuple[Callable[[str], MappedModule], tuple[str]]:
+        with self._lock:
+            if self._path is None:
+                directory = tempfile.mkdtemp(prefix="tabpfn_mapped_module_")
+                self._path = os.path.join(directory, "module.pt")
+                torch.save(self.module, self._path)
+                weakref.finalize(self, shutil.rmtree, directory, ignore_errors=True)
+        return _load_mapped_module, (self._path,)
+
+
+# The modules loaded by a worker process, by path, least recently used first.
+_mapped_modules: OrderedDict[str, MappedModule] = OrderedDict()
+_MAX_MAPPED_MODULES = 8
+
+
+def _load_mapped_module(path: str) -> MappedModule:
+    mapped = _mapped_modules.get(path)
+    if mapped is None:
+        module = torch.load(path, mmap=True, weights_only=False)
+        mapped = MappedModule(module)
+        mapped._path = path
+        _mapped_modules[path] = mapped
+        if len(_mapped_modules) > _MAX_MAPPED_MODULES:
+            _mapped_modules.popitem(last=False)
+    _mapped_modules.move_to_end(path)
+    return mapped
+
+
+def _execute_on_assigned_devices(
+    devices: Sequence[torch.device],
+    functions: Iterable[ParallelFunction[R_co]],
+    device_indices: Sequence[int],
+    stats: ParallelExecutionStats | None,
+) -> Generator[tuple[int, R_co]]:
+    # Each device has a worker thread fed by its own queue. The functions are taken
+    # from `functions` in order, but only while the device of the next one has fewer
+    # than `_ASSIGNED_IN_FLIGHT_PER_DEVICE` functions queued or running, so lazily
+    # created functions are not all materialised at once.
+    n_functions = len(device_indices)
+    function_iterator = enumerate(functions)
+    assigned: list[queue.Queue[tuple[int, ParallelFunction[R_co]] | None]] = [
+        queue.Queue() for _ in devices
+    ]
+    completed: queue.Queue[tuple[int, Callable[[], R_co]]] = queue.Queue()
+    n_threads_before = torch.get_num_threads()
+    thread_budgets = _cpu_thread_budgets(devices)
+
+    def _work(device_index: int, n_threads: int | None) -> None:
+        with _intra_op_threads(n_threads, restore=n_threads_before):
+            while (item := assigned[device_index].get()) is not None:
+                index, function = item
+                try:
+                    sync_and_get_output = _run_on_device(
+                        devices[device_index], function, stats
+                    )
+                except BaseException as e:  # noqa: BLE001
+                    sync_and_get_output = _raiser(e)
+                completed.put((index, sync_and_get_output))
+
+    workers = [
+        Thread(target=_work, args=(i, n_threads), daemon=True)
+        for i, n_threads in enumerate(thread_budgets)
+    ]
+    for worker in workers:
+        worker.start()
+
+    in_flight = [0] * len(devices)
+    next_function = next(function_iterator, None)
+    n_taken = n_returned = 0
+    ready: dict[int, Callable[[], R_co]] = {}
     try:
-        device = all_devices[device_index]
-        if device.type == "cuda":
-            with torch.cuda.device(device):
-                output = function(device=device, is_parallel=True)
-
-                # The output will be consumed on a different cuda stream, which needs to
-                # wait for the computation on this stream to be complete. Thus we insert
-                # "ready" event after the model evaluation, and return a function to the
-                # consumer that waits on this event.
-                output_ready_event = torch.cuda.Event()
-                output_ready_event.record()
-
-                def sync_stream_and_get_output() -> R_co:
-                    output_ready_event.synchronize()
-                    return output
-
-                return sync_stream_and_get_output
-
-        # Theoretically it is possible to parallelise over classes of device other than
-        # GPUs, but mainly this is useful for unit testing with multiple CPU devices.
-        output = function(device=device, is_parallel=True)
-        return lambda: output
+        while True:
+            while next_function is not None:
+                index, function = next_function
+                if index >= n_functions:
+                    raise ValueError("Expected one device index per function.")
+                device_index = device_indices[index]
+                if in_flight[device_index] >= _ASSIGNED_IN_FLIGHT_PER_DEVICE:
+                    break
+                assigned[device_index].put((index, function))
+                in_flight[device_index] += 1
+                n_taken += 1
+                next_function = next(function_iterator, None)
+            if n_returned == n_taken:
+                if n_taken != n_functions:
+                    raise ValueError("Expected one device index per function.")
+                return
+            index, sync_and_get_output = completed.get()
+            in_flight[device_indices[index]] -= 1
+            ready[index] = sync_and_get_output
+            # The results are returned in order, like the other execution paths.
+            while n_returned in ready:
+                yield n_returned, ready.pop(n_returned)()
+                n_returned += 1
     finally:
-        free_devices.put(device_index)
+        for device_queue in assigned:
+            device_queue.put(None)
+        for worker in workers:
+            worker.join()
+
+
+@contextmanager
+def _intra_op_threads(n_threads: int | None, *, restore: int) -> Iterator[None]:
+    # `torch.set_num_threads()` sets the intra-op threads of the calling thread and
+    # the default of all threads created afterwards, from any thread; threads that
+    # already exist keep theirs. So a worker sets its budget and restores the count
+    # of the caller, read before the workers started, once it is done. Otherwise the
+    # next `parallel_execute()` call and any other new thread would start with a
+    # device's share only.
+    if n_threads is None:
+        yield
+        return
+    torch.set_num_threads(n_threads)
+    try:
+        yield
+    finally:
+        torch.set_num_threads(restore)
+
+
+def _cpu_thread_budgets(devices: Sequence[torch.device]) -> list[int | None]:
+    # Split the intra-op threads of the calling thread between the CPU devices, the
+    # first devices get one more if they do not divide evenly. None for other devices.
+    # The workers apply them with `_intra_op_threads()`.
+    n_cpu_devices = sum(device.type == "cpu" for device in devices)
+    n_threads = torch.get_num_threads()
+    if n_cpu_devices > n_threads:
+        warnings.warn(
+            f"{n_cpu_devices} CPU devices share {n_threads} intra-op threads, so each "
+            "gets one thread and they compete for the same cores. Use fewer devices, "
+            "see `cpu_devices()`.",
+            UserWarning,
+            stacklevel=3,
+        )
+    budgets: list[int | None] = []
+    cpu_rank = 0
+    for device in devices:
+        if device.type != "cpu":
+            budgets.append(None)
+            continue
+        share = n_threads // n_cpu_devices + (cpu_rank < n_threads % n_cpu_devices)
+        budgets.append(max(share, 1))
+        cpu_rank += 1
+    return budgets
+
+
+def _run_on_device(
+    device: torch.device,
+    function: ParallelFunction[R_co],
+    stats: ParallelExecutionStats | None,
+    *,
+    is_parallel: bool = True,
+) -> Callable[[], R_co]:
+    if device.type == "cuda":
+        with torch.cuda.device(device):
+            if stats is not None:
+                start_event = torch.cuda.Event(enable_timing=True)
+                start_event.record()
+            output = function(device=device, is_parallel=is_parallel)
+
+            # The output will be consumed on a different cuda stream, which needs to
+            # wait for the computation on this stream to be complete. Thus we insert
+            # "ready" event after the model evaluation, and return a function to the
+            # consumer that waits on this event.
+            output_ready_event = torch.cuda.Event(enable_timing=stats is not None)
+            output_ready_event.record()
+
+            def sync_stream_and_get_output() -> R_co:
+                output_ready_event.synchronize()
+                if stats is not None:
+                    elapsed_ms = start_event.elapsed_time(output_ready_event)
+                    stats._record(device, elapsed_ms / 1000)
+                return output
+
+            return sync_stream_and_get_output
+
+    # Besides unit testing, several CPU devices are useful to run functions
+    # concurrently on separate groups of cores, see `cpu_devices()`.
+    start = time.perf_counter()
+    output = function(device=device, is_parallel=is_parallel)
+    if stats is not None:
+        stats._record(device, time.perf_counter() - start)
+    return lambda: output
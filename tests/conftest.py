@@ -0,0 +1,5 @@
+import sys
+from pathlib import Path
+
+# The packages live in src/ without being installed, as in run_localization_hybrid.py.
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "src"))
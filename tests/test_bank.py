@@ -0,0 +1,59 @@
+from __future__ import annotations
+
+from pathlib import Path
+
+import numpy as np
+from sklearn.preprocessing import LabelEncoder, MinMaxScaler
+
+from localization.bank import TrainBank
+from localization.windows import sliding_window_matrix
+
+WINDOW_SIZE = 3
+
+
+def test_append_matches_full_refit(tmp_path: Path) -> None:
+    rng = np.random.default_rng(0)
+    X_old = rng.random((20, 2))
+    # These rows sit at the minimum of feature 0, so growing its maximum leaves the
+    # windows made only of them unchanged.
+    X_old[:6, 0] = 0.0
+    labels_old = rng.choice(["A", "C"], 20)
+    # Feature 0 grows beyond its range and class "B" is new.
+    X_new = rng.random((10, 2)) * [2.0, 1.0]
+    labels_new = rng.choice(["A", "B", "C"], 10)
+
+    bank = TrainBank(tmp_path, ["f0", "f1"], WINDOW_SIZE)
+    first = bank.append(X_old, labels_old)
+    bank.ingested_files.append("hour_0.xlsx")
+    bank.save()
+    bank = TrainBank.load(tmp_path)
+    second = bank.append(X_new, labels_new)
+
+    X_all = np.concatenate([X_old, X_new])
+    labels_all = np.concatenate([labels_old, labels_new])
+    X_refit = sliding_window_matrix(MinMaxScaler().fit_transform(X_all), WINDOW_SIZE)
+    y_refit = LabelEncoder().fit_transform(labels_all)[WINDOW_SIZE:]
+
+    # Exactly the reported windows went stale, and rescaling them restores the refit.
+    np.testing.assert_array_equal(second.changed_features, [0])
+    assert not np.isin(np.arange(6), second.rescale_rows).any()
+    stale = ~np.isclose(first.X_windows, X_refit[: len(first.X_windows)]).all(axis=1)
+    np.testing.assert_array_equal(second.rescale_windows, np.flatnonzero(stale))
+    assert 0 < len(second.rescale_windows) < len(first.X_windows)
+    X_windows = first.X_windows.copy()
+    X_windows[second.rescale_windows] = sliding_window_matrix(
+        bank.scaled_rows(), WINDOW_SIZE
+    )[second.rescale_windows]
+
+    assert second.first_window == len(first.X_windows)
+    np.testing.assert_allclose(
+        np.concatenate([X_windows, second.X_windows]), X_refit
+    )
+    np.testing.assert_array_equal(
+        np.concatenate([second.label_remap[first.y_windows], second.y_windows]),
+        y_refit,
+    )
+    np.testing.assert_array_equal(
+        bank.labels(), LabelEncoder().fit_transform(labels_all)
+    )
+    assert bank.ingested_files == ["hour_0.xlsx"]
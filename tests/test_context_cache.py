@@ -0,0 +1,77 @@
+from __future__ import annotations
+
+import dataclasses
+
+import numpy as np
+import pytest
+from sklearn.base import BaseEstimator, ClassifierMixin
+
+from localization.context_cache import ContextCache
+
+
+@dataclasses.dataclass
+class _Engine:
+    """A fitted 1-NN over the context in the classifier's prepared space."""
+
+    X_train: np.ndarray
+    y_train: np.ndarray
+
+    def with_train_set(self, X_train: np.ndarray, y_train: np.ndarray) -> _Engine:
+        return _Engine(np.asarray(X_train), np.asarray(y_train))
+
+    def predict(self, X: np.ndarray) -> np.ndarray:
+        distances = ((X[:, None, :] - self.X_train[None]) ** 2).sum(-1)
+        return self.y_train[distances.argmin(1)]
+
+
+class _Classifier(ClassifierMixin, BaseEstimator):
+    """Has the fitted state of `TabPFNClassifier` that `ContextCache` patches.
+
+    Columns with at most `max_categories` values are inferred as categorical and moved
+    to the front before they reach the engine, like the classifier's ordinal encoder.
+    """
+
+    def __init__(self, max_categories: int = 2) -> None:
+        self.max_categories = max_categories
+
+    def fit(self, X: np.ndarray, y: np.ndarray) -> _Classifier:
+        X = np.asarray(X, dtype=np.float64)
+        n_values = [len(np.unique(column)) for column in X.T]
+        self.inferred_categorical_indices_ = [
+            i for i, n in enumerate(n_values) if n <= self.max_categories
+        ]
+        self.classes_, y_encoded = np.unique(y, return_inverse=True)
+        self.executor_ = _Engine(self._prepare(X), y_encoded)
+        return self
+
+    def predict(self, X: np.ndarray) -> np.ndarray:
+        return self.classes_[self.executor_.predict(self._prepare(X))]
+
+    def _prepare(self, X: np.ndarray) -> np.ndarray:
+        categorical = self.inferred_categorical_indices_
+        numeric = [i for i in range(X.shape[1]) if i not in categorical]
+        return np.asarray(X, dtype=np.float64)[:, categorical + numeric]
+
+
+@pytest.mark.parametrize(
+    ("n_categorical", "expected_status"), [(0, "patched"), (1, "miss")]
+)
+def test_patched_classifier_predicts_like_a_fresh_fit(
+    n_categorical: int, expected_status: str
+) -> None:
+    rng = np.random.default_rng(0)
+    X_train = rng.random((60, 3))
+    # The categorical column is the last one, so the encoder reorders the columns.
+    X_train[:, 3 - n_categorical :] = rng.integers(0, 2, (60, n_categorical))
+    y_train = np.arange(60) % 3
+    X_test = rng.random((20, 3))
+    X_test[:, 3 - n_categorical :] = rng.integers(0, 2, (20, n_categorical))
+
+    cache = ContextCache(_Classifier(), max_jaccard_distance=0.2)
+    cache.fit(np.arange(0, 40), X_train, y_train)
+    context = np.arange(2, 42)
+    clf, status = cache.fit(context, X_train, y_train)
+
+    assert status == expected_status
+    fresh = _Classifier().fit(X_train[context], y_train[context])
+    np.testing.assert_array_equal(clf.predict(X_test), fresh.predict(X_test))
@@ -0,0 +1,39 @@
+from __future__ import annotations
+
+import numpy as np
+import pytest
+
+from localization.fusion import plan_fused_contexts
+
+
+@pytest.mark.parametrize(("n_common", "n_union"), [(1, 10), (3, 5), (2, 6), (4, 12)])
+def test_contexts_fuse_exactly_at_the_overlap_threshold(
+    n_common: int, n_union: int
+) -> None:
+    # Two contexts of equal size sharing `n_common` of their `n_union` rows.
+    size = (n_union + n_common) // 2
+    a = np.arange(size)
+    b = np.arange(size - n_common, n_union)
+    contexts = [(np.array([0]), a), (np.array([1]), b)]
+
+    at_threshold = plan_fused_contexts(contexts, min_overlap=n_common / n_union)
+    above = plan_fused_contexts(
+        contexts, min_overlap=np.nextafter(n_common / n_union, 1.0)
+    )
+
+    assert [g.members for g in at_threshold.groups] == [[0, 1]]
+    np.testing.assert_array_equal(at_threshold.groups[0].query_rows, [0, 1])
+    np.testing.assert_array_equal(
+        at_threshold.groups[0].context_indices, np.arange(n_union)
+    )
+    assert at_threshold.n_forwards_saved == 1
+    assert [g.members for g in above.groups] == [[0], [1]]
+
+
+def test_limits_start_a_new_group() -> None:
+    contexts = [(np.array([i]), np.arange(i, i + 10)) for i in range(3)]
+
+    plan = plan_fused_contexts(contexts, min_overlap=0.5, max_context_size=11)
+
+    assert [g.members for g in plan.groups] == [[0, 1], [2]]
+    assert plan.n_forwards == 2
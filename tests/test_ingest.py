@@ -0,0 +1,82 @@
+from __future__ import annotations
+
+import os
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from localization import ingest
+from localization.ingest import SensorFileCache
+
+
+@pytest.fixture
+def workbook(tmp_path: Path) -> Path:
+    # Only the file's mtime and size matter to the cache; parsing is mocked.
+    path = tmp_path / "sensor_data_2024-07-11_11.xlsx"
+    path.write_bytes(b"workbook")
+    return path
+
+
+@pytest.fixture
+def frame() -> pd.DataFrame:
+    return pd.DataFrame(
+        {
+            "S1 value": [1.5, np.nan, 3.0],
+            "S2 value": [1, 2, 3],
+            "Location": ["Kitchen", np.nan, "Office"],
+        }
+    )
+
+
+def test_store_and_load_round_trip(
+    tmp_path: Path, workbook: Path, frame: pd.DataFrame
+) -> None:
+    cache = SensorFileCache(tmp_path / "cache", "Location")
+    assert cache.load(workbook) is None
+
+    cache.store(workbook, frame)
+    loaded = cache.load(workbook)
+
+    pd.testing.assert_frame_equal(loaded, frame, check_dtype=False)
+    assert loaded["Location"].isna().tolist() == [False, True, False]
+    assert loaded["S2 value"].dtype == frame["S2 value"].dtype
+
+    # An edited workbook invalidates its entry.
+    workbook.write_bytes(b"edited workbook")
+    assert cache.load(workbook) is None
+
+
+def test_store_replaces_a_stale_entry_and_keeps_a_current_one(
+    tmp_path: Path, workbook: Path, frame: pd.DataFrame
+) -> None:
+    cache = SensorFileCache(tmp_path / "cache", "Location")
+    cache.store(workbook, frame.iloc[:1])
+    workbook.write_bytes(b"edited workbook")
+
+    cache.store(workbook, frame)
+    entry = cache._entry_dir(workbook)
+    inode = os.stat(entry).st_ino
+    cache.store(workbook, frame.iloc[:2])
+
+    assert os.stat(entry).st_ino == inode
+    assert len(cache.load(workbook)) == len(frame)
+    assert [p.name for p in cache.cache_dir.iterdir()] == [entry.name]
+
+
+def test_read_returns_the_data_when_caching_fails(
+    tmp_path: Path,
+    workbook: Path,
+    frame: pd.DataFrame,
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    monkeypatch.setattr(ingest.pd, "read_excel", lambda *args, **kwargs: frame)
+    cache = SensorFileCache(tmp_path / "cache", "Location")
+
+    def fail(*args: object) -> None:
+        raise OSError("No space left on device")
+
+    monkeypatch.setattr(cache, "store", fail)
+    pd.testing.assert_frame_equal(cache.read(workbook), frame)
+    assert cache.load(workbook) is None
@@ -0,0 +1,38 @@
+from __future__ import annotations
+
+import numpy as np
+import pytest
+
+from localization.retrieval import ExactIndex, retrieve_batch_contexts
+
+
+@pytest.fixture
+def index() -> ExactIndex:
+    rng = np.random.default_rng(0)
+    return ExactIndex(8).fit(rng.random((100, 4)))
+
+
+@pytest.mark.parametrize("n_queries", [2, 5])
+def test_cluster_mode_with_identical_queries(index: ExactIndex, n_queries: int) -> None:
+    # Fewer distinct queries than clusters: k-means would leave a cluster empty.
+    contexts = retrieve_batch_contexts(
+        index, np.ones((n_queries, 4)), mode="cluster", n_clusters=3, random_state=0
+    )
+
+    assert len(contexts) == 1
+    query_rows, context_indices = contexts[0]
+    np.testing.assert_array_equal(query_rows, np.arange(n_queries))
+    assert len(context_indices) == 8
+
+
+def test_cluster_mode_covers_every_query(index: ExactIndex) -> None:
+    X_queries = np.repeat(np.eye(4)[:2], 3, axis=0)
+    contexts = retrieve_batch_contexts(
+        index, X_queries, mode="cluster", n_clusters=4, random_state=0
+    )
+
+    assert len(contexts) == 2
+    np.testing.assert_array_equal(
+        np.sort(np.concatenate([rows for rows, _ in contexts])), np.arange(6)
+    )
+    assert all(len(indices) == 8 for _, indices in contexts)
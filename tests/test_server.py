@@ -0,0 +1,58 @@
+from __future__ import annotations
+
+import asyncio
+
+import numpy as np
+import pytest
+
+from localization.server import MicroBatcher
+
+
+def _run_requests(batcher: MicroBatcher, rows: list[np.ndarray]) -> list:
+    async def main() -> list:
+        try:
+            return await asyncio.gather(
+                *(batcher.submit(row) for row in rows), return_exceptions=True
+            )
+        finally:
+            await batcher.close()
+
+    return asyncio.run(main())
+
+
+def test_concurrent_requests_are_batched() -> None:
+    batch_sizes = []
+
+    def predict_batch(X: np.ndarray) -> np.ndarray:
+        batch_sizes.append(len(X))
+        return X.sum(axis=1)
+
+    batcher = MicroBatcher(predict_batch, max_batch_size=4, max_delay=1.0)
+    rows = [np.array([i, 1.0]) for i in range(10)]
+
+    results = _run_requests(batcher, rows)
+
+    assert batch_sizes == [4, 4, 2]
+    assert [prediction for prediction, _ in results] == [i + 1.0 for i in range(10)]
+    assert [size for _, size in results] == [4] * 8 + [2] * 2
+    assert batcher.stats.n_requests == 10
+    assert batcher.stats.n_batches == 3
+    assert batcher.stats.mean_batch_size == pytest.approx(10 / 3)
+
+
+def test_a_failing_batch_fails_only_its_requests() -> None:
+    def predict_batch(X: np.ndarray) -> np.ndarray:
+        if (X < 0).any():
+            raise ValueError("negative reading")
+        return X[:, 0]
+
+    batcher = MicroBatcher(predict_batch, max_batch_size=2, max_delay=1.0)
+    rows = [np.array([-1.0]), np.array([2.0]), np.array([3.0])]
+
+    results = _run_requests(batcher, rows)
+
+    assert [type(r) for r in results[:2]] == [ValueError, ValueError]
+    assert str(results[0]) == "negative reading"
+    assert results[2] == (3.0, 1)
+    assert batcher.stats.n_errors == 2
+    assert batcher.stats.n_requests == 1
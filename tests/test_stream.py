@@ -0,0 +1,53 @@
+from __future__ import annotations
+
+import numpy as np
+import pytest
+
+from localization.stream import SlidingWindowStream
+from localization.windows import sliding_window_matrix
+
+WINDOW_SIZE = 4
+N_FEATURES = 3
+
+
+@pytest.fixture
+def readings() -> np.ndarray:
+    return np.random.default_rng(0).random((20, N_FEATURES))
+
+
+def _push_all(stream: SlidingWindowStream, readings: np.ndarray) -> list:
+    outputs = []
+    for reading in readings:
+        out = stream.push(reading)
+        # The emitted window is a view that the next push overwrites.
+        outputs.append(None if out is None else (out[0].copy(), out[1]))
+    return outputs
+
+
+def test_push_matches_projected_windows(readings: np.ndarray) -> None:
+    projection = np.random.default_rng(1).random((2, WINDOW_SIZE * N_FEATURES))
+    stream = SlidingWindowStream(WINDOW_SIZE, N_FEATURES, projection)
+
+    outputs = _push_all(stream, readings)
+
+    assert outputs[: WINDOW_SIZE - 1] == [None] * (WINDOW_SIZE - 1)
+    windows = np.stack([window for window, _ in outputs[WINDOW_SIZE - 1 :]])
+    projected = np.stack([proj for _, proj in outputs[WINDOW_SIZE - 1 :]])
+    # sliding_window_matrix leaves out the last window, which has no next-step label.
+    np.testing.assert_array_equal(
+        windows[:-1], sliding_window_matrix(readings, WINDOW_SIZE)
+    )
+    np.testing.assert_allclose(projected, windows @ projection.T)
+
+
+def test_reset_starts_a_new_window(readings: np.ndarray) -> None:
+    stream = SlidingWindowStream(WINDOW_SIZE, N_FEATURES)
+    _push_all(stream, readings[:10])
+    stream.reset()
+
+    outputs = _push_all(stream, readings[10:])
+
+    assert not any(outputs[: WINDOW_SIZE - 1])
+    window, projected = outputs[WINDOW_SIZE - 1]
+    np.testing.assert_array_equal(window, readings[10 : 10 + WINDOW_SIZE].reshape(-1))
+    assert projected is None
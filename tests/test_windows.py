@@ -0,0 +1,25 @@
+from __future__ import annotations
+
+import numpy as np
+import pytest
+
+from localization.windows import gather_rows, sliding_window_matrix
+
+
+@pytest.mark.parametrize("order", ["C", "F"])
+def test_sliding_window_matrix_matches_stacked_windows(order: str) -> None:
+    X = np.asarray(np.random.default_rng(0).random((12, 3)), order=order)
+    window_size = 4
+
+    windows = sliding_window_matrix(X, window_size)
+
+    expected = np.stack(
+        [X[i : i + window_size].reshape(-1) for i in range(len(X) - window_size)]
+    )
+    np.testing.assert_array_equal(windows, expected)
+    assert not windows.flags.writeable
+
+    rows = np.array([5, 0, 7])
+    gathered = gather_rows(windows, rows)
+    assert gathered.flags.c_contiguous
+    np.testing.assert_array_equal(gathered, expected[rows])
@@ -9,8 +9,13 @@ import numpy as np
 import matplotlib.pyplot as plt
 import seaborn as sns
 import os
+import sys
 from datetime import datetime
 
+# 使用 src/localization 中共享的 (多进程) 数据加载器
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+from localization.ingest import load_sensor_data
+
 # =============================================================================
 # 配置 - 学术论文风格
 # =============================================================================
@@ -46,15 +51,10 @@ COLORS = {
 
 def load_all_data():
     """加载所有数据文件并合并"""
-    excel_files = sorted([f for f in os.listdir(DATA_DIR) if f.endswith('.xlsx')])
-    all_data = []
-    
-    for filename in excel_files:
-        filepath = os.path.join(DATA_DIR, filename)
-        df = pd.read_excel(filepath)
-        all_data.append(df)
-    
-    combined = pd.concat(all_data, ignore_index=True)
+    combined = load_sensor_data(DATA_DIR)
+    if combined is None or combined.empty:
+        print(f"[ERROR] {DATA_DIR} 中没有可读取的 .xlsx 数据文件")
+        sys.exit(1)
     combined['timestamp'] = pd.to_datetime(combined['timestamp'])
     combined['hour'] = combined['timestamp'].dt.hour
     combined['date'] = combined['timestamp'].dt.date
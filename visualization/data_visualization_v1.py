@@ -9,8 +9,12 @@ import numpy as np
 import matplotlib.pyplot as plt
 import seaborn as sns
 import os
+import sys
 from datetime import datetime
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+from localization.ingest import load_sensor_data
+
 DATA_DIR = './data'
 OUTPUT_DIR = './pics'
 
@@ -18,12 +22,10 @@ plt.style.use('seaborn-v0_8-whitegrid')
 PALETTE = ['#2C3E50', '#3498DB', '#E74C3C', '#27AE60', '#F39C12', '#9B59B6', '#1ABC9C', '#E67E22']
 
 def load_all_data():
-    excel_files = sorted([f for f in os.listdir(DATA_DIR) if f.endswith('.xlsx')])
-    all_data = []
-    for filename in excel_files:
-        df = pd.read_excel(os.path.join(DATA_DIR, filename))
-        all_data.append(df)
-    combined = pd.concat(all_data, ignore_index=True)
+    combined = load_sensor_data(DATA_DIR)
+    if combined is None or combined.empty:
+        print(f"[ERROR] No readable .xlsx files found in {DATA_DIR}")
+        sys.exit(1)
     combined['timestamp'] = pd.to_datetime(combined['timestamp'])
     return combined
 